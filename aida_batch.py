@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Bounded-memory batch builder for filled AIDA nanopublications (instances of the
+AIDA spatiotemporal template), for batches with large sets of text chunks.
+
+Records use the layout of aida_records.extract_aida_records() and are read one
+JSONL line at a time. Text chunks (the repeatable statements st13-st20) come
+either inline in each record or from a separate chunks JSONL file (one chunk
+per line with an "aida" key), which may be in any order.
+
+Memory stays flat over long runs because:
+
+- no rdflib graph is built per record: the nanopub is written as TriG straight
+  from the record, and the constant parts of the graph (graph names, head,
+  predicates, classes) are encoded once and reused for every record;
+- chunks are streamed into the output one at a time, never collected in a list
+  or graph, and a nanopub that would exceed the nanopub size limit is dropped
+  as soon as the limit is reached;
+- chunks from a separate file are held in a spool with a byte budget and spilled
+  to a temporary SQLite file beyond it, and the spool is also spilled whenever
+  the resident set size reaches the configured memory ceiling.
+
+The output is unsigned TriG (one file per record, 10,000 files per directory)
+that nanopub_pipeline.py or key_pool.py can sign.
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import resource
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from urllib.parse import quote
+
+from rdflib import Literal, URIRef
+from rdflib.namespace import DCTERMS, PROV, RDF, RDFS, XSD
+from nanopub.definitions import MAX_TRIPLES_PER_NANOPUB, NP_TEMP_PREFIX
+
+from aida_records import AIDA_PREFIX, CITATION_TYPES, CITO, DCAT, DOCO, FABIO, HYCL, NP
+
+SCHEMA_ABOUT = URIRef("http://schema.org/about")
+SKOS_RELATED = URIRef("http://www.w3.org/2004/02/skos/core#related")
+NT_CREATED_FROM_TEMPLATE = URIRef("https://w3id.org/np/o/ntemplate/wasCreatedFromTemplate")
+
+# Unsigned nanopubs use the temporary namespace of the nanopub library, which
+# signing replaces with the trusty URI
+BASE = NP_TEMP_PREFIX + "np#"
+FILES_PER_DIRECTORY = 10_000
+RSS_CHECK_EVERY = 1000
+# rough size of the list slot, tuple and str objects of a spooled chunk, besides its text
+ENTRY_OVERHEAD = 120
+
+
+def _n3(term) -> str:
+    return term.n3()
+
+
+def _decimal(value) -> Literal:
+    """
+    xsd:decimal literal in the form rdflib serializes it ("100.0", not "100" or
+    "1E2"): signing hashes the lexical form written here, and the signed TriG
+    has to read back with the same one
+    """
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"Not a decimal: {value!r}") from None
+    if not number.is_finite():
+        raise ValueError(f"Not a decimal: {value!r}")
+    text = format(number, "f")
+    return Literal(text if "." in text else text + ".0", datatype=XSD.decimal)
+
+
+# constant terms of every filled AIDA nanopub, encoded once
+N3 = {name: _n3(term) for name, term in {
+    "np": URIRef(BASE),
+    "head": URIRef(BASE + "Head"),
+    "assertion": URIRef(BASE + "assertion"),
+    "provenance": URIRef(BASE + "provenance"),
+    "pubinfo": URIRef(BASE + "pubinfo"),
+    "period": URIRef(BASE + "period"),
+    "type": RDF.type,
+    "Nanopublication": NP.Nanopublication,
+    "hasAssertion": NP.hasAssertion,
+    "hasProvenance": NP.hasProvenance,
+    "hasPublicationInfo": NP.hasPublicationInfo,
+    "AIDA-Sentence": HYCL["AIDA-Sentence"],
+    "about": SCHEMA_ABOUT,
+    "related": SKOS_RELATED,
+    "obtainsSupportFrom": CITO.obtainsSupportFrom,
+    "spatial": DCTERMS.spatial,
+    "spatialResolution": DCAT.spatialResolutionInMeters,
+    "temporal": DCTERMS.temporal,
+    "PeriodOfTime": DCTERMS.PeriodOfTime,
+    "startDate": DCAT.startDate,
+    "endDate": DCAT.endDate,
+    "temporalResolution": DCAT.temporalResolution,
+    "ScholarlyWork": FABIO.ScholarlyWork,
+    "includesQuotationFrom": CITO.includesQuotationFrom,
+    "TextChunk": DOCO.TextChunk,
+    "comment": RDFS.comment,
+    "isPartOf": DCTERMS.isPartOf,
+    "hasPageNumber": FABIO.hasPageNumber,
+    "title": DCTERMS.title,
+    "hasContent": DOCO.hasContent,
+    "extractionType": DCTERMS.type,
+    "wasAttributedTo": PROV.wasAttributedTo,
+    "generatedAtTime": PROV.generatedAtTime,
+    "wasCreatedFromTemplate": NT_CREATED_FROM_TEMPLATE,
+}.items()}
+
+HEAD = (
+    f"{N3['head']} {{\n"
+    f"{N3['np']} {N3['type']} {N3['Nanopublication']} .\n"
+    f"{N3['np']} {N3['hasAssertion']} {N3['assertion']} .\n"
+    f"{N3['np']} {N3['hasProvenance']} {N3['provenance']} .\n"
+    f"{N3['np']} {N3['hasPublicationInfo']} {N3['pubinfo']} .\n"
+    "}\n"
+)
+HEAD_TRIPLES = 4
+CITATION_TYPE_URIS = {str(ct) for ct in CITATION_TYPES}
+
+# (chunk key, predicate) of the literal text chunk statements st15 and st17-st20
+CHUNK_FIELDS = (
+    ("text", "comment"),
+    ("page", "hasPageNumber"),
+    ("section", "title"),
+    ("paragraph", "hasContent"),
+    ("extraction_type", "extractionType"),
+)
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # no procfs: fall back to the peak, in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def peak_rss() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class ChunkSpool:
+    """
+    Text chunks grouped by AIDA sentence, kept as raw JSON lines in memory up to
+    a byte budget and spilled to a temporary SQLite file beyond it
+    """
+
+    def __init__(self, memory_limit: int = 64 * 1024 * 1024, spill_dir: Path = None):
+        self.memory_limit = memory_limit
+        self.memory = {}
+        self.size = 0
+        self.spilled = 0
+        self._seq = 0
+        self._dir = tempfile.TemporaryDirectory(prefix="aida_chunks_", dir=spill_dir)
+        self.db = sqlite3.connect(Path(self._dir.name) / "chunks.db")
+        self.db.executescript("""
+            PRAGMA journal_mode=OFF;
+            PRAGMA synchronous=OFF;
+            CREATE TABLE chunks (aida TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL);
+        """)
+        self._indexed = False
+
+    def add(self, aida: str, line: str):
+        self.memory.setdefault(aida, []).append((self._seq, line))
+        self._seq += 1
+        self.size += len(line) + ENTRY_OVERHEAD
+        if self.size >= self.memory_limit:
+            self.spill()
+
+    def spill(self):
+        """Move every chunk held in memory to disk"""
+        if not self.memory:
+            return
+        with self.db:
+            self.db.executemany("INSERT INTO chunks VALUES (?, ?, ?)", (
+                (aida, seq, line) for aida, entries in self.memory.items() for seq, line in entries
+            ))
+        self.spilled += sum(len(entries) for entries in self.memory.values())
+        self.memory = {}
+        self.size = 0
+        self._indexed = False
+
+    def pop(self, aida: str):
+        """Iterator over the chunks of a sentence (as dicts) in input order; frees them from memory"""
+        entries = self.memory.pop(aida, ())
+        self.size -= sum(len(line) + ENTRY_OVERHEAD for _, line in entries)
+        return self._iter_chunks(aida, entries)
+
+    def _iter_chunks(self, aida, entries):
+        if self.spilled:
+            if not self._indexed:
+                self.db.execute("CREATE INDEX IF NOT EXISTS chunks_aida ON chunks (aida, seq)")
+                self._indexed = True
+            for (line,) in self.db.execute("SELECT data FROM chunks WHERE aida = ? ORDER BY seq", (aida,)):
+                yield json.loads(line)
+        for _, line in entries:
+            yield json.loads(line)
+
+    def close(self):
+        self.db.close()
+        self._dir.cleanup()
+
+
+class RecordTooLarge(Exception):
+    pass
+
+
+class AidaBatchWriter:
+    """Writes filled AIDA nanopubs as unsigned TriG straight from records"""
+
+    def __init__(self, output_dir: Path, author: str = None, template: str = None,
+                 max_triples: int = MAX_TRIPLES_PER_NANOPUB):
+        self.output_dir = Path(output_dir) if output_dir is not None else None
+        self.author = author
+        self.template = template
+        self.max_triples = max_triples
+
+    def path(self, position: int) -> Path:
+        return self.output_dir / f"{position // FILES_PER_DIRECTORY:05d}" / f"aida_{position:08d}.trig"
+
+    def write(self, position: int, record: dict, chunks) -> Path:
+        """Write one record with its chunks (any iterable of chunk dicts); raises RecordTooLarge"""
+        path = self.path(position)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part = path.with_suffix(".trig.part")
+        try:
+            with open(part, "w", encoding="utf-8") as f:
+                self._write(f, record, chunks)
+        except BaseException:
+            part.unlink(missing_ok=True)
+            raise
+        os.replace(part, path)
+        return path
+
+    def render(self, record: dict, chunks=None) -> str:
+        """One record as unsigned TriG (chunks default to the record's own)"""
+        f = io.StringIO()
+        self._write(f, record, record.get("chunks") or () if chunks is None else chunks)
+        return f.getvalue()
+
+    def _write(self, f, record, chunks):
+        aida = record.get("aida") or AIDA_PREFIX + quote(record["sentence"])
+        s = _n3(URIRef(aida))
+        count = HEAD_TRIPLES
+        lines = []
+
+        def emit(subject, predicate, obj):
+            nonlocal count
+            count += 1
+            if count > self.max_triples:
+                raise RecordTooLarge(f"{aida} needs more than {self.max_triples} triples")
+            lines.append(f"{subject} {predicate} {obj} .\n")
+
+        f.write(HEAD)
+        f.write(f"{N3['assertion']} {{\n")
+        emit(s, N3["type"], N3["AIDA-Sentence"])
+        for topic in record.get("topics") or ():
+            emit(s, N3["about"], _n3(URIRef(topic)))
+        if record.get("project"):
+            emit(s, N3["related"], _n3(URIRef(record["project"])))
+        if record.get("dataset"):
+            emit(s, N3["obtainsSupportFrom"], _n3(URIRef(record["dataset"])))
+        if record.get("spatial"):
+            emit(s, N3["spatial"], _n3(Literal(record["spatial"])))
+        if record.get("spatial_resolution"):
+            emit(s, N3["spatialResolution"], _n3(_decimal(record["spatial_resolution"])))
+        if record.get("temporal_start") or record.get("temporal_end"):
+            emit(s, N3["temporal"], N3["period"])
+            emit(N3["period"], N3["type"], N3["PeriodOfTime"])
+            if record.get("temporal_start"):
+                emit(N3["period"], N3["startDate"], _n3(Literal(record["temporal_start"], datatype=XSD.dateTime)))
+            if record.get("temporal_end"):
+                emit(N3["period"], N3["endDate"], _n3(Literal(record["temporal_end"], datatype=XSD.dateTime)))
+        if record.get("temporal_resolution"):
+            emit(s, N3["temporalResolution"], _n3(Literal(record["temporal_resolution"], datatype=XSD.duration)))
+        paper = _n3(URIRef(record["paper"])) if record.get("paper") else None
+        if paper:
+            emit(paper, N3["type"], N3["ScholarlyWork"])
+            citation_type = record.get("citation_type") or str(CITO.cites)
+            if citation_type not in CITATION_TYPE_URIS:
+                raise ValueError(f"Unknown citation type {citation_type}")
+            emit(s, _n3(URIRef(citation_type)), paper)
+        f.writelines(lines)
+        lines.clear()
+
+        for number, chunk in enumerate(chunks, 1):
+            c = _n3(URIRef(f"{BASE}chunk{number}"))
+            emit(s, N3["includesQuotationFrom"], c)
+            emit(c, N3["type"], N3["TextChunk"])
+            for key, predicate in CHUNK_FIELDS:
+                if chunk.get(key):
+                    emit(c, N3[predicate], _n3(Literal(chunk[key])))
+            chunk_paper = _n3(URIRef(chunk["paper"])) if chunk.get("paper") else paper
+            if chunk_paper:
+                emit(c, N3["isPartOf"], chunk_paper)
+            f.writelines(lines)
+            lines.clear()
+        f.write("}\n")
+
+        author = record.get("author") or self.author
+        now = _n3(Literal(datetime.now(timezone.utc).isoformat(), datatype=XSD.dateTime))
+        f.write(f"{N3['provenance']} {{\n")
+        if author:
+            emit(N3["assertion"], N3["wasAttributedTo"], _n3(URIRef(author)))
+        emit(N3["assertion"], N3["generatedAtTime"], now)
+        f.writelines(lines)
+        lines.clear()
+        f.write("}\n")
+
+        f.write(f"{N3['pubinfo']} {{\n")
+        emit(N3["np"], N3["generatedAtTime"], now)
+        if author:
+            emit(N3["np"], N3["wasAttributedTo"], _n3(URIRef(author)))
+        if self.template:
+            emit(N3["np"], N3["wasCreatedFromTemplate"], _n3(URIRef(self.template)))
+        f.writelines(lines)
+        f.write("}\n")
+
+
+def verify_signing(trig: str):
+    """
+    Sign an unsigned nanopub from the writer with a throwaway key and check that
+    the signed TriG still matches its trusty URI; raises RuntimeError if it does
+    not (the writer wrote a term in a form that does not round-trip), so that a
+    batch stops before writing nanopubs that cannot be published
+    """
+    from nanopub import Nanopub, Profile
+    from nanopub.utils import MalformedNanopubError
+    from rdflib import ConjunctiveGraph
+
+    from key_pool import AuthorKey, sign_as
+
+    key = AuthorKey(Profile(orcid_id="https://orcid.org/0000-0000-0000-0000", name="Signing check"))
+    _, _, signed = sign_as(trig, key)
+    g = ConjunctiveGraph()
+    g.parse(data=signed, format="trig")
+    try:
+        return Nanopub(rdf=g).has_valid_trusty
+    except MalformedNanopubError as e:
+        raise RuntimeError(f"Signed nanopubs of this batch would not verify: {e}") from e
+
+
+def iter_jsonl(path: Path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def run_batch(records_path: Path, output_dir: Path, chunks_path: Path = None, author: str = None,
+              template: str = None, memory_limit: int = 512 * 1024 * 1024, spill_dir: Path = None,
+              progress_every: int = 100_000, topics=None, verify: bool = True):
+    """
+    Build every record of a JSONL batch, return the counts and the peak RSS;
+    with a topic_autocomplete.TopicIndex as `topics`, topics given as labels or
+    Wikidata IDs are resolved to IRIs offline. Unless `verify` is false, the
+    first nanopub written is signed and verified before the batch goes on.
+    """
+    writer = AidaBatchWriter(output_dir, author=author, template=template)
+    spool = None
+    stats = {"written": 0, "too_large": 0, "failed": 0, "spilled_chunks": 0}
+    if chunks_path is not None:
+        # chunks get at most a quarter of the ceiling before they go to disk
+        spool = ChunkSpool(memory_limit // 4, spill_dir)
+        for line in iter_jsonl(chunks_path):
+            spool.add(json.loads(line)["aida"], line)
+    try:
+        for position, line in enumerate(iter_jsonl(records_path)):
+            record = json.loads(line)
+            if spool is not None:
+                aida = record.get("aida") or AIDA_PREFIX + quote(record["sentence"])
+                chunks = spool.pop(aida)
+            else:
+                chunks = record.pop("chunks", None) or ()
+            try:
+                if topics is not None and record.get("topics"):
+                    record["topics"] = [topics.resolve(topic) for topic in record["topics"]]
+                path = writer.write(position, record, chunks)
+                if verify and not stats["written"]:
+                    verify_signing(path.read_text(encoding="utf-8"))
+                stats["written"] += 1
+            except RecordTooLarge as e:
+                print(f"Skipping record {position}: {e}")
+                stats["too_large"] += 1
+            except (KeyError, ValueError) as e:
+                print(f"Error in record {position}: {e}")
+                stats["failed"] += 1
+            if position % RSS_CHECK_EVERY == 0 and current_rss() > memory_limit:
+                if spool is not None:
+                    spool.spill()
+                gc.collect()
+            if progress_every and position and position % progress_every == 0:
+                print(f"{position} records, RSS {current_rss() / 2**20:.0f} MiB")
+    finally:
+        if spool is not None:
+            stats["spilled_chunks"] = spool.spilled
+            spool.close()
+    stats["peak_rss"] = peak_rss()
+    return stats
+
+
+def main():
+    """Build unsigned filled AIDA nanopubs from a JSONL batch with bounded memory."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("records", type=Path, help="JSONL file, one AIDA record per line")
+    parser.add_argument("--chunks", type=Path, help="JSONL file of text chunks, each with the 'aida' it belongs to")
+    parser.add_argument("--output-dir", type=Path, default=Path("filled_nanopubs"))
+    parser.add_argument("--author", help="ORCID the nanopubs are attributed to (unless a record has 'author')")
+    parser.add_argument("--template", help="URI of the published AIDA template nanopub")
+    parser.add_argument("--memory-limit", type=int, default=512, help="memory ceiling in MiB")
+    parser.add_argument("--spill-dir", type=Path, help="directory for spilled chunks (default: system temp)")
+    parser.add_argument("--no-verify", action="store_true",
+                        help="do not sign and verify the first nanopub with a throwaway key")
+    parser.add_argument("--topics", type=Path,
+                        help="topic index (topic_autocomplete.py) to resolve topics given as labels without network")
+    args = parser.parse_args()
+
+    topics = None
+    if args.topics:
+        from topic_autocomplete import TopicIndex
+        topics = TopicIndex(args.topics)
+    start = time.monotonic()
+    try:
+        stats = run_batch(args.records, args.output_dir, args.chunks, args.author, args.template,
+                          args.memory_limit * 2**20, args.spill_dir, topics=topics,
+                          verify=not args.no_verify)
+    finally:
+        if topics is not None:
+            topics.close()
+    print(f"✓ Wrote {stats['written']} nanopubs to {args.output_dir} in {time.monotonic() - start:.1f}s "
+          f"(peak RSS {stats['peak_rss'] / 2**20:.0f} MiB)")
+    if stats["too_large"] or stats["failed"]:
+        print(f"{stats['too_large']} records exceeded the nanopub size limit, {stats['failed']} were invalid")
+    if stats["spilled_chunks"]:
+        print(f"{stats['spilled_chunks']} chunks were spilled to disk")
+
+
+if __name__ == "__main__":
+    main()
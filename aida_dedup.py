@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Exact and near-duplicate detection for batches of AIDA sentences, to run before
+signing so that the same claim is not signed and published twice.
+
+Sentences are normalized and hashed for exact matches, and summarized with
+MinHash signatures over character shingles for near matches. Candidate pairs
+are found with LSH banding (no pairwise comparison of the whole batch), then
+confirmed with the estimated Jaccard similarity. Published sentences are kept
+in a persistent SQLite index so new batches are also checked against them.
+
+numpy is used to vectorize the MinHash computation when it is installed.
+"""
+
+import argparse
+import hashlib
+import json
+import operator
+import random
+import re
+import sqlite3
+import sys
+import unicodedata
+import zlib
+from array import array
+from pathlib import Path
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from aida_records import iter_aida_records
+
+MERSENNE_PRIME = (1 << 31) - 1
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+BANDS = 16
+THRESHOLD = 0.8
+SEED = 1
+
+PUNCTUATION_RE = re.compile(r"[^\w\s]")
+SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_sentence(sentence: str) -> str:
+    """Case-fold, strip punctuation and collapse whitespace"""
+    text = unicodedata.normalize("NFKC", sentence).casefold()
+    text = PUNCTUATION_RE.sub(" ", text)
+    return SPACES_RE.sub(" ", text).strip()
+
+
+def sentence_hash(normalized: str) -> bytes:
+    """Hash of a normalized sentence, used for exact duplicate detection"""
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+
+def shingles(normalized: str, size: int = SHINGLE_SIZE):
+    """Hashed character shingles of a normalized sentence"""
+    data = normalized.encode("utf-8")
+    if len(data) <= size:
+        return {zlib.crc32(data) % MERSENNE_PRIME}
+    return {zlib.crc32(data[i:i + size]) % MERSENNE_PRIME for i in range(len(data) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures using universal hashing (a * x + b) mod p"""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = SEED):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.a = [rng.randrange(1, MERSENNE_PRIME) for _ in range(num_perm)]
+        self.b = [rng.randrange(0, MERSENNE_PRIME) for _ in range(num_perm)]
+        if numpy is not None:
+            self._a = numpy.array(self.a, dtype=numpy.uint64)[:, None]
+            self._b = numpy.array(self.b, dtype=numpy.uint64)[:, None]
+
+    def signature(self, hashed_shingles) -> array:
+        if numpy is not None:
+            values = numpy.fromiter(hashed_shingles, dtype=numpy.uint64)
+            mins = ((self._a * values + self._b) % MERSENNE_PRIME).min(axis=1)
+            return array("I", mins.astype(numpy.uint32).tobytes())
+        values = list(hashed_shingles)
+        return array("I", (
+            min((a * x + b) % MERSENNE_PRIME for x in values)
+            for a, b in zip(self.a, self.b)
+        ))
+
+
+def similarity(sig1: array, sig2: array) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures"""
+    return sum(map(operator.eq, sig1, sig2)) / len(sig1)
+
+
+def band_keys(signature: array, bands: int = BANDS):
+    """One 64-bit bucket key per LSH band of a signature"""
+    rows = len(signature) // bands
+    data = signature.tobytes()
+    width = rows * signature.itemsize
+    return [
+        int.from_bytes(hashlib.blake2b(data[i * width:(i + 1) * width], digest_size=8).digest(), "big", signed=True)
+        for i in range(bands)
+    ]
+
+
+class AidaDeduplicator:
+    """
+    Flags exact and near-duplicate AIDA sentences within a batch and against a
+    persistent index of already published sentences (optional).
+    """
+
+    def __init__(self, index_path: Path = None, threshold: float = THRESHOLD,
+                 num_perm: int = NUM_PERM, bands: int = BANDS):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.bands = bands
+        self.hasher = MinHasher(num_perm)
+        self.db = None
+        if index_path is not None:
+            self.db = sqlite3.connect(index_path)
+            self.db.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS sentences (
+                    id INTEGER PRIMARY KEY,
+                    hash BLOB NOT NULL UNIQUE,
+                    aida TEXT NOT NULL,
+                    nanopub TEXT,
+                    signature BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, bucket INTEGER NOT NULL, sentence INTEGER NOT NULL);
+                CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+                CREATE TABLE IF NOT EXISTS settings (num_perm INTEGER, bands INTEGER);
+            """)
+            settings = self.db.execute("SELECT num_perm, bands FROM settings").fetchone()
+            if settings is None:
+                with self.db:
+                    self.db.execute("INSERT INTO settings VALUES (?, ?)", (num_perm, bands))
+            elif settings != (num_perm, bands):
+                raise ValueError(f"Index {index_path} was built with num_perm={settings[0]}, bands={settings[1]}")
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fingerprint(self, sentence: str):
+        """(exact hash, MinHash signature) of a sentence"""
+        normalized = normalize_sentence(sentence)
+        return sentence_hash(normalized), self.hasher.signature(shingles(normalized))
+
+    def add_published(self, records):
+        """Add published AIDA records (with 'aida' and 'sentence') to the persistent index"""
+        if self.db is None:
+            raise ValueError("No persistent index configured")
+        added = 0
+        with self.db:
+            for record in records:
+                digest, signature = self.fingerprint(record["sentence"])
+                cursor = self.db.execute(
+                    "INSERT OR IGNORE INTO sentences (hash, aida, nanopub, signature) VALUES (?, ?, ?, ?)",
+                    (digest, record["aida"], record.get("nanopub"), signature.tobytes()),
+                )
+                if cursor.rowcount:
+                    self.db.executemany(
+                        "INSERT INTO bands (band, bucket, sentence) VALUES (?, ?, ?)",
+                        [(band, key, cursor.lastrowid) for band, key in enumerate(band_keys(signature, self.bands))],
+                    )
+                    added += 1
+        return added
+
+    def _published_match(self, digest, signature, keys):
+        """Best published match of a sentence as (status, aida, similarity), or None"""
+        row = self.db.execute("SELECT aida FROM sentences WHERE hash = ?", (digest,)).fetchone()
+        if row:
+            return "exact", row[0], 1.0
+        best = (None, 0.0)
+        seen = set()
+        for band, key in enumerate(keys):
+            for sentence_id, aida, other in self.db.execute(
+                "SELECT s.id, s.aida, s.signature FROM bands b JOIN sentences s ON s.id = b.sentence "
+                "WHERE b.band = ? AND b.bucket = ?", (band, key)
+            ):
+                if sentence_id in seen:
+                    continue
+                seen.add(sentence_id)
+                score = similarity(signature, array("I", other))
+                if score >= self.threshold and score > best[1]:
+                    best = (aida, score)
+        return None if best[0] is None else ("near", *best)
+
+    def check(self, records):
+        """
+        Classify each record (a dict with at least 'sentence') of a batch. Returns a
+        list of dicts with 'status' ('unique', 'exact' or 'near'), 'duplicate_of'
+        (batch position or published AIDA URI) and 'similarity'.
+        """
+        records = list(records)
+        results = []
+        exact = {}
+        buckets = {}
+        if numpy is not None:
+            matrix = numpy.zeros((len(records), self.hasher.num_perm), dtype=numpy.uint32)
+        else:
+            matrix = [None] * len(records)
+        for position, record in enumerate(records):
+            normalized = normalize_sentence(record["sentence"])
+            digest = sentence_hash(normalized)
+            if digest in exact:
+                results.append({"status": "exact", "duplicate_of": exact[digest], "similarity": 1.0})
+                continue
+            signature = self.hasher.signature(shingles(normalized))
+            keys = band_keys(signature, self.bands)
+            result = {"status": "unique", "duplicate_of": None, "similarity": None}
+
+            if self.db is not None:
+                match = self._published_match(digest, signature, keys)
+                if match is not None:
+                    status, aida, score = match
+                    result = {"status": status, "duplicate_of": aida, "similarity": score}
+
+            if result["status"] == "unique":
+                candidates = set()
+                for band, key in enumerate(keys):
+                    candidates.update(buckets.get((band, key), ()))
+                if candidates:
+                    other, score = self._best_candidate(signature, sorted(candidates), matrix)
+                    if score >= self.threshold:
+                        result = {"status": "near", "duplicate_of": other, "similarity": score}
+
+            # only unique sentences represent their buckets, so duplicates point at the first occurrence
+            if result["status"] == "unique":
+                exact[digest] = position
+                matrix[position] = signature
+                for band, key in enumerate(keys):
+                    buckets.setdefault((band, key), []).append(position)
+            results.append(result)
+        return results
+
+    def _best_candidate(self, signature, candidates, matrix):
+        """Most similar of the candidate batch positions as (position, similarity)"""
+        if numpy is not None:
+            scores = (matrix[candidates] == numpy.frombuffer(signature, dtype=numpy.uint32)).mean(axis=1)
+            best = int(scores.argmax())
+            return candidates[best], float(scores[best])
+        return max(((other, similarity(signature, matrix[other])) for other in candidates), key=lambda c: c[1])
+
+    def dedup(self, records, merge: bool = False):
+        """
+        Drop duplicates from a batch. With `merge`, text chunks and topics of
+        in-batch duplicates are added to the record they duplicate. Returns
+        (kept records, duplicate reports).
+        """
+        records = list(records)
+        kept = []
+        duplicates = []
+        for position, (record, result) in enumerate(zip(records, self.check(records))):
+            if result["status"] == "unique":
+                kept.append(record)
+                continue
+            duplicates.append({"position": position, "sentence": record["sentence"], **result})
+            target = result["duplicate_of"]
+            if merge and isinstance(target, int):
+                original = records[target]
+                for key in ("chunks", "topics"):
+                    for item in record.get(key) or []:
+                        if item not in original.setdefault(key, []):
+                            original[key].append(item)
+        return kept, duplicates
+
+
+def main():
+    """Check a JSONL batch of AIDA records for duplicates, or index published nanopubs."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--index", type=Path, help="persistent SQLite index of published sentences")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="near-duplicate Jaccard threshold")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    check = sub.add_parser("check", help="deduplicate a JSONL batch (one record with 'sentence' per line)")
+    check.add_argument("batch", type=Path)
+    check.add_argument("--output", type=Path, help="write the kept records to this JSONL file")
+    check.add_argument("--merge", action="store_true", help="merge chunks/topics of in-batch duplicates")
+
+    add = sub.add_parser("add-published", help="add published AIDA nanopub files to the index")
+    add.add_argument("paths", nargs="+", type=Path, help=".trig/.nq files or directories")
+
+    args = parser.parse_args()
+
+    with AidaDeduplicator(args.index, threshold=args.threshold) as dedup:
+        if args.command == "add-published":
+            if args.index is None:
+                parser.error("add-published requires --index")
+            added = sum(dedup.add_published(records) for _, records in iter_aida_records(args.paths))
+            print(f"✓ Added {added} sentences to {args.index}")
+            return
+
+        with open(args.batch) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        kept, duplicates = dedup.dedup(records, merge=args.merge)
+        for duplicate in duplicates:
+            print(f"{duplicate['status']}\t{duplicate['similarity']:.2f}\t{duplicate['position']}\t"
+                  f"{duplicate['duplicate_of']}\t{duplicate['sentence']}", file=sys.stderr)
+        if args.output:
+            with open(args.output, "w") as f:
+                for record in kept:
+                    f.write(json.dumps(record) + "\n")
+        print(f"✓ {len(kept)} unique, {len(duplicates)} duplicates out of {len(records)} sentences")
+
+
+if __name__ == "__main__":
+    main()
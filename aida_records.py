@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Read filled AIDA nanopublications (instances of the AIDA spatiotemporal template)
+back from TriG/N-Quads files into plain Python records.
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from urllib.parse import unquote
+
+from rdflib import Dataset, Namespace, URIRef
+from rdflib.namespace import RDF, RDFS, DCTERMS
+
+# namespaces used by the AIDA spatiotemporal template
+NP = Namespace("http://www.nanopub.org/nschema#")
+HYCL = Namespace("http://purl.org/petapico/o/hycl#")
+CITO = Namespace("http://purl.org/spar/cito/")
+FABIO = Namespace("http://purl.org/spar/fabio/")
+DOCO = Namespace("http://purl.org/spar/doco/")
+DCAT = Namespace("http://www.w3.org/ns/dcat#")
+
+# AIDA sentences are minted as URIs under this prefix (see the `aida` placeholder)
+AIDA_PREFIX = "http://purl.org/aida/"
+
+# Citation relationships offered by the `citationType` placeholder
+CITATION_TYPES = [
+    CITO.cites, CITO.citesAsSourceDocument, CITO.obtainsSupportFrom,
+    CITO.usesDataFrom, CITO.usesMethodIn, CITO.extends,
+    CITO.confirms, CITO.supports
+]
+
+NANOPUB_SUFFIXES = (".trig", ".nq")
+
+
+def sentence_from_uri(uri: str) -> str:
+    """Recover the sentence text from an AIDA sentence URI"""
+    if uri.startswith(AIDA_PREFIX):
+        uri = uri[len(AIDA_PREFIX):]
+    return unquote(uri)
+
+
+def iter_nanopub_files(paths):
+    """Yield nanopub files from a list of files and/or directories"""
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            for suffix in NANOPUB_SUFFIXES:
+                yield from sorted(path.rglob(f"*{suffix}"))
+        else:
+            yield path
+
+
+def load_nanopub_dataset(path: Path) -> Dataset:
+    """Parse a nanopub file (TriG or N-Quads) into an rdflib Dataset"""
+    ds = Dataset(default_union=True)
+    fmt = "nquads" if Path(path).suffix == ".nq" else "trig"
+    ds.parse(path, format=fmt)
+    return ds
+
+
+def _literal(graph, subject, predicate):
+    value = graph.value(subject, predicate)
+    return None if value is None else str(value)
+
+
+def extract_aida_records(ds: Dataset):
+    """
+    Extract one record per AIDA sentence found in the assertion graph(s)
+    of the nanopublication(s) contained in the dataset.
+    """
+    records = []
+    for np_uri, _, assertion_id in ds.triples((None, NP.hasAssertion, None)):
+        assertion = ds.graph(assertion_id)
+        for aida in assertion.subjects(RDF.type, HYCL["AIDA-Sentence"]):
+            if not isinstance(aida, URIRef):
+                continue
+            record = {
+                "nanopub": str(np_uri),
+                "aida": str(aida),
+                "sentence": sentence_from_uri(str(aida)),
+                "topics": [str(t) for t in assertion.objects(aida, URIRef("http://schema.org/about"))],
+                "spatial": _literal(assertion, aida, DCTERMS.spatial),
+                "spatial_resolution": _literal(assertion, aida, DCAT.spatialResolutionInMeters),
+                "temporal_start": None,
+                "temporal_end": None,
+                "temporal_resolution": _literal(assertion, aida, DCAT.temporalResolution),
+                "paper": None,
+                "citation_type": None,
+                "chunks": [],
+            }
+
+            period = assertion.value(aida, DCTERMS.temporal)
+            if period is not None:
+                record["temporal_start"] = _literal(assertion, period, DCAT.startDate)
+                record["temporal_end"] = _literal(assertion, period, DCAT.endDate)
+
+            for citation_type in CITATION_TYPES:
+                paper = assertion.value(aida, citation_type)
+                if paper is not None:
+                    record["paper"] = str(paper)
+                    record["citation_type"] = str(citation_type)
+                    break
+
+            for chunk in assertion.objects(aida, CITO.includesQuotationFrom):
+                record["chunks"].append({
+                    "chunk": str(chunk),
+                    "text": _literal(assertion, chunk, RDFS.comment),
+                    "paper": _literal(assertion, chunk, DCTERMS.isPartOf),
+                    "page": _literal(assertion, chunk, FABIO.hasPageNumber),
+                    "section": _literal(assertion, chunk, DCTERMS.title),
+                    "paragraph": _literal(assertion, chunk, DOCO.hasContent),
+                    "extraction_type": _literal(assertion, chunk, DCTERMS.type),
+                })
+                if record["paper"] is None:
+                    record["paper"] = record["chunks"][-1]["paper"]
+
+            records.append(record)
+    return records
+
+
+def iter_aida_records(paths):
+    """Yield (file, records) for every nanopub file under the given paths"""
+    for path in iter_nanopub_files(paths):
+        yield path, extract_aida_records(load_nanopub_dataset(path))
+
+
+class NanopubFileIndex:
+    """
+    Base of the SQLite indexes built from nanopub files. Besides the subclass's
+    SCHEMA it keeps a `files` table of every indexed file and its modification
+    time, so that add_files() only re-indexes files that changed. Subclasses
+    implement add_records(file, records), which replaces the entries of one file
+    and may return a dict of counts; counts named in FILE_COUNTS are also stored
+    in the file's row.
+    """
+
+    SCHEMA = ""
+    FILE_COUNTS = ()
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        # add_file() may be called from the store threads of nanopub_pipeline.py
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.lock = threading.RLock()
+        counts = "".join(f", {name} INTEGER NOT NULL" for name in self.FILE_COUNTS)
+        self.db.executescript(f"""
+            PRAGMA journal_mode=WAL;
+            {self.SCHEMA}
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL NOT NULL{counts});
+        """)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def records(self, ds: Dataset):
+        """Records of a parsed file, passed to add_records()"""
+        return extract_aida_records(ds)
+
+    def add_records(self, file: str, records):
+        raise NotImplementedError
+
+    def _add(self, file: str, mtime: float, records) -> dict:
+        with self.lock, self.db:
+            counts = self.add_records(file, records) or {}
+            columns = "".join(f", {name}" for name in self.FILE_COUNTS)
+            self.db.execute(f"INSERT OR REPLACE INTO files (path, mtime{columns}) "
+                            f"VALUES (?, ?{', ?' * len(self.FILE_COUNTS)})",
+                            (file, mtime, *(counts.get(name, 0) for name in self.FILE_COUNTS)))
+        return counts
+
+    def add_file(self, path: Path) -> dict:
+        """(Re-)index one nanopub file, return the counts of add_records()"""
+        path = Path(path)
+        return self._add(str(path.resolve()), path.stat().st_mtime, self.records(load_nanopub_dataset(path)))
+
+    def add_nanopub(self, trig: str, file: str, mtime: float = 0.0) -> dict:
+        """
+        Index a nanopub given as TriG under the name of the file it is stored in
+        (nanopub_pipeline.py does this for every nanopub it stores), replacing
+        what was indexed under that name; return the counts of add_records()
+        """
+        ds = Dataset(default_union=True)
+        ds.parse(data=trig, format="trig")
+        return self._add(file, mtime, self.records(ds))
+
+    def add_files(self, paths, force: bool = False) -> dict:
+        """
+        Index every nanopub file under the given paths, skipping files unchanged
+        since they were last indexed. Return the number of indexed and skipped
+        files, the summed counts of add_records(), and the (path, message) errors
+        of the files that could not be indexed.
+        """
+        stats = {"indexed": 0, "skipped": 0}
+        errors = []
+        for path in iter_nanopub_files(paths):
+            with self.lock:
+                row = self.db.execute("SELECT mtime FROM files WHERE path = ?",
+                                      (str(Path(path).resolve()),)).fetchone()
+            if row and row[0] == Path(path).stat().st_mtime and not force:
+                stats["skipped"] += 1
+                continue
+            try:
+                counts = self.add_file(path)
+            except Exception as e:
+                errors.append((str(path), f"{type(e).__name__}: {e}"))
+                continue
+            stats["indexed"] += 1
+            for name, count in counts.items():
+                stats[name] = stats.get(name, 0) + count
+        stats["errors"] = errors
+        return stats
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+On-disk spatial index over the spatial coverage (dcterms:spatial) of filled AIDA
+nanopublications, to answer "AIDA sentences intersecting this region" queries
+without re-parsing every .trig file.
+
+Spatial coverage is free text in the AIDA template (WKT geometry, place name or
+bounding box). WKT geometries and bounding boxes are reduced to their bounding
+box and stored in an SQLite R*Tree; place names are counted but not indexed.
+"""
+
+import argparse
+import re
+from pathlib import Path
+
+from aida_records import NanopubFileIndex
+
+NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+NUMBER_RE = re.compile(NUMBER)
+# Optional "SRID=4326;" or "<http://www.opengis.net/def/crs/...>" prefix of a WKT literal
+CRS_PREFIX_RE = re.compile(r"^\s*(?:SRID=\d+\s*;|<[^>]*>)\s*")
+WKT_RE = re.compile(
+    r"^(POINT|LINESTRING|POLYGON|MULTIPOINT|MULTILINESTRING|MULTIPOLYGON|GEOMETRYCOLLECTION|TRIANGLE|TIN|POLYHEDRALSURFACE)"
+    r"\s*(ZM|Z|M)?\s*\(",
+    re.IGNORECASE,
+)
+ENVELOPE_RE = re.compile(r"^ENVELOPE\s*\(([^)]*)\)$", re.IGNORECASE)
+BBOX_RE = re.compile(
+    rf"^(?:BBOX\s*\(?)?\s*\[?\s*({NUMBER})\s*[, ]\s*({NUMBER})\s*[, ]\s*({NUMBER})\s*[, ]\s*({NUMBER})\s*\]?\s*\)?$",
+    re.IGNORECASE,
+)
+COORD_DIMS = {"Z": 3, "M": 3, "ZM": 4}
+
+
+def parse_bbox(value: str):
+    """
+    Reduce a spatial coverage value to a (min_x, min_y, max_x, max_y) bounding box.
+
+    Accepts WKT geometries (optionally prefixed with a CRS IRI or SRID), CQL
+    ENVELOPE(west, east, north, south) and plain "west,south,east,north" boxes.
+    Returns None for values that are not geometries (e.g. place names).
+    """
+    if not value:
+        return None
+    text = CRS_PREFIX_RE.sub("", value.strip())
+
+    match = ENVELOPE_RE.match(text)
+    if match:
+        numbers = [float(n) for n in NUMBER_RE.findall(match.group(1))]
+        if len(numbers) != 4:
+            return None
+        west, east, north, south = numbers
+        return (min(west, east), min(south, north), max(west, east), max(south, north))
+
+    match = BBOX_RE.match(text)
+    if match:
+        west, south, east, north = (float(n) for n in match.groups())
+        return (min(west, east), min(south, north), max(west, east), max(south, north))
+
+    match = WKT_RE.match(text)
+    if match:
+        dims = COORD_DIMS.get((match.group(2) or "").upper())
+        xs, ys = [], []
+        # Coordinates are separated by commas, ordinates by whitespace
+        for coordinate in re.split(r"[,()]", text[match.end() - 1:]):
+            ordinates = NUMBER_RE.findall(coordinate)
+            if len(ordinates) < 2 or (dims and len(ordinates) != dims):
+                continue
+            xs.append(float(ordinates[0]))
+            ys.append(float(ordinates[1]))
+        if not xs:
+            return None
+        return (min(xs), min(ys), max(xs), max(ys))
+
+    return None
+
+
+class AidaSpatialIndex(NanopubFileIndex):
+    """SQLite R*Tree index of AIDA sentence bounding boxes"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS claims (
+            id INTEGER PRIMARY KEY,
+            file TEXT NOT NULL,
+            nanopub TEXT NOT NULL,
+            aida TEXT NOT NULL,
+            spatial TEXT NOT NULL,
+            resolution REAL,
+            min_x REAL, min_y REAL, max_x REAL, max_y REAL,
+            UNIQUE (nanopub, aida)
+        );
+        CREATE INDEX IF NOT EXISTS claims_file ON claims (file);
+        CREATE VIRTUAL TABLE IF NOT EXISTS claims_rtree USING rtree (id, min_x, max_x, min_y, max_y);
+    """
+    FILE_COUNTS = ("unparsed",)
+
+    def _remove_file(self, file: str):
+        self.db.execute("DELETE FROM claims_rtree WHERE id IN (SELECT id FROM claims WHERE file = ?)", (file,))
+        self.db.execute("DELETE FROM claims WHERE file = ?", (file,))
+
+    def add_records(self, file: str, records):
+        """Index the AIDA records extracted from one file, replacing any previous entries for it"""
+        self._remove_file(file)
+        unparsed = 0
+        for record in records:
+            bbox = parse_bbox(record["spatial"])
+            if bbox is None:
+                unparsed += record["spatial"] is not None
+                continue
+            resolution = record["spatial_resolution"]
+            # the same sentence may have been indexed from another file before
+            self.db.execute("DELETE FROM claims_rtree WHERE id IN (SELECT id FROM claims WHERE nanopub = ? AND aida = ?)",
+                            (record["nanopub"], record["aida"]))
+            cursor = self.db.execute(
+                "INSERT OR REPLACE INTO claims (file, nanopub, aida, spatial, resolution, min_x, min_y, max_x, max_y) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (file, record["nanopub"], record["aida"], record["spatial"],
+                 float(resolution) if resolution is not None else None, *bbox),
+            )
+            min_x, min_y, max_x, max_y = bbox
+            self.db.execute(
+                "INSERT OR REPLACE INTO claims_rtree (id, min_x, max_x, min_y, max_y) VALUES (?, ?, ?, ?, ?)",
+                (cursor.lastrowid, min_x, max_x, min_y, max_y),
+            )
+        return {"unparsed": unparsed}
+
+    def query(self, bbox, min_resolution=None, max_resolution=None, limit=None):
+        """
+        Return the AIDA sentences whose spatial coverage intersects the bounding box
+        (min_x, min_y, max_x, max_y), optionally restricted to a spatial resolution
+        range in meters (max_resolution=1000 means "1 km or finer").
+        """
+        min_x, min_y, max_x, max_y = bbox
+        sql = (
+            "SELECT c.nanopub, c.aida, c.spatial, c.resolution FROM claims_rtree r JOIN claims c ON c.id = r.id "
+            "WHERE r.max_x >= ? AND r.min_x <= ? AND r.max_y >= ? AND r.min_y <= ? "
+            # the R*Tree stores 32-bit floats, so re-check against the exact box
+            "AND c.max_x >= ? AND c.min_x <= ? AND c.max_y >= ? AND c.min_y <= ?"
+        )
+        params = [min_x, max_x, min_y, max_y, min_x, max_x, min_y, max_y]
+        if min_resolution is not None:
+            sql += " AND c.resolution >= ?"
+            params.append(min_resolution)
+        if max_resolution is not None:
+            sql += " AND c.resolution <= ?"
+            params.append(max_resolution)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [
+            {"nanopub": np_uri, "aida": aida, "spatial": spatial, "resolution": resolution}
+            for np_uri, aida, spatial, resolution in self.db.execute(sql, params)
+        ]
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM claims").fetchone()[0]
+
+
+def main():
+    """Build or query the AIDA spatial index from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("index", type=Path, help="SQLite index file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="index (or re-index) filled AIDA nanopub files")
+    build.add_argument("paths", nargs="+", type=Path, help=".trig/.nq files or directories")
+    build.add_argument("--force", action="store_true", help="re-index unchanged files")
+
+    query = sub.add_parser("query", help="find AIDA sentences intersecting a bounding box")
+    query.add_argument("bbox", help="west,south,east,north or a WKT geometry")
+    query.add_argument("--min-resolution", type=float, help="minimum spatial resolution in meters")
+    query.add_argument("--max-resolution", type=float, help="maximum spatial resolution in meters")
+    query.add_argument("--limit", type=int)
+
+    args = parser.parse_args()
+
+    with AidaSpatialIndex(args.index) as index:
+        if args.command == "build":
+            stats = index.add_files(args.paths, force=args.force)
+            for path, error in stats["errors"]:
+                print(f"✗ {path}: {error}")
+            print(f"✓ Indexed {stats['indexed']} files ({stats['skipped']} unchanged, "
+                  f"{stats.get('unparsed', 0)} place names not indexed), {len(index)} sentences in {args.index}")
+        else:
+            bbox = parse_bbox(args.bbox)
+            if bbox is None:
+                parser.error(f"Cannot parse bounding box: {args.bbox}")
+            for hit in index.query(bbox, args.min_resolution, args.max_resolution, args.limit):
+                print(f"{hit['aida']}\t{hit['spatial']}\t{hit['resolution']}\t{hit['nanopub']}")
+
+
+if __name__ == "__main__":
+    main()
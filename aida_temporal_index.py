@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+On-disk interval index over the temporal coverage (dcterms:PeriodOfTime with
+dcat:startDate / dcat:endDate) of filled AIDA nanopublications, to answer overlap
+and containment queries such as "claims valid during 2010-2015 at monthly
+resolution or finer".
+
+Periods are stored as one-dimensional boxes (epoch seconds) in an SQLite R*Tree,
+so lookups are logarithmic in the number of indexed sentences. Temporal
+resolutions (xsd:duration) are stored as approximate seconds.
+"""
+
+import argparse
+import re
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from aida_records import NanopubFileIndex
+
+# Open-ended periods (only a start or only an end date) extend to these bounds
+MIN_TIME = -1e18
+MAX_TIME = 1e18
+
+DURATION_RE = re.compile(
+    r"^(-)?P(?:(\d+(?:\.\d+)?)Y)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)W)?(?:(\d+(?:\.\d+)?)D)?"
+    r"(?:T(?:(\d+(?:\.\d+)?)H)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)S)?)?$"
+)
+# Seconds per duration component (years and months use their average length)
+DURATION_UNITS = [365.2425 * 86400, 30.436875 * 86400, 7 * 86400, 86400, 3600, 60, 1]
+
+MODES = ("overlaps", "within", "contains")
+
+
+def parse_datetime(value: str, end: bool = False):
+    """Parse an xsd:dateTime or xsd:date literal into epoch seconds (UTC if no offset is given).
+    With end=True a date without a time ends at the following midnight, which (unlike the
+    last microsecond of the day) the R*Tree's 32-bit float coordinates represent exactly."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end and "T" not in value:
+        parsed += timedelta(days=1)
+    return parsed.timestamp()
+
+
+def parse_duration(value: str):
+    """Parse an xsd:duration literal (e.g. P1D, P1M, PT6H) into approximate seconds"""
+    if not value:
+        return None
+    match = DURATION_RE.match(value.strip())
+    if not match or value.strip() in ("P", "-P") or value.strip().endswith("T"):
+        return None
+    seconds = sum(float(n) * unit for n, unit in zip(match.groups()[1:], DURATION_UNITS) if n)
+    return -seconds if match.group(1) else seconds
+
+
+class AidaTemporalIndex(NanopubFileIndex):
+    """SQLite R*Tree index of AIDA sentence temporal coverage"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS periods (
+            id INTEGER PRIMARY KEY,
+            file TEXT NOT NULL,
+            nanopub TEXT NOT NULL,
+            aida TEXT NOT NULL,
+            start_date TEXT,
+            end_date TEXT,
+            resolution TEXT,
+            start_time REAL NOT NULL,
+            end_time REAL NOT NULL,
+            resolution_seconds REAL,
+            UNIQUE (nanopub, aida)
+        );
+        CREATE INDEX IF NOT EXISTS periods_file ON periods (file);
+        CREATE VIRTUAL TABLE IF NOT EXISTS periods_rtree USING rtree (id, start_time, end_time);
+    """
+
+    def _remove_file(self, file: str):
+        self.db.execute("DELETE FROM periods_rtree WHERE id IN (SELECT id FROM periods WHERE file = ?)", (file,))
+        self.db.execute("DELETE FROM periods WHERE file = ?", (file,))
+
+    def add_records(self, file: str, records):
+        """Index the AIDA records extracted from one file, replacing any previous entries for it"""
+        self._remove_file(file)
+        added = 0
+        for record in records:
+            start = parse_datetime(record["temporal_start"])
+            end = parse_datetime(record["temporal_end"], end=True)
+            if start is None and end is None:
+                continue
+            start = MIN_TIME if start is None else start
+            end = MAX_TIME if end is None else end
+            if end < start:
+                start, end = end, start
+            self.db.execute("DELETE FROM periods_rtree WHERE id IN (SELECT id FROM periods WHERE nanopub = ? AND aida = ?)",
+                            (record["nanopub"], record["aida"]))
+            cursor = self.db.execute(
+                "INSERT OR REPLACE INTO periods (file, nanopub, aida, start_date, end_date, resolution, "
+                "start_time, end_time, resolution_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (file, record["nanopub"], record["aida"], record["temporal_start"], record["temporal_end"],
+                 record["temporal_resolution"], start, end, parse_duration(record["temporal_resolution"])),
+            )
+            self.db.execute("INSERT OR REPLACE INTO periods_rtree (id, start_time, end_time) VALUES (?, ?, ?)",
+                            (cursor.lastrowid, start, end))
+            added += 1
+        return {"periods": added}
+
+    def query(self, start=None, end=None, mode: str = "overlaps", max_resolution=None, limit=None):
+        """
+        Return the AIDA sentences whose temporal coverage overlaps, lies within or
+        contains the period [start, end] (epoch seconds, None for unbounded).
+        `max_resolution` (seconds) keeps only sentences with that resolution or finer.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown query mode {mode!r}, expected one of {MODES}")
+        start = MIN_TIME if start is None else start
+        end = MAX_TIME if end is None else end
+        if mode == "overlaps":
+            where = "r.end_time >= ? AND r.start_time <= ? AND p.end_time >= ? AND p.start_time <= ?"
+        elif mode == "within":
+            where = "r.start_time >= ? AND r.end_time <= ? AND p.start_time >= ? AND p.end_time <= ?"
+        else:
+            where = "r.start_time <= ? AND r.end_time >= ? AND p.start_time <= ? AND p.end_time >= ?"
+        sql = (
+            "SELECT p.nanopub, p.aida, p.start_date, p.end_date, p.resolution "
+            f"FROM periods_rtree r JOIN periods p ON p.id = r.id WHERE {where}"
+        )
+        params = [start, end, start, end]
+        if max_resolution is not None:
+            sql += " AND p.resolution_seconds <= ?"
+            params.append(max_resolution)
+        sql += " ORDER BY p.start_time"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [
+            {"nanopub": np_uri, "aida": aida, "start": start_date, "end": end_date, "resolution": resolution}
+            for np_uri, aida, start_date, end_date, resolution in self.db.execute(sql, params)
+        ]
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM periods").fetchone()[0]
+
+
+def main():
+    """Build or query the AIDA temporal index from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("index", type=Path, help="SQLite index file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="index (or re-index) filled AIDA nanopub files")
+    build.add_argument("paths", nargs="+", type=Path, help=".trig/.nq files or directories")
+    build.add_argument("--force", action="store_true", help="re-index unchanged files")
+
+    query = sub.add_parser("query", help="find AIDA sentences by temporal coverage")
+    query.add_argument("--start", help="period start (ISO 8601)")
+    query.add_argument("--end", help="period end (ISO 8601)")
+    query.add_argument("--mode", choices=MODES, default="overlaps")
+    query.add_argument("--max-resolution", help="coarsest accepted resolution (ISO 8601 duration, e.g. P1M)")
+    query.add_argument("--limit", type=int)
+
+    args = parser.parse_args()
+
+    with AidaTemporalIndex(args.index) as index:
+        if args.command == "build":
+            stats = index.add_files(args.paths, force=args.force)
+            for path, error in stats["errors"]:
+                print(f"✗ {path}: {error}")
+            print(f"✓ Indexed {stats['indexed']} files ({stats['skipped']} unchanged), "
+                  f"{len(index)} sentences in {args.index}")
+        else:
+            max_resolution = None
+            if args.max_resolution:
+                max_resolution = parse_duration(args.max_resolution)
+                if max_resolution is None:
+                    parser.error(f"Cannot parse duration: {args.max_resolution}")
+            bounds = {}
+            for name in ("start", "end"):
+                value = getattr(args, name)
+                bounds[name] = parse_datetime(value, end=name == "end")
+                if value and bounds[name] is None:
+                    parser.error(f"Cannot parse date: {value}")
+            hits = index.query(bounds["start"], bounds["end"], args.mode, max_resolution, args.limit)
+            for hit in hits:
+                print(f"{hit['aida']}\t{hit['start']}\t{hit['end']}\t{hit['resolution']}\t{hit['nanopub']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Local full-text index over AIDA sentences and the text chunks (doco:TextChunk)
+quoted from their source papers, with BM25 ranking and phrase queries.
+
+The index is an SQLite FTS5 table (tokenizer, posting lists and BM25 ranking
+are provided by FTS5), so no external search service is needed. Chunk metadata
+(section title, extraction type, page, paragraph) is kept in a regular table
+and used to filter results.
+"""
+
+import argparse
+import re
+from pathlib import Path
+
+from aida_records import NanopubFileIndex
+
+# "quoted phrases" or single words of a free-text query
+QUERY_TERM_RE = re.compile(r'"([^"]+)"|(\S+)')
+KINDS = ("sentence", "chunk")
+
+
+def build_match_query(text: str) -> str:
+    """
+    Turn a free-text query into an FTS5 MATCH expression: every word and
+    "quoted phrase" must occur; phrases must occur in that order.
+    """
+    terms = []
+    for phrase, word in QUERY_TERM_RE.findall(text):
+        term = (phrase or word).replace('"', '""')
+        if term.strip():
+            terms.append(f'"{term}"')
+    return " AND ".join(terms)
+
+
+class AidaTextIndex(NanopubFileIndex):
+    """SQLite FTS5 index of AIDA sentences and text chunks"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY,
+            file TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            nanopub TEXT NOT NULL,
+            aida TEXT NOT NULL,
+            chunk TEXT,
+            section TEXT,
+            extraction_type TEXT,
+            page TEXT,
+            paragraph TEXT
+        );
+        CREATE INDEX IF NOT EXISTS entries_file ON entries (file);
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5 (
+            text, tokenize = 'porter unicode61 remove_diacritics 2'
+        );
+    """
+
+    def _remove_file(self, file: str):
+        self.db.execute("DELETE FROM entries_fts WHERE rowid IN (SELECT id FROM entries WHERE file = ?)", (file,))
+        self.db.execute("DELETE FROM entries WHERE file = ?", (file,))
+
+    def _add_entry(self, file, kind, record, text, chunk=None):
+        chunk = chunk or {}
+        cursor = self.db.execute(
+            "INSERT INTO entries (file, kind, nanopub, aida, chunk, section, extraction_type, page, paragraph) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file, kind, record["nanopub"], record["aida"], chunk.get("chunk"), chunk.get("section"),
+             chunk.get("extraction_type"), chunk.get("page"), chunk.get("paragraph")),
+        )
+        self.db.execute("INSERT INTO entries_fts (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text))
+
+    def add_records(self, file: str, records):
+        """Index the AIDA records extracted from one file, replacing any previous entries for it"""
+        self._remove_file(file)
+        for record in records:
+            self._add_entry(file, "sentence", record, record["sentence"])
+            for chunk in record["chunks"]:
+                if chunk["text"]:
+                    self._add_entry(file, "chunk", record, chunk["text"], chunk)
+
+    def optimize(self):
+        """Merge the FTS5 segments into one b-tree (run after large bulk loads)"""
+        with self.db:
+            self.db.execute("INSERT INTO entries_fts (entries_fts) VALUES ('optimize')")
+
+    def search(self, query: str, kind=None, section=None, extraction_type=None, limit: int = 20, raw: bool = False):
+        """
+        Return the best matching sentences/chunks ranked by BM25. `query` is free
+        text with optional "quoted phrases", or an FTS5 expression if `raw` is set.
+        `section` and `extraction_type` filter chunks case-insensitively.
+        """
+        match = query if raw else build_match_query(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT e.kind, e.nanopub, e.aida, e.chunk, e.section, e.extraction_type, e.page, e.paragraph, "
+            "snippet(entries_fts, 0, '[', ']', '…', 16), bm25(entries_fts) AS score "
+            "FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid WHERE entries_fts MATCH ?"
+        )
+        params = [match]
+        if kind is not None:
+            sql += " AND e.kind = ?"
+            params.append(kind)
+        if section is not None:
+            sql += " AND e.section = ? COLLATE NOCASE"
+            params.append(section)
+        if extraction_type is not None:
+            sql += " AND e.extraction_type = ? COLLATE NOCASE"
+            params.append(extraction_type)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        columns = ("kind", "nanopub", "aida", "chunk", "section", "extraction_type", "page", "paragraph", "snippet", "score")
+        return [dict(zip(columns, row)) for row in self.db.execute(sql, params)]
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def main():
+    """Build or search the AIDA full-text index from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("index", type=Path, help="SQLite index file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="index (or re-index) filled AIDA nanopub files")
+    build.add_argument("paths", nargs="+", type=Path, help=".trig/.nq files or directories")
+    build.add_argument("--force", action="store_true", help="re-index unchanged files")
+    build.add_argument("--optimize", action="store_true", help="merge index segments after indexing")
+
+    search = sub.add_parser("search", help='search sentences and chunks (use "..." for phrases)')
+    search.add_argument("query")
+    search.add_argument("--kind", choices=KINDS)
+    search.add_argument("--section", help="section title of the chunk, e.g. Results")
+    search.add_argument("--extraction-type", help="e.g. 'direct quote' or 'paraphrase'")
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--raw", action="store_true", help="pass the query to FTS5 unchanged")
+
+    args = parser.parse_args()
+
+    with AidaTextIndex(args.index) as index:
+        if args.command == "build":
+            stats = index.add_files(args.paths, force=args.force)
+            for path, error in stats["errors"]:
+                print(f"✗ {path}: {error}")
+            if args.optimize:
+                index.optimize()
+            print(f"✓ Indexed {stats['indexed']} files ({stats['skipped']} unchanged), "
+                  f"{len(index)} entries in {args.index}")
+        else:
+            hits = index.search(args.query, args.kind, args.section, args.extraction_type, args.limit, args.raw)
+            for hit in hits:
+                print(f"{hit['score']:.3f}\t{hit['kind']}\t{hit['section'] or ''}\t{hit['snippet']}\t{hit['aida']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Append-only write-ahead journal of the state of every item of a batch job
+(built, signed, stored, published), so that a job killed halfway can resume
+from the point of failure instead of restarting from zero.
+
+Items are identified by their position in the (deterministic) input stream.
+Each state change is one short text line ("<position> <state> [<nanopub URI>]")
+flushed to the OS as soon as it is written, and fsync'ed every `sync_every`
+lines. On reopen the journal is replayed: finished items below a contiguous
+watermark are only kept as a single number, so memory stays small even for
+multi-million item backfills. A torn last line (crash mid-write) is ignored.
+A compacted journal records the final state its watermark was computed for,
+and refuses to resume a run that needs a later one (stored -> published).
+"""
+
+import argparse
+import os
+import threading
+from pathlib import Path
+
+BUILT = "B"
+SIGNED = "S"
+STORED = "T"
+PUBLISHED = "P"
+
+STATES = {BUILT: "built", SIGNED: "signed", STORED: "stored", PUBLISHED: "published"}
+ORDER = {BUILT: 1, SIGNED: 2, STORED: 3, PUBLISHED: 4}
+WATERMARK = "W"
+
+
+class BatchJournal:
+    """Replayable journal of per-item batch job states"""
+
+    def __init__(self, path: Path, final_state: str = STORED, sync_every: int = 1000):
+        if final_state not in STATES:
+            raise ValueError(f"Unknown final state {final_state!r}")
+        self.path = Path(path)
+        self.final_state = final_state
+        self.sync_every = sync_every
+        self.watermark = 0
+        # state of every item below the watermark (the final state of the run that compacted them)
+        self.watermark_state = final_state
+        self.entries = {}
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        if self.path.exists():
+            self._replay()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _replay(self):
+        good = 0
+        with open(self.path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # torn write of the last line
+                good += len(raw)
+                fields = raw.decode("utf-8").split()
+                if len(fields) < 2:
+                    continue
+                if fields[0] == WATERMARK:
+                    # journals compacted before the state was recorded used the default, stored
+                    state = fields[2] if len(fields) > 2 else STORED
+                    if ORDER[state] < ORDER[self.final_state]:
+                        raise ValueError(f"{self.path} was compacted for a run ending at {STATES[state]}, "
+                                         f"it cannot resume a run ending at {STATES[self.final_state]}")
+                    self.watermark = max(self.watermark, int(fields[1]))
+                    self.watermark_state = state
+                    continue
+                position, state = int(fields[0]), fields[1]
+                if state not in STATES or position < self.watermark:
+                    continue
+                self._apply(position, state, fields[2] if len(fields) > 2 else None)
+        if good < self.path.stat().st_size:
+            # drop the torn line so that new records start on a line of their own
+            os.truncate(self.path, good)
+        self._advance()
+
+    def _apply(self, position, state, uri):
+        previous = self.entries.get(position)
+        if previous and ORDER[previous[0]] >= ORDER[state]:
+            return
+        self.entries[position] = (state, uri or (previous[1] if previous else None))
+
+    def _advance(self):
+        """Collapse finished items at the start of the stream into the watermark"""
+        while self.entries.get(self.watermark, (None,))[0] is not None and \
+                ORDER[self.entries[self.watermark][0]] >= ORDER[self.final_state]:
+            del self.entries[self.watermark]
+            self.watermark += 1
+            self.watermark_state = self.final_state
+
+    def state(self, position: int):
+        """(state, nanopub URI) of an item; (final state, None) below the watermark; (None, None) if unseen"""
+        if position < self.watermark:
+            return self.watermark_state, None
+        return self.entries.get(position, (None, None))
+
+    def is_done(self, position: int) -> bool:
+        state, _ = self.state(position)
+        return state is not None and ORDER[state] >= ORDER[self.final_state]
+
+    def record(self, position: int, state: str, uri: str = None):
+        """Append a state change; call it only once the corresponding output is durable"""
+        with self._lock:
+            if position < self.watermark:
+                return
+            self._apply(position, state, uri)
+            self._file.write(f"{position} {state} {uri}\n" if uri else f"{position} {state}\n")
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                self.sync()
+            self._advance()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def compact(self):
+        """Rewrite the journal as the watermark plus the latest state of pending items"""
+        self.sync()
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"{WATERMARK} {self.watermark} {self.watermark_state}\n")
+            for position, (state, uri) in sorted(self.entries.items()):
+                f.write(f"{position} {state} {uri}\n" if uri else f"{position} {state}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def summary(self):
+        counts = {name: 0 for name in STATES.values()}
+        counts[STATES[self.watermark_state]] += self.watermark
+        for state, _ in self.entries.values():
+            counts[STATES[state]] += 1
+        return counts
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    """Inspect or compact a batch job journal."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("journal", type=Path)
+    parser.add_argument("command", choices=["status", "compact"])
+    parser.add_argument("--final-state", choices=list(STATES.values()), default="stored",
+                        help="state at which an item is complete")
+    args = parser.parse_args()
+
+    final_state = {name: code for code, name in STATES.items()}[args.final_state]
+    try:
+        journal = BatchJournal(args.journal, final_state=final_state)
+    except ValueError as e:
+        parser.error(str(e))
+    with journal:
+        if args.command == "compact":
+            journal.compact()
+            print(f"✓ Compacted {args.journal}")
+        print(f"Watermark: {journal.watermark} items complete from the start of the input")
+        for name, count in journal.summary().items():
+            print(f"{name:<10} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,11 @@ from rdflib.namespace import RDF, RDFS, XSD, DCTERMS, FOAF
 from nanopub import Nanopub, NanopubConf, Profile # load_profile
 from pathlib import Path
 
+from ontology_registry import term_labels, validate_terms
+
+# values of the extractionType placeholder of text chunks
+EXTRACTION_TYPES = ["direct quote", "paraphrase", "summary", "data point"]
+
 # Constructing profile for publishing nanopublications
 def create_memory_profile(name: str, orcid_id: str):
     """Create profile entirely in memory without file I/O"""
@@ -93,28 +98,15 @@ def create_aida_spatiotemporal_template():
     temporal_period_placeholder = URIRef(template_base + "temporalPeriod")
     
     # Statement URIs
-    statements = [URIRef(template_base + f"st{i}") for i in range(20)]
+    statements = [URIRef(template_base + f"st{i}") for i in range(21)]
     
     # Add property labels
-    property_labels = {
-        HYCL["AIDA-Sentence"]: "AIDA sentence - an English sentence that is Atomic, Independent, Declarative, and Absolute",
-        CITO.obtainsSupportFrom: "obtains support from",
-        SCHEMA.about: "is about - connects a thing (left) to a subject matter that this thing is about (right)",
-        RDF.type: "is an - connects a thing (left) to a class it belongs to (right)",
-        SKOS.related: "is related to",
-        CITO.cites: "cites",
-        CITO.citesAsSourceDocument: "cites as source document",
-        FABIO.ScholarlyWork: "scholarly work - any kind of scholarly work, such as an article, book, etc.",
-        DOCO.TextChunk: "text chunk - a piece of text from a document",
-        CITO.includesQuotationFrom: "includes quotation from",
-        FABIO.hasPageNumber: "has page number",
-        DOCO.Section: "document section",
-        DOCO.Paragraph: "document paragraph",
-        DCTERMS.spatial: "has spatial coverage",
-        DCTERMS.temporal: "has temporal extent",
-        DCAT.spatialResolutionInMeters: "has spatial resolution in meters",
-        DCAT.temporalResolution: "has temporal resolution"
-    }
+    property_labels = term_labels([
+        HYCL["AIDA-Sentence"], CITO.obtainsSupportFrom, SCHEMA.about, RDF.type, SKOS.related, CITO.cites,
+        CITO.citesAsSourceDocument, FABIO.ScholarlyWork, DOCO.TextChunk, CITO.includesQuotationFrom,
+        FABIO.hasPageNumber, DOCO.Section, DOCO.Paragraph, DCTERMS.spatial, DCTERMS.temporal,
+        DCAT.spatialResolutionInMeters, DCAT.temporalResolution, DCTERMS.type
+    ], {RDF.type: "is an - connects a thing (left) to a class it belongs to (right)"})
     
     for prop, label in property_labels.items():
         assertion.add((prop, RDFS.label, Literal(label)))
@@ -198,8 +190,7 @@ def create_aida_spatiotemporal_template():
     
     assertion.add((extraction_type_placeholder, RDF.type, NT.RestrictedChoicePlaceholder))
     assertion.add((extraction_type_placeholder, RDFS.label, Literal("Type of text extraction")))
-    extraction_types = ["direct quote", "paraphrase", "summary", "data point"]
-    for et in extraction_types:
+    for et in EXTRACTION_TYPES:
         assertion.add((extraction_type_placeholder, NT.possibleValue, Literal(et)))
     
     assertion.add((temporal_period_placeholder, RDF.type, NT.LocalResource))
@@ -363,6 +354,15 @@ def create_aida_spatiotemporal_template():
     assertion.add((statements[19], RDF.type, NT.OptionalStatement))
     assertion.add((statements[19], RDF.type, NT.RepeatableStatement))
     
+    assertion.add((statements[20], RDF.object, extraction_type_placeholder))
+    assertion.add((statements[20], RDF.predicate, DCTERMS.type))
+    assertion.add((statements[20], RDF.subject, text_chunk_placeholder))
+    assertion.add((statements[20], RDF.type, NT.OptionalStatement))
+    assertion.add((statements[20], RDF.type, NT.RepeatableStatement))
+    
+    # Every term must exist in its ontology (see ontology_registry.py)
+    validate_terms(assertion)
+
     # Create provenance graph
     provenance = Graph()
     provenance.add((assertion_uri, PROV.wasAttributedTo, URIRef(profile.orcid_id)))
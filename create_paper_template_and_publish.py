@@ -10,6 +10,8 @@ from rdflib.namespace import RDF, RDFS, XSD, DCTERMS, FOAF
 from nanopub import Nanopub, NanopubConf, Profile
 from pathlib import Path
 
+from ontology_registry import term_labels, validate_terms
+
 # Constructing profile for publishing nanopublications
 def create_memory_profile(name: str, orcid_id: str):
     """Create profile entirely in memory without file I/O"""
@@ -92,33 +94,13 @@ def create_scientific_paper_template():
     statements = [URIRef(template_base + f"st{i:02d}") for i in range(1, 16)]
     
     # Add property and class labels
-    labels = {
-        FABIO.ResearchPaper: "research paper - a scholarly paper reporting original research results",
-        BIBO.AcademicArticle: "academic article - a scholarly article published in an academic venue",
-        DEO.Introduction: "introduction - opening section that establishes context and purpose",
-        DEO.Methods: "methods - section describing methodology and procedures",
-        DEO.Results: "results - section presenting findings and outcomes", 
-        DEO.Discussion: "discussion - section analyzing and interpreting results",
-        DCTERMS.title: "has title",
-        DCTERMS.abstract: "has abstract",
-        DCTERMS.date: "has publication date",
-        DCTERMS.creator: "has author/creator",
-        DCTERMS.isPartOf: "is part of (journal or venue)",
-        DCTERMS.subject: "has subject/research field",
-        DOCO.hasSection: "has document section",
-        DEO.hasGoal: "has research goal",
-        DEO.hasHypothesis: "has hypothesis",
-        FOAF.name: "has name",
-        RDF.type: "is a - connects a thing to a class it belongs to",
-        CITO.cites: "cites",
-        CITO.extends: "extends",
-        CITO.supports: "supports", 
-        CITO.agreesWith: "agrees with",
-        CITO.disagreesWith: "disagrees with",
-        CITO.citesAsEvidence: "cites as evidence",
-        CITO.usesMethodIn: "uses method in",
-        CITO.usesDataFrom: "uses data from"
-    }
+    labels = term_labels([
+        FABIO.ResearchPaper, BIBO.AcademicArticle, DEO.Introduction, DEO.Methods, DEO.Results,
+        DEO.Discussion, DCTERMS.title, DCTERMS.abstract, DCTERMS.date, DCTERMS.creator, DCTERMS.isPartOf,
+        DCTERMS.subject, DOCO.hasSection, DEO.hasGoal, DEO.hasHypothesis, FOAF.name, RDF.type, CITO.cites,
+        CITO.extends, CITO.supports, CITO.agreesWith, CITO.disagreesWith, CITO.citesAsEvidence,
+        CITO.usesMethodIn, CITO.usesDataFrom
+    ])
     
     for entity, label in labels.items():
         assertion.add((entity, RDFS.label, Literal(label)))
@@ -330,6 +312,9 @@ def create_scientific_paper_template():
     assertion.add((statements[14], RDF.type, NT.RepeatableStatement))
     assertion.add((statements[14], RDF.type, NT.OptionalStatement))
     
+    # Every term must exist in its ontology (see ontology_registry.py)
+    validate_terms(assertion)
+
     # Create provenance graph
     provenance = Graph()
     provenance.add((assertion_uri, PROV.wasAttributedTo, URIRef(profile.orcid_id)))
@@ -1,8 +1,10 @@
 import rdflib
 from rdflib import BNode, Namespace
-from nanopub import Nanopub, NanopubConf, Profile 
+from nanopub import Nanopub, NanopubConf, Profile
 from pathlib import Path
 
+from ontology_registry import validate_terms
+
 # Constructing profile for publishing nanopublications
 def create_memory_profile(name: str, orcid_id: str):
     """Create profile entirely in memory without file I/O"""
@@ -15,122 +17,167 @@ def create_memory_profile(name: str, orcid_id: str):
 
 # namespaces
 NPX = Namespace("http://purl.org/nanopub/x/")
-
-# Load user profile (make sure you have set up your profile first)
-#profile = load_profile()
-# Set up Anne Fouilloux's profile
-profile = create_memory_profile(
-   name="Anne Fouilloux",
-   orcid_id="https://orcid.org/0000-0002-1784-2920"
-)
-# 1. Create configuration
-np_conf = NanopubConf(
-    profile=profile,
-    use_test_server=True,
-    add_prov_generated_time=True,
-    attribute_publication_to_profile=True,
-)
-
-
-# 2. Create the assertion graph for a patent claim
-my_assertion = rdflib.Graph()
-
-# Define namespaces
 SCHEMA = rdflib.Namespace("http://schema.org/")
 
-# Use BNode for the patent claim - nanopub will generate proper URI
-patent_claim = BNode("patent_claim_1")
-
 # Patent claim example: "An apparatus comprising a handle and a head portion"
-my_assertion.add((
-    patent_claim,
-    rdflib.RDF.type,
-    SCHEMA.CreativeWork
-))
-
-my_assertion.add((
-    patent_claim,
-    rdflib.RDFS.label,
-    rdflib.Literal("Patent Claim 1")
-))
-
-my_assertion.add((
-    patent_claim,
-    SCHEMA.position,
-    rdflib.Literal("1", datatype=rdflib.XSD.integer)
-))
-
-my_assertion.add((
-    patent_claim,
-    SCHEMA.category,
-    rdflib.Literal("An apparatus")
-))
-
-my_assertion.add((
-    patent_claim,
-    SCHEMA.description,
-    rdflib.Literal("a handle; and a head portion connected to the handle.")
-))
-
-# Add transitional phrase as structured property
-transitional_prop = BNode("transitional_phrase_1")
-my_assertion.add((
-    patent_claim,
-    SCHEMA.additionalProperty,
-    transitional_prop
-))
-
-my_assertion.add((
-    transitional_prop,
-    rdflib.RDF.type,
-    SCHEMA.PropertyValue
-))
-
-my_assertion.add((
-    transitional_prop,
-    SCHEMA.name,
-    rdflib.Literal("transitionalPhrase")
-))
-
-my_assertion.add((
-    transitional_prop,
-    SCHEMA.value,
-    rdflib.Literal("comprising")
-))
-
-# 3. Create and publish the nanopublication
-# The introduces_concept parameter tells nanopub this BNode represents the main concept
-np = Nanopub(
-    conf=np_conf,
-    assertion=my_assertion,
-    introduces_concept=patent_claim  # This will get a proper URI when published
-)
-np.pubinfo.add((
-    np.metadata.sig_uri,
-    NPX["signedBy"],
-    rdflib.URIRef(profile.orcid_id),
-))
-
-
-# Sign the nanopub
-print("Signing nanopublication...")
-np.sign()
-print(f"✓ Signed nanopub: {np.source_uri}")
-       
-# Optionally publish (uncomment to publish to nanopub server)
-#AF print("Publishing nanopublication...")
-#AF np.publish()
-        
-# Save to file
-output_file = Path("patent_claim_template.trig")
-np.store(output_file, format='trig')
-print(f"✓ Saved template to: {output_file}")
-        
-# Print the nanopub
-print("\n" + "="*80)
-print("GENERATED NANOPUBLICATION TEMPLATE:")
-print("="*80)
-print(np)
-        
-print(f"Published nanopublication: {np.source_uri}")
-print(f"Patent claim URI: {np.concept_uri}")  # The actual URI of the patent claim
+EXAMPLE_CLAIM = {
+    "position": 1,
+    "preamble": "An apparatus",
+    "transitional": "comprising",
+    "elements": ["a handle", "a head portion connected to the handle"],
+}
+
+
+def claim_description(elements) -> str:
+    """Claim body as written in a claim: 'a handle; and a head portion connected to the handle.'"""
+    elements = list(elements)
+    if len(elements) > 1:
+        elements[-1] = "and " + elements[-1]
+    return "; ".join(elements) + "."
+
+
+def create_patent_claim(claim: dict, profile: Profile, use_test_server: bool = True):
+    """
+    Create an unsigned nanopub for one patent claim given as a dict with
+    position, preamble, transitional phrase and elements (and optionally the
+    claim or claims it depends on and the patent it belongs to).
+    """
+    # 1. Create configuration
+    np_conf = NanopubConf(
+        profile=profile,
+        use_test_server=use_test_server,
+        add_prov_generated_time=True,
+        attribute_publication_to_profile=True,
+    )
+
+    # 2. Create the assertion graph for a patent claim
+    my_assertion = rdflib.Graph()
+
+    # Use BNode for the patent claim - nanopub will generate proper URI
+    position = claim["position"]
+    patent_claim = BNode(f"patent_claim_{position}")
+
+    my_assertion.add((
+        patent_claim,
+        rdflib.RDF.type,
+        SCHEMA.CreativeWork
+    ))
+
+    my_assertion.add((
+        patent_claim,
+        rdflib.RDFS.label,
+        rdflib.Literal(f"Patent Claim {position}")
+    ))
+
+    my_assertion.add((
+        patent_claim,
+        SCHEMA.position,
+        rdflib.Literal(str(position), datatype=rdflib.XSD.integer)
+    ))
+
+    my_assertion.add((
+        patent_claim,
+        SCHEMA.category,
+        rdflib.Literal(claim["preamble"])
+    ))
+
+    my_assertion.add((
+        patent_claim,
+        SCHEMA.description,
+        rdflib.Literal(claim.get("description") or claim_description(claim["elements"]))
+    ))
+
+    if claim.get("patent"):
+        my_assertion.add((
+            patent_claim,
+            SCHEMA.isPartOf,
+            rdflib.URIRef(claim["patent"])
+        ))
+
+    # Add transitional phrase (and the claim a dependent claim refers to) as structured properties
+    properties = [(f"transitional_phrase_{position}", "transitionalPhrase", rdflib.Literal(claim["transitional"]))]
+    depends_on = claim.get("depends_on") or []
+    for parent in [depends_on] if isinstance(depends_on, int) else depends_on:
+        properties.append((f"depends_on_{position}_{parent}", "dependsOnClaim",
+                           rdflib.Literal(str(parent), datatype=rdflib.XSD.integer)))
+    for node_id, name, value in properties:
+        prop = BNode(node_id)
+        my_assertion.add((
+            patent_claim,
+            SCHEMA.additionalProperty,
+            prop
+        ))
+
+        my_assertion.add((
+            prop,
+            rdflib.RDF.type,
+            SCHEMA.PropertyValue
+        ))
+
+        my_assertion.add((
+            prop,
+            SCHEMA.name,
+            rdflib.Literal(name)
+        ))
+
+        my_assertion.add((
+            prop,
+            SCHEMA.value,
+            value
+        ))
+
+    # Every schema.org term must exist (see ontology_registry.py)
+    validate_terms(my_assertion)
+
+    # 3. Create the nanopublication
+    # The introduces_concept parameter tells nanopub this BNode represents the main concept
+    np = Nanopub(
+        conf=np_conf,
+        assertion=my_assertion,
+        introduces_concept=patent_claim  # This will get a proper URI when published
+    )
+    np.pubinfo.add((
+        np.metadata.sig_uri,
+        NPX["signedBy"],
+        rdflib.URIRef(profile.orcid_id),
+    ))
+    return np
+
+
+def main():
+    # Load user profile (make sure you have set up your profile first)
+    #profile = load_profile()
+    # Set up Anne Fouilloux's profile
+    profile = create_memory_profile(
+       name="Anne Fouilloux",
+       orcid_id="https://orcid.org/0000-0002-1784-2920"
+    )
+
+    np = create_patent_claim(EXAMPLE_CLAIM, profile)
+
+    # Sign the nanopub
+    print("Signing nanopublication...")
+    np.sign()
+    print(f"✓ Signed nanopub: {np.source_uri}")
+
+    # Optionally publish (uncomment to publish to nanopub server)
+    #AF print("Publishing nanopublication...")
+    #AF np.publish()
+
+    # Save to file
+    output_file = Path("patent_claim_template.trig")
+    np.store(output_file, format='trig')
+    print(f"✓ Saved template to: {output_file}")
+
+    # Print the nanopub
+    print("\n" + "="*80)
+    print("GENERATED NANOPUBLICATION TEMPLATE:")
+    print("="*80)
+    print(np)
+
+    print(f"Published nanopublication: {np.source_uri}")
+    print(f"Patent claim URI: {np.concept_uri}")  # The actual URI of the patent claim
+
+
+if __name__ == "__main__":
+    main()
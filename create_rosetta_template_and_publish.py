@@ -11,6 +11,8 @@ from rdflib.namespace import RDF, RDFS, XSD, DCTERMS, FOAF
 from nanopub import Nanopub, NanopubConf, Profile
 from pathlib import Path
 
+from ontology_registry import term_labels, validate_terms
+
 def create_memory_profile(name: str, orcid_id: str):
     """Create profile entirely in memory without file I/O"""
     profile = Profile(
@@ -103,30 +105,19 @@ def create_rosetta_statement_template():
     
     # Add property and class labels based on Rosetta Statement metamodel
     # Define our own Rosetta Statement vocabulary since the GitHub repo isn't web-resolvable
-    labels = {
-        ROSETTA.RosettaStatement: "Rosetta Statement - a natural language statement modeled semantically",
-        ROSETTA.subject: "has subject - connects statement to its subject resource",
-        ROSETTA.requiredObjectPosition1: "required object position 1 - first mandatory object",
-        ROSETTA.requiredObjectPosition2: "required object position 2 - second mandatory object", 
-        ROSETTA.optionalObjectPosition1: "optional object position 1 - first optional object",
-        ROSETTA.optionalObjectPosition2: "optional object position 2 - second optional object",
-        ROSETTA.optionalObjectPosition3: "optional object position 3 - third optional object",
-        ROSETTA.requiredLiteralObjectPosition1: "required literal object position 1 - first mandatory literal",
-        ROSETTA.optionalLiteralObjectPosition1: "optional literal object position 1 - first optional literal",
-        ROSETTA.hasStatementType: "has statement type - connects to Rosetta Statement class",
-        ROSETTA.hasDynamicLabel: "has dynamic label - template for natural language display",
-        ROSETTA.hasConfidenceLevel: "has confidence level - degree of certainty (0-1)",
-        ROSETTA.hasContext: "has context - scholarly publication or broader context",
-        ROSETTA.isNegation: "is negation - whether this statement is negated",
-        ROSETTA.hasSourceReference: "has source reference - supporting evidence",
-        ROSETTA.hasVersion: "has version - links to statement version",
-        ROSETTA.anchorStatement: "anchor statement - version-independent statement identity",
+    labels = term_labels([
+        ROSETTA.RosettaStatement, ROSETTA.subject, ROSETTA.requiredObjectPosition1,
+        ROSETTA.requiredObjectPosition2, ROSETTA.optionalObjectPosition1, ROSETTA.optionalObjectPosition2,
+        ROSETTA.optionalObjectPosition3, ROSETTA.requiredLiteralObjectPosition1,
+        ROSETTA.optionalLiteralObjectPosition1, ROSETTA.hasStatementType, ROSETTA.hasDynamicLabel,
+        ROSETTA.hasConfidenceLevel, ROSETTA.hasContext, ROSETTA.isNegation, ROSETTA.hasSourceReference,
+        ROSETTA.hasVersion, ROSETTA.anchorStatement, HYCL["AIDA-Sentence"], DCTERMS.created, DCTERMS.creator,
+        PROV.wasAttributedTo, RDF.type
+    ], {
         HYCL["AIDA-Sentence"]: "AIDA sentence - Atomic, Independent, Declarative, Absolute sentence",
-        DCTERMS.created: "created - timestamp of creation",
         DCTERMS.creator: "creator - person who created this statement",
-        PROV.wasAttributedTo: "was attributed to - attribution of statement",
-        RDF.type: "is a - connects to class/type"
-    }
+        RDF.type: "is a - connects to class/type",
+    })
     
     for entity, label in labels.items():
         assertion.add((entity, RDFS.label, Literal(label)))
@@ -350,6 +341,9 @@ def create_rosetta_statement_template():
     assertion.add((statements[14], RDF.object, statement_instance_placeholder))
     assertion.add((statements[14], RDF.type, NT.OptionalStatement))
     
+    # Every term must exist in its ontology (see ontology_registry.py)
+    validate_terms(assertion)
+
     # Create provenance graph
     provenance = Graph()
     provenance.add((assertion_uri, PROV.wasAttributedTo, URIRef(profile.orcid_id)))
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+DOI join index between AIDA nanopubs and the paper nanopubs they cite.
+
+An AIDA nanopub names its paper twice: as the object of its citation (the
+`scientificPaper` placeholder, with one of the CiTO citation types) and as the
+`dcterms:isPartOf` of its text chunks. A paper nanopub introduces the paper's
+DOI as its main resource (a fabio:ResearchPaper). The same DOI is written in
+many ways (https://doi.org/10.1234/ABC, http://dx.doi.org/10.1234/abc,
+doi:10.1234/abc, percent-encoded), so every reference is keyed by its
+normalized DOI: lower case, without resolver prefix or trailing punctuation.
+References that are not DOIs are keyed by their IRI.
+
+`index` reads signed nanopub files, directories, compressed shards (see
+sharded_output.py) or a quad store (see quad_store.py) on a process pool and
+keeps both sides in a SQLite file: DOI -> paper nanopub and AIDA nanopub ->
+DOI, with the file each entry came from, so unchanged files are skipped when
+the index is updated. `link` then joins the two sides in bulk: the paper side
+is loaded into a hash table once and the AIDA references are streamed past it,
+so a batch of a million AIDA nanopubs costs one scan of each table and no
+lookups over the network. It writes the links and a report of the DOIs that no
+paper nanopub introduces, most referenced first.
+
+    python doi_join.py index signed_nanopubs
+    python doi_join.py link --links links.tsv --unresolved unresolved.tsv
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import unquote
+
+from rdflib import Dataset, URIRef
+from rdflib.namespace import DCTERMS, RDF
+
+from aida_records import CITATION_TYPES, FABIO, HYCL, NP, extract_aida_records, iter_nanopub_files
+
+SCHEMA = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+CREATE TABLE IF NOT EXISTS papers (
+    doi TEXT NOT NULL, nanopub TEXT NOT NULL, source TEXT NOT NULL, PRIMARY KEY (doi, nanopub)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS papers_source ON papers (source);
+CREATE TABLE IF NOT EXISTS refs (
+    nanopub TEXT NOT NULL, role TEXT NOT NULL, doi TEXT NOT NULL, source TEXT NOT NULL,
+    PRIMARY KEY (nanopub, role, doi)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS refs_source ON refs (source);
+CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, mtime REAL NOT NULL);
+"""
+
+DOI_RE = re.compile(r"\b(10\.\d{4,9}/\S+)")
+SHARD_SUFFIXES = (".trig.gz", ".trig.zst")
+# roles of an AIDA reference: the paper it cites, or the paper a text chunk is part of
+CITATION, CHUNK = "citation", "chunk"
+
+
+def normalize_doi(value: str):
+    """Normalized DOI ("10.1234/abc") of a DOI given bare, as doi:..., or as a (percent-encoded) URL; or None"""
+    match = DOI_RE.search(unquote(value or "").strip())
+    return match.group(1).rstrip(".,;").lower() if match else None
+
+
+def join_key(iri: str) -> str:
+    """Key of a paper reference: its normalized DOI, or else the IRI itself"""
+    return normalize_doi(iri) or iri.strip()
+
+
+def dataset_entries(ds: Dataset):
+    """(papers, refs) of the nanopubs of a dataset: [(key, paper nanopub)], [(AIDA nanopub, role, key)]"""
+    papers, refs = [], []
+    for np_uri, _, assertion_id in ds.triples((None, NP.hasAssertion, None)):
+        for paper in ds.graph(assertion_id).subjects(RDF.type, FABIO.ResearchPaper):
+            if isinstance(paper, URIRef):
+                papers.append((join_key(str(paper)), str(np_uri)))
+    for record in extract_aida_records(ds):
+        if record["citation_type"] is not None:
+            refs.append((record["nanopub"], CITATION, join_key(record["paper"])))
+        for chunk in record["chunks"]:
+            if chunk["paper"]:
+                refs.append((record["nanopub"], CHUNK, join_key(chunk["paper"])))
+    return papers, refs
+
+
+def extract(path: str):
+    """(path, mtime, papers, refs, error) of a nanopub file or a shard of many nanopubs"""
+    papers, refs = [], []
+    try:
+        if path.endswith(SHARD_SUFFIXES):
+            from sharded_output import iter_shard
+
+            for _, trig in iter_shard(path):
+                ds = Dataset(default_union=True)
+                ds.parse(data=trig, format="trig")
+                file_papers, file_refs = dataset_entries(ds)
+                papers += file_papers
+                refs += file_refs
+        else:
+            ds = Dataset(default_union=True)
+            ds.parse(path, format="nquads" if path.endswith(".nq") else "trig")
+            papers, refs = dataset_entries(ds)
+    except Exception as e:
+        return path, None, [], [], f"{type(e).__name__}: {e}"
+    return path, os.stat(path).st_mtime, papers, refs, None
+
+
+def iter_sources(paths):
+    """Nanopub files and shard files of files and directories"""
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            yield from iter_nanopub_files([path])
+            for suffix in SHARD_SUFFIXES:
+                yield from sorted(path.rglob(f"*{suffix}"))
+        else:
+            yield path
+
+
+class DoiIndex:
+    """Normalized DOI -> paper nanopub and AIDA nanopub -> DOI, in a SQLite file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _replace(self, source: str, mtime: float, papers, refs):
+        with self.db:
+            self.db.execute("DELETE FROM papers WHERE source = ?", (source,))
+            self.db.execute("DELETE FROM refs WHERE source = ?", (source,))
+            self.db.executemany("INSERT OR IGNORE INTO papers VALUES (?, ?, ?)",
+                                [(key, nanopub, source) for key, nanopub in papers])
+            self.db.executemany("INSERT OR IGNORE INTO refs VALUES (?, ?, ?, ?)",
+                                [(nanopub, role, key, source) for nanopub, role, key in refs])
+            self.db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (source, mtime))
+
+    def add_files(self, paths, workers: int = None, force: bool = False):
+        """Index nanopub files and shards on a process pool, skipping unchanged ones; return (added, skipped)"""
+        known = dict(self.db.execute("SELECT path, mtime FROM sources"))
+        todo, skipped = [], 0
+        for path in iter_sources(paths):
+            key = str(Path(path).resolve())
+            if not force and known.get(key) == path.stat().st_mtime:
+                skipped += 1
+            else:
+                todo.append(key)
+        added = 0
+        workers = max(1, min(workers or os.cpu_count(), len(todo)))
+        if workers == 1:
+            results = map(extract, todo)
+        else:
+            pool = ProcessPoolExecutor(workers)
+            results = pool.map(extract, todo, chunksize=64)
+        try:
+            for source, mtime, papers, refs, error in results:
+                if error is not None:
+                    print(f"Error indexing {source}: {error}")
+                    continue
+                self._replace(source, mtime, papers, refs)
+                added += 1
+        finally:
+            if workers > 1:
+                pool.shutdown()
+        return added, skipped
+
+    def add_store(self, store):
+        """Index every nanopub of a quad store (replacing what an earlier run took from it)"""
+        source = f"store:{Path(store.db.execute('PRAGMA database_list').fetchone()[2]).resolve()}"
+        nanopub_of = {g: np_uri for np_uri, _, g, _ in store.match(p=NP.hasAssertion)}
+        papers = {(join_key(str(s)), str(nanopub_of[g])) for s, _, _, g in store.match(p=RDF.type, o=FABIO.ResearchPaper)
+                  if g in nanopub_of and isinstance(s, URIRef)}
+        aida = {(s, g) for s, _, _, g in store.match(p=RDF.type, o=HYCL["AIDA-Sentence"]) if g in nanopub_of}
+        aida_graphs = {g for _, g in aida}
+        refs = set()
+        for citation_type in CITATION_TYPES:
+            for s, _, o, g in store.match(p=citation_type):
+                if (s, g) in aida:
+                    refs.add((str(nanopub_of[g]), CITATION, join_key(str(o))))
+        for _, _, o, g in store.match(p=DCTERMS.isPartOf):
+            # the paper template also uses dcterms:isPartOf, for the journal
+            if g in aida_graphs:
+                refs.add((str(nanopub_of[g]), CHUNK, join_key(str(o))))
+        self._replace(source, time.time(), papers, refs)
+        return len(papers), len(refs)
+
+    def resolve(self, doi: str):
+        """Paper nanopubs of a DOI (in any notation) or paper IRI"""
+        return [row[0] for row in self.db.execute("SELECT nanopub FROM papers WHERE doi = ?", (join_key(doi),))]
+
+    def link(self, on_link, on_unresolved=None) -> dict:
+        """
+        Hash-join the AIDA references with the paper nanopubs: call on_link(AIDA
+        nanopub, role, DOI, paper nanopub) for every match, and on_unresolved(DOI,
+        references, an AIDA nanopub) for every DOI without a paper nanopub, most
+        referenced first. Return counts.
+        """
+        papers = {}
+        for key, nanopub in self.db.execute("SELECT doi, nanopub FROM papers"):
+            found = papers.get(key)
+            # most DOIs have a single paper nanopub, so keep a tuple only for the others
+            papers[key] = nanopub if found is None else (found if isinstance(found, tuple) else (found,)) + (nanopub,)
+        unresolved, example = Counter(), {}
+        refs = links = 0
+        linked = set()
+        for nanopub, role, key in self.db.execute("SELECT nanopub, role, doi FROM refs"):
+            refs += 1
+            found = papers.get(key)
+            if found is None:
+                unresolved[key] += 1
+                example.setdefault(key, nanopub)
+                continue
+            linked.add(nanopub)
+            for paper in (found,) if isinstance(found, str) else found:
+                on_link(nanopub, role, key, paper)
+                links += 1
+        if on_unresolved is not None:
+            for key, count in unresolved.most_common():
+                on_unresolved(key, count, example[key])
+        return {"papers": len(papers), "references": refs, "links": links, "linked_nanopubs": len(linked),
+                "unresolved_dois": len(unresolved), "unresolved_references": sum(unresolved.values())}
+
+
+def main():
+    """Index DOIs of AIDA and paper nanopubs, and link AIDA nanopubs to their papers."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--index", type=Path, default=Path("doi_index.db"), help="SQLite index file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    index = sub.add_parser("index", help="add nanopub files, shards or a quad store (unchanged files are skipped)")
+    index.add_argument("paths", nargs="*", type=Path, help=".trig/.nq files, shards or directories")
+    index.add_argument("--store", type=Path, help="quad store (quad_store.py) to index")
+    index.add_argument("--workers", type=int, help="parser processes (default: all cores)")
+    index.add_argument("--force", action="store_true", help="re-index unchanged files")
+
+    link = sub.add_parser("link", help="join AIDA nanopubs with the paper nanopubs of their DOIs")
+    link.add_argument("--links", type=Path, default=Path("doi_links.tsv"),
+                      help="TSV of 'AIDA nanopub<TAB>role<TAB>DOI<TAB>paper nanopub' lines")
+    link.add_argument("--unresolved", type=Path, default=Path("doi_unresolved.tsv"),
+                      help="TSV of 'DOI<TAB>references<TAB>an AIDA nanopub' lines")
+
+    resolve = sub.add_parser("resolve", help="print the paper nanopubs of DOIs")
+    resolve.add_argument("dois", nargs="+")
+    args = parser.parse_args()
+
+    with DoiIndex(args.index) as doi_index:
+        if args.command == "index":
+            if not args.paths and args.store is None:
+                parser.error("Give nanopub files or directories, or --store")
+            start = time.monotonic()
+            if args.paths:
+                added, skipped = doi_index.add_files(args.paths, args.workers, args.force)
+                print(f"✓ Indexed {added} files ({skipped} unchanged) in {time.monotonic() - start:.1f}s")
+            if args.store is not None:
+                from quad_store import SQLiteQuadStore
+
+                with SQLiteQuadStore(args.store) as store:
+                    papers, refs = doi_index.add_store(store)
+                print(f"✓ Indexed {papers} papers and {refs} AIDA references of {args.store}")
+        elif args.command == "link":
+            start = time.monotonic()
+            with open(args.links, "w", encoding="utf-8") as links, \
+                    open(args.unresolved, "w", encoding="utf-8") as unresolved:
+                counts = doi_index.link(
+                    lambda nanopub, role, key, paper: links.write(f"{nanopub}\t{role}\t{key}\t{paper}\n"),
+                    lambda key, count, nanopub: unresolved.write(f"{key}\t{count}\t{nanopub}\n"))
+            print(f"✓ {counts['links']} links for {counts['linked_nanopubs']} AIDA nanopubs "
+                  f"({counts['references']} references, {counts['papers']} papers) "
+                  f"in {time.monotonic() - start:.1f}s, written to {args.links}")
+            if counts["unresolved_dois"]:
+                print(f"✗ {counts['unresolved_dois']} DOIs ({counts['unresolved_references']} references) "
+                      f"have no paper nanopub, listed in {args.unresolved}")
+        else:
+            for doi in args.dois:
+                nanopubs = doi_index.resolve(doi)
+                print(f"{join_key(doi)}\t{' '.join(nanopubs) if nanopubs else '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Export nanopublications to JSON-LD, N-Quads and TriG in a single pass, without
+shelling out to Apache Jena's riot (one JVM start per file).
+
+Each file is parsed once and every requested format is serialized from the same
+in-memory dataset. The JSON-LD context is built from the prefixes bound in the
+file that the data actually uses; contexts are cached, so files sharing the same
+vocabulary (e.g. all instances of one template) reuse one context. Files are
+converted in parallel on a process pool.
+"""
+
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+from rdflib import Dataset, Literal, URIRef
+
+from aida_records import iter_nanopub_files
+
+FORMATS = {
+    "jsonld": ("json-ld", ".jsonld"),
+    "nquads": ("nquads", ".nq"),
+    "trig": ("trig", ".trig"),
+}
+# Nanopub-specific prefixes differ in every file; keeping them out of the
+# context lets files share one cached context
+LOCAL_PREFIXES = {"this", "sub"}
+NAMESPACE_SPLIT_RE = re.compile(r"^(.*[#/])[^#/]*$")
+
+
+@lru_cache(maxsize=256)
+def build_context(prefixes: tuple) -> dict:
+    """JSON-LD context for a sorted tuple of (prefix, namespace) pairs"""
+    return {prefix: namespace for prefix, namespace in prefixes}
+
+
+def used_prefixes(ds: Dataset) -> tuple:
+    """The bound (prefix, namespace) pairs that occur in the dataset's IRIs and datatypes"""
+    bound = {str(namespace): prefix for prefix, namespace in ds.namespaces()
+             if prefix and prefix not in LOCAL_PREFIXES}
+    seen = set()
+    for quad in ds.quads((None, None, None, None)):
+        for term in quad:
+            if isinstance(term, Literal):
+                term = term.datatype
+            if isinstance(term, URIRef):
+                match = NAMESPACE_SPLIT_RE.match(term)
+                if match:
+                    seen.add(match.group(1))
+    return tuple(sorted((bound[ns], ns) for ns in seen if ns in bound))
+
+
+def export_file(path: Path, output_dir: Path, formats=tuple(FORMATS), name: Path = None):
+    """
+    Parse one nanopub file and write it in every requested format, as `name`
+    plus the format's suffix under output_dir (default: the file's stem);
+    return the written paths
+    """
+    path = Path(path)
+    name = Path(name or path.stem)
+    ds = Dataset()
+    ds.parse(path, format="nquads" if path.suffix == ".nq" else "trig")
+    output_dir = Path(output_dir) / name.parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for format_name in formats:
+        rdflib_format, suffix = FORMATS[format_name]
+        target = output_dir / (name.name + suffix)
+        if target.resolve() == path.resolve():
+            continue
+        if format_name == "jsonld":
+            data = ds.serialize(format=rdflib_format, context=build_context(used_prefixes(ds)), auto_compact=True)
+        else:
+            data = ds.serialize(format=rdflib_format)
+        target.write_text(data, encoding="utf-8")
+        written.append(target)
+    return written
+
+
+def output_names(paths):
+    """
+    (file, output name) of every nanopub file under the given paths: files in a
+    directory keep their path relative to it, so that equal stems in different
+    subdirectories do not overwrite each other; files given directly keep their stem
+    """
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            for file in iter_nanopub_files([path]):
+                yield file, file.relative_to(path).with_suffix("")
+        else:
+            yield path, Path(path.stem)
+
+
+def export_files(paths, output_dir: Path, formats=tuple(FORMATS), workers: int = None):
+    """
+    Export every nanopub file under the given paths in parallel, yield (file,
+    written paths or error); a file whose output name another file already has
+    (e.g. a.trig and a.nq, or the same name in two input directories) is not exported
+    """
+    files, owners = [], {}
+    for path, name in output_names(paths):
+        if name in owners:
+            yield path, FileExistsError(f"{owners[name]} is also exported as {name}")
+            continue
+        owners[name] = path
+        files.append((path, name))
+    if workers == 1 or len(files) == 1:
+        for path, name in files:
+            try:
+                yield path, export_file(path, output_dir, formats, name)
+            except Exception as e:
+                yield path, e
+        return
+    with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+        futures = [(path, pool.submit(export_file, path, output_dir, formats, name)) for path, name in files]
+        for path, future in futures:
+            try:
+                yield path, future.result()
+            except Exception as e:
+                yield path, e
+
+
+def main():
+    """Convert nanopub files to JSON-LD, N-Quads and/or TriG."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="+", type=Path, help=".trig/.nq files or directories")
+    parser.add_argument("--output-dir", type=Path, default=Path("export"))
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument("--workers", type=int, help="number of processes (default: all cores)")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    converted = failed = 0
+    for path, result in export_files(args.paths, args.output_dir, tuple(args.formats), args.workers):
+        if isinstance(result, Exception):
+            print(f"Error exporting {path}: {result}")
+            failed += 1
+        else:
+            converted += 1
+    print(f"✓ Exported {converted} files to {args.output_dir} in {time.monotonic() - start:.1f}s"
+          + (f" ({failed} failed)" if failed else ""))
+
+
+if __name__ == "__main__":
+    main()
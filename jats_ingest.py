@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Ingest JATS XML articles (PMC-style .nxml) into scientific paper nanopubs.
+
+Every article is read with a streaming parser (ElementTree.iterparse): body
+paragraphs and references are dropped as soon as they are processed, so
+memory does not grow with the size of an article. An article becomes a record
+in the format of synthetic_workload.build_paper():
+
+- paper: the DOI of the article (or its PMC or PubMed URL), title, abstract,
+  publication date (electronic before print) and journal (by ISSN);
+- authors with an ORCID (the template's author placeholder is an ORCID);
+- sections: the top-level body sections mapped to DEO Introduction, Methods,
+  Results and Discussion by their sec-type or title ("Materials and methods",
+  "Results and discussion", "Conclusions", ...);
+- goal and hypothesis: the Objective/Aim and Hypothesis parts of a structured
+  abstract, or else the first sentence of the abstract or introduction that
+  states one ("The aim of this study was ...", "We hypothesized that ...");
+- citations: every reference with a DOI or PubMed ID, typed with the CiTO
+  property of the template that the sentences citing it suggest (usesMethodIn
+  in methods, usesDataFrom in data availability statements, agreesWith for
+  "consistent with", disagreesWith for "in contrast to", ...), cito:cites
+  otherwise;
+- fields: keywords and subjects resolved to Wikidata with a topic index
+  (topic_autocomplete.py), when one is given.
+
+Files (.xml, .nxml, optionally gzipped), directories and tar archives of them
+(the PMC bulk packages) are parsed in batches on a process pool. The records
+are written as JSONL, or built, signed and stored in batches through
+nanopub_pipeline.py.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import re
+import sys
+import tarfile
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+CITO = "http://purl.org/spar/cito/"
+DOI_URL = "https://doi.org/"
+PMC_URL = "https://www.ncbi.nlm.nih.gov/pmc/articles/"
+PUBMED_URL = "https://pubmed.ncbi.nlm.nih.gov/"
+ORCID_URL = "https://orcid.org/"
+ISSN_URL = "https://portal.issn.org/resource/ISSN/"
+
+# the conditional sections of the paper template (the `sections` keys of synthetic_workload.py)
+SECTIONS = ("introduction", "methods", "results", "discussion")
+ARTICLE_SUFFIXES = (".xml", ".nxml")
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz")
+BATCH_SIZE = 64
+
+# limits of the paper template's placeholders
+MAX_TITLE = 200
+MIN_ABSTRACT, MAX_ABSTRACT = 50, 2000
+MIN_STATEMENT, MAX_STATEMENT = 10, 500
+MAX_AUTHOR_NAME = 50
+
+# better publication dates first
+DATE_TYPES = {"epub": 0, "electronic": 0, "pub": 1, "ppub": 1, "print": 1, "collection": 2, "epub-ppub": 2}
+
+SECTION_TYPES = {
+    "intro": {"introduction"}, "introduction": {"introduction"}, "background": {"introduction"},
+    "methods": {"methods"}, "materials": {"methods"}, "materials|methods": {"methods"},
+    "methods|materials": {"methods"}, "subjects": {"methods"}, "cases": {"methods"},
+    "results": {"results"}, "results|discussion": {"results", "discussion"},
+    "discussion": {"discussion"}, "conclusions": {"discussion"}, "discussion|conclusions": {"discussion"},
+    "data-availability": {"data"},
+}
+SECTION_TITLES = [
+    ("introduction", re.compile(r"^(?:\d+\.?\s*)?(?:introduction|background)\b", re.IGNORECASE)),
+    ("methods", re.compile(r"^(?:\d+\.?\s*)?(?:(?:materials?|patients|subjects|data)\s+and\s+)?"
+                           r"(?:methods?|methodology|materials|experimental(?: procedures| section| design)?|"
+                           r"study design)\b", re.IGNORECASE)),
+    ("results", re.compile(r"^(?:\d+\.?\s*)?results\b", re.IGNORECASE)),
+    ("discussion", re.compile(r"^(?:\d+\.?\s*)?(?:(?:results\s+and\s+)?discussion|conclusions?|concluding remarks)\b|"
+                              r"\band discussion\b", re.IGNORECASE)),
+    ("data", re.compile(r"^(?:data|code)(?: and (?:code|materials?))? availability\b", re.IGNORECASE)),
+]
+GOAL_TITLE_RE = re.compile(r"^(?:objectives?|aims?(?: and objectives?)?|purposes?|goals?)\b", re.IGNORECASE)
+HYPOTHESIS_TITLE_RE = re.compile(r"^hypothes[ie]s\b", re.IGNORECASE)
+GOAL_RE = re.compile(
+    r"\b(?:the\s+(?:main\s+|primary\s+|overall\s+)?(?:aim|objective|purpose|goal)s?\s+of\s+(?:this|the\s+present|our)\s+"
+    r"(?:study|work|paper|article|research|review)|(?:this|the\s+present|our)\s+(?:study|work|paper|article)\s+"
+    r"(?:aims?|aimed|seeks?|sought)\s+to|here,?\s+we\s+(?:aim|set\s+out|sought|seek)|we\s+aimed\s+to)\b",
+    re.IGNORECASE)
+HYPOTHESIS_RE = re.compile(
+    r"\b(?:we\s+hypothesi[sz]ed?|our\s+(?:main\s+)?hypothesis|the\s+hypothesis\s+(?:was|is)\s+that|"
+    r"we\s+test(?:ed)?\s+the\s+hypothesis|(?:was|were|is|are)\s+hypothesi[sz]ed\s+(?:that|to))\b",
+    re.IGNORECASE)
+
+# CiTO types offered by the template's citationType placeholder, most specific first
+CITATION_CUES = [
+    ("disagreesWith", re.compile(r"\b(?:in\s+contrast\s+(?:to|with)|contrary\s+to|unlike|disagree|inconsistent\s+with|"
+                                 r"contradict|conflicts?\s+with|at\s+odds\s+with)", re.IGNORECASE)),
+    ("agreesWith", re.compile(r"\b(?:consistent\s+with|in\s+(?:line|agreement|accordance|keeping)\s+with|"
+                              r"agrees?\s+with|agreed\s+with|corroborat|similar\s+to\s+(?:those|that|what)\s+"
+                              r"(?:reported|observed|found|described))", re.IGNORECASE)),
+    ("supports", re.compile(r"\b(?:support(?:s|ed|ing)?\s+(?:the|their|this|these|previous)|confirm(?:s|ed|ing)?\s+"
+                            r"(?:the|their|previous|earlier))", re.IGNORECASE)),
+    ("extends", re.compile(r"\b(?:extend(?:s|ed|ing)?\s+(?:the|previous|earlier|our|their|this)|"
+                           r"build(?:s|ing)?\s+(?:up)?on|built\s+(?:up)?on)", re.IGNORECASE)),
+    ("usesDataFrom", re.compile(r"\b(?:data\s+(?:were|was|are|is)\s+(?:obtained|downloaded|retrieved|taken|"
+                                r"extracted|derived)\s+from|data\s*sets?\b|database)", re.IGNORECASE)),
+    ("usesMethodIn", re.compile(r"\b(?:as\s+(?:previously\s+)?(?:described|reported)|(?:described|reported)\s+"
+                                r"previously|following\s+the\s+(?:method|protocol|procedure|approach)|according\s+to\s+"
+                                r"the\s+(?:method|protocol|procedure)|(?:method|protocol|procedure|algorithm)\s+"
+                                r"(?:of|by|from|described\s+(?:in|by)))", re.IGNORECASE)),
+    ("citesAsEvidence", re.compile(r"\b(?:(?:has|have)\s+been\s+(?:shown|demonstrated|reported|found)|"
+                                   r"(?:previous|earlier|recent|several|many)\s+(?:studies|work|reports)\s+"
+                                   r"(?:have\s+)?(?:showed|shown|demonstrated|reported|found)|it\s+is\s+(?:well\s+)?"
+                                   r"(?:known|established))", re.IGNORECASE)),
+]
+CITATION_RANK = {name: rank for rank, (name, _) in enumerate(CITATION_CUES)}
+CITATION_RANK["cites"] = len(CITATION_CUES)
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\x00(\[])")
+MARKER_RE = re.compile(r"\x00(\d+)\x01")
+WHITESPACE_RE = re.compile(r"\s+")
+DOI_RE = re.compile(r"\b(10\.\d{4,9}/\S+)")
+ORCID_RE = re.compile(r"(\d{4}-\d{4}-\d{4}-\d{3}[\dX])", re.IGNORECASE)
+ISSN_RE = re.compile(r"^(\d{4})-?(\d{3}[\dX])$", re.IGNORECASE)
+# elements whose text is not running text of a paragraph
+SKIP_TEXT = {"table-wrap", "fig", "disp-formula", "supplementary-material", "table", "alternatives"}
+
+
+class JatsError(ValueError):
+    pass
+
+
+def _local(tag) -> str:
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+def _clean(text: str) -> str:
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+def _text(elem) -> str:
+    return _clean("".join(elem.itertext()))
+
+
+def _shorten(text: str, limit: int) -> str:
+    """Text cut at a word boundary to at most `limit` characters"""
+    if len(text) <= limit:
+        return text
+    return text[:limit - 1].rsplit(" ", 1)[0].rstrip(",;:") + "…"
+
+
+def _statement(text: str):
+    """A goal or hypothesis sentence within the template's length limits, or None"""
+    text = _clean(MARKER_RE.sub("", text))
+    return _shorten(text, MAX_STATEMENT) if len(text) >= MIN_STATEMENT else None
+
+
+def doi_url(value: str):
+    """https://doi.org/ URL of a DOI given bare, as doi:... or as a URL, or None"""
+    match = DOI_RE.search(value or "")
+    return DOI_URL + match.group(1).rstrip(".,;") if match else None
+
+
+def orcid_url(value: str):
+    match = ORCID_RE.search(value or "")
+    return ORCID_URL + match.group(1).upper() if match else None
+
+
+def _marked_text(elem, markers) -> str:
+    """Text of a paragraph with \\x00<n>\\x01 in place of its n-th citation (markers[n] = cited reference IDs)"""
+    parts = [elem.text or ""]
+    for child in elem:
+        tag = _local(child.tag)
+        if tag == "xref" and child.get("ref-type") == "bibr":
+            markers.append((child.get("rid") or "").split())
+            parts.append(f"\x00{len(markers) - 1}\x01")
+        elif tag not in SKIP_TEXT:
+            parts.append(_marked_text(child, markers))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def _section_kinds(sec_type: str = None, title: str = None):
+    if sec_type:
+        kinds = SECTION_TYPES.get(sec_type.lower())
+        if kinds:
+            return kinds
+    kinds = set()
+    for name, pattern in SECTION_TITLES:
+        if title and pattern.search(title):
+            kinds.add(name)
+    return kinds
+
+
+def citation_type(sentence: str, kinds) -> str:
+    """CiTO property (local name) suggested by a sentence citing a paper in sections of `kinds`"""
+    if "data" in kinds:
+        return "usesDataFrom"
+    for name, pattern in CITATION_CUES:
+        if pattern.search(sentence):
+            return name
+    if "methods" in kinds:
+        return "usesMethodIn"
+    return "cites"
+
+
+def _reference_uri(ref) -> str:
+    ids = {}
+    for elem in ref.iter():
+        tag = _local(elem.tag)
+        if tag == "pub-id":
+            ids.setdefault(elem.get("pub-id-type"), _text(elem))
+        elif tag == "ext-link" and elem.get("ext-link-type") == "doi":
+            ids.setdefault("doi", _text(elem) or elem.get("{http://www.w3.org/1999/xlink}href", ""))
+    if ids.get("doi") and doi_url(ids["doi"]):
+        return doi_url(ids["doi"])
+    if ids.get("pmid", "").isdigit():
+        return f"{PUBMED_URL}{ids['pmid']}/"
+    return None
+
+
+def _date(elem):
+    parts = {_local(child.tag): _text(child) for child in elem}
+    if not parts.get("year", "").isdigit():
+        return None
+    month = parts.get("month", "")
+    day = parts.get("day", "")
+    month = int(month) if month.isdigit() and 1 <= int(month) <= 12 else 1
+    day = int(day) if day.isdigit() and 1 <= int(day) <= 31 else 1
+    return f"{int(parts['year']):04d}-{month:02d}-{day:02d}"
+
+
+def parse_article(source, topics=None) -> dict:
+    """Paper record of a JATS article (file name or binary file object), read in one streaming pass"""
+    ids, dates, issns, authors, keywords = {}, [], [], [], []
+    title = abstract = goal = hypothesis = None
+    present = set()
+    references, mentions = {}, {}
+    stack, sections = [], []  # open element tags; [kinds or None] of open body/back sections
+    markers = []
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        tag = _local(elem.tag)
+        if event == "start":
+            stack.append(tag)
+            if tag == "sec" and ("body" in stack or "back" in stack) and "sub-article" not in stack:
+                kinds = _section_kinds(elem.get("sec-type"))
+                sections.append([kinds or None])
+            continue
+        stack.pop()
+        if "sub-article" in stack or tag == "sub-article":
+            # reviews and replies carry their own front matter
+            if tag == "sub-article":
+                elem.clear()
+            continue
+        in_meta = "article-meta" in stack
+
+        if tag == "article-id" and in_meta:
+            ids.setdefault(elem.get("pub-id-type"), _text(elem))
+        elif tag == "article-title" and in_meta and stack[-1] == "title-group" and title is None:
+            title = _text(elem)
+        elif tag == "abstract" and in_meta and abstract is None and elem.get("abstract-type") in (None, "summary"):
+            paragraphs = []
+            for child in elem.iter():
+                child_tag = _local(child.tag)
+                if child_tag == "sec":
+                    heading = next((_text(t) for t in child if _local(t.tag) == "title"), "")
+                    body = _clean(" ".join(_text(p) for p in child if _local(p.tag) == "p"))
+                    if goal is None and GOAL_TITLE_RE.search(heading):
+                        goal = _statement(body)
+                    elif hypothesis is None and HYPOTHESIS_TITLE_RE.search(heading):
+                        hypothesis = _statement(body)
+                elif child_tag == "p":
+                    paragraphs.append(_text(child))
+            text = _clean(" ".join(paragraphs))
+            for sentence in SENTENCE_RE.split(text):
+                if goal is None and GOAL_RE.search(sentence):
+                    goal = _statement(sentence)
+                if hypothesis is None and HYPOTHESIS_RE.search(sentence):
+                    hypothesis = _statement(sentence)
+            if len(text) >= MIN_ABSTRACT:
+                abstract = _shorten(text, MAX_ABSTRACT)
+        elif tag == "contrib" and in_meta and elem.get("contrib-type", "author") == "author":
+            orcid = None
+            name = ""
+            for child in elem.iter():
+                child_tag = _local(child.tag)
+                if child_tag == "contrib-id" and child.get("contrib-id-type") == "orcid":
+                    orcid = orcid_url(_text(child))
+                elif child_tag in ("name", "string-name") and not name:
+                    given = next((_text(c) for c in child if _local(c.tag) == "given-names"), "")
+                    surname = next((_text(c) for c in child if _local(c.tag) == "surname"), "")
+                    name = _clean(f"{given} {surname}") or _text(child)
+                elif child_tag == "collab" and not name:
+                    name = _text(child)
+            if orcid and len(name) >= 2:
+                authors.append({"orcid": orcid, "name": _shorten(name, MAX_AUTHOR_NAME)})
+        elif tag == "pub-date" and in_meta:
+            date = _date(elem)
+            if date:
+                date_type = elem.get("pub-type") or elem.get("date-type") or elem.get("publication-format") or ""
+                dates.append((DATE_TYPES.get(date_type, 3), date))
+        elif tag == "issn" and "journal-meta" in stack:
+            match = ISSN_RE.match(_text(elem))
+            if match:
+                issns.append((0 if elem.get("pub-type") == "epub" or elem.get("publication-format") == "electronic"
+                              else 1, f"{match.group(1)}-{match.group(2).upper()}"))
+        elif tag in ("kwd", "subject") and in_meta:
+            keyword = _text(elem)
+            if keyword and keyword not in keywords:
+                keywords.append(keyword)
+
+        elif tag == "title" and stack and stack[-1] == "sec" and sections and sections[-1][0] is None:
+            inherited = next((kinds for kinds, in reversed(sections[:-1]) if kinds), set())
+            sections[-1][0] = _section_kinds(title=_text(elem)) or inherited
+        elif tag == "p" and ("body" in stack or "back" in stack) and "ref-list" not in stack:
+            kinds = next((kinds for kinds, in reversed(sections) if kinds), set())
+            del markers[:]
+            for sentence in SENTENCE_RE.split(_clean(_marked_text(elem, markers))):
+                if "introduction" in kinds or not sections:
+                    if goal is None and GOAL_RE.search(sentence):
+                        goal = _statement(sentence)
+                    if hypothesis is None and HYPOTHESIS_RE.search(sentence):
+                        hypothesis = _statement(sentence)
+                cited = MARKER_RE.findall(sentence)
+                if not cited:
+                    continue
+                kind = citation_type(MARKER_RE.sub("", sentence), kinds)
+                for number in cited:
+                    for rid in markers[int(number)]:
+                        if CITATION_RANK[kind] < CITATION_RANK[mentions.get(rid, "cites")] or rid not in mentions:
+                            mentions[rid] = kind
+            if "body" in stack:
+                elem.clear()
+        elif tag == "sec" and ("body" in stack or "back" in stack):
+            kinds = sections.pop()[0]
+            if kinds and "body" in stack:
+                present |= kinds
+            if "body" in stack:
+                elem.clear()
+        elif tag == "ref" and "ref-list" in stack:
+            uri = _reference_uri(elem)
+            if uri and elem.get("id"):
+                references[elem.get("id")] = uri
+            elem.clear()
+
+    paper = doi_url(ids.get("doi")) or (
+        f"{PMC_URL}PMC{ids['pmc'].removeprefix('PMC')}/" if ids.get("pmc") else
+        f"{PUBMED_URL}{ids['pmid']}/" if ids.get("pmid", "").isdigit() else None)
+    if paper is None:
+        raise JatsError("No DOI, PMC or PubMed ID")
+    if not title or len(title) < 5:
+        raise JatsError(f"No article title for {paper}")
+    if not dates:
+        raise JatsError(f"No publication date for {paper}")
+
+    citations, seen = [], set()
+    for rid, uri in references.items():
+        if uri not in seen and uri != paper:
+            seen.add(uri)
+            citations.append({"type": CITO + mentions.get(rid, "cites"), "paper": uri})
+    fields = []
+    if topics is not None:
+        for keyword in keywords:
+            found = topics.lookup(keyword)
+            if found and topics.resolve(found[0]) not in fields:
+                fields.append(topics.resolve(found[0]))
+    return {
+        "paper": paper,
+        "title": _shorten(title, MAX_TITLE),
+        "abstract": abstract,
+        "date": min(dates)[1],
+        "journal": ISSN_URL + min(issns)[1] if issns else None,
+        "authors": authors,
+        "sections": {name: name in present for name in SECTIONS},
+        "goal": goal,
+        "hypothesis": hypothesis,
+        "citations": citations,
+        "keywords": keywords,
+        "fields": fields,
+    }
+
+
+def iter_sources(paths):
+    """Yield (name, file name or bytes) of every article of files, directories and tar archives"""
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            for child in sorted(path.rglob("*")):
+                if child.is_file() and _is_article(child.name) or child.name.endswith(ARCHIVE_SUFFIXES):
+                    yield from iter_sources([child])
+        elif path.name.endswith(ARCHIVE_SUFFIXES):
+            with tarfile.open(path, "r:*") as archive:
+                for member in archive:
+                    if member.isfile() and _is_article(member.name):
+                        yield f"{path}:{member.name}", archive.extractfile(member).read()
+        else:
+            yield str(path), str(path)
+
+
+def _is_article(name: str) -> bool:
+    return name.endswith(ARTICLE_SUFFIXES) or name.endswith(tuple(s + ".gz" for s in ARTICLE_SUFFIXES))
+
+
+def _open_source(name: str, source):
+    data = source if isinstance(source, bytes) else None
+    if name.endswith(".gz"):
+        return gzip.GzipFile(fileobj=io.BytesIO(data)) if data is not None else gzip.open(source, "rb")
+    return io.BytesIO(data) if data is not None else source
+
+
+_topics = None
+
+
+def _init_worker(topics_path):
+    global _topics
+    if topics_path:
+        from topic_autocomplete import TopicIndex
+        _topics = TopicIndex(topics_path)
+
+
+def parse_batch(sources):
+    """Records of a batch of (name, source); an article that cannot be read gives an error record"""
+    records = []
+    for name, source in sources:
+        try:
+            records.append({**parse_article(_open_source(name, source), _topics), "source": name})
+        except (ET.ParseError, JatsError, OSError) as e:
+            records.append({"source": name, "error": str(e)})
+    return records
+
+
+def parse_sources(sources, workers: int = None, batch_size: int = BATCH_SIZE, topics: Path = None):
+    """Yield the records of (name, source) pairs in order, parsing batches on a process pool"""
+    workers = workers or os.cpu_count()
+    sources = iter(sources)
+    if workers == 1:
+        _init_worker(topics)
+        while batch := list(islice(sources, batch_size)):
+            yield from parse_batch(batch)
+        return
+    in_flight = deque()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(topics,)) as pool:
+        while batch := list(islice(sources, batch_size)):
+            in_flight.append(pool.submit(parse_batch, batch))
+            if len(in_flight) >= 2 * workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def main():
+    """Parse JATS XML articles into paper records (JSONL), or build paper nanopubs from them."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("inputs", nargs="+", type=Path, help="JATS files, directories or tar archives of them")
+    parser.add_argument("--output", type=Path, help="JSONL file of paper records (default: standard output)")
+    parser.add_argument("--workers", type=int, help="parser processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="articles per parser task")
+    parser.add_argument("--topics", type=Path,
+                        help="topic index (topic_autocomplete.py) to turn keywords into research fields")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="build, sign and store a paper nanopub per article instead")
+    parser.add_argument("--output-dir", type=Path, default=Path("signed_nanopubs"), help="with --pipeline")
+    parser.add_argument("--sign-workers", type=int, help="with --pipeline")
+    parser.add_argument("--shards", type=int, help="with --pipeline: write compressed shards (see sharded_output.py)")
+    parser.add_argument("--journal", type=Path,
+                        help="with --pipeline: journal file to resume an interrupted run (same inputs, same order)")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    records = parse_sources(iter_sources(args.inputs), args.workers, args.batch_size, args.topics)
+    parsed_count = failed = 0
+
+    def parsed():
+        nonlocal parsed_count, failed
+        for record in records:
+            if "error" in record:
+                print(f"✗ {record['source']}: {record['error']}", file=sys.stderr)
+                failed += 1
+            else:
+                parsed_count += 1
+                yield record
+
+    if args.pipeline:
+        from create_paper_template_and_publish import create_memory_profile
+        from nanopub_pipeline import NanopubPipeline
+        from synthetic_workload import build_paper
+
+        profile = create_memory_profile(
+            name="Anne Fouilloux",
+            orcid_id="https://orcid.org/0000-0002-1784-2920"
+        )
+        pipeline = NanopubPipeline(
+            build=lambda record: build_paper(record, profile),
+            profile=profile,
+            output_dir=args.output_dir,
+            sign_workers=args.sign_workers,
+            journal=args.journal,
+            shards=args.shards,
+        )
+        pipeline.run(parsed(), progress_every=10)
+        print(f"\nProcessed {parsed_count} articles in {time.monotonic() - start:.1f}s ({failed} not parsed)")
+        print(pipeline.report())
+        return
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for record in parsed():
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if args.output:
+            out.close()
+    if args.output:
+        elapsed = time.monotonic() - start
+        print(f"✓ Parsed {parsed_count} articles in {elapsed:.1f}s "
+              f"({parsed_count / max(elapsed, 1e-9) * 3600:,.0f} articles/hour)"
+              + (f", {failed} not parsed" if failed else ""))
+
+
+if __name__ == "__main__":
+    main()
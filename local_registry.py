@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a nanopub registry/server, and a load generator to measure
+publishing throughput and latency against it without touching real servers.
+
+The registry accepts nanopubs POSTed as TriG (like nanopub's publish()),
+verifies their trusty URI and signature, stores them and serves them back with
+GET /<artefact> (or /<artefact>.trig). Latency and errors can be injected to
+rehearse slow or flaky servers.
+"""
+
+import argparse
+import random
+import statistics
+import threading
+import time
+from base64 import decodebytes
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import cycle, islice
+from pathlib import Path
+
+import requests
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import pkcs1_15
+from rdflib import ConjunctiveGraph
+from nanopub import Nanopub
+from nanopub.namespaces import NPX
+from nanopub.trustyuri.rdf import RdfHasher, RdfUtils
+
+from aida_records import iter_nanopub_files
+
+_verify_lock = threading.Lock()
+
+
+def verify_nanopub(np: Nanopub):
+    """Check the trusty URI and the RSA signature of a parsed nanopub. Raises ValueError if either is invalid."""
+    # nanopub's has_valid_signature ignores the result of PKCS1_v1_5.verify, which
+    # returns False instead of raising, so a forged signature would pass. The
+    # signature covers every quad but the npx:hasSignature one.
+    namespace = str(np.metadata.namespace)
+    trusty = RdfHasher.make_hash(RdfUtils.get_quads(np.rdf), baseuri=namespace, hashstr=" ")
+    if trusty != np.source_uri.rsplit("/", 1)[-1]:
+        raise ValueError(f"Invalid nanopub {np.source_uri}: its trusty artefact should be {trusty}")
+    quads = [quad for quad in RdfUtils.get_quads(np.rdf) if quad[2] != NPX.hasSignature]
+    normalized = RdfHasher.normalize_quads(quads, baseuri=namespace, hashstr=" ")
+    try:
+        key = RSA.import_key(decodebytes(str(np.metadata.public_key).encode()))
+        pkcs1_15.new(key).verify(SHA256.new(normalized.encode()), decodebytes(str(np.metadata.signature).encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid nanopub {np.source_uri}: the signature does not match its public key")
+
+
+class NanopubRegistry:
+    """Verified nanopub storage, in memory or in a directory of TriG files"""
+
+    def __init__(self, storage: Path = None, verify: bool = True):
+        self.storage = Path(storage) if storage else None
+        self.verify = verify
+        self.nanopubs = {}
+        self.lock = threading.Lock()
+        self.counts = {"accepted": 0, "duplicate": 0, "rejected": 0, "injected_errors": 0}
+        if self.storage:
+            self.storage.mkdir(parents=True, exist_ok=True)
+
+    def add(self, trig: str):
+        """Verify and store a signed nanopub, return its URI. Raises ValueError if invalid."""
+        g = ConjunctiveGraph()
+        try:
+            g.parse(data=trig, format="trig")
+            # rdflib's SPARQL parser (used by nanopub to extract the metadata) is not thread-safe
+            with _verify_lock:
+                np = Nanopub(rdf=g)
+        except Exception as e:
+            raise ValueError(f"Cannot parse nanopub: {e}")
+        if not np.source_uri or not np.metadata.signature:
+            raise ValueError("Nanopub is not signed")
+        if self.verify:
+            verify_nanopub(np)
+        artefact = np.source_uri.rsplit("/", 1)[-1]
+        with self.lock:
+            if self.get(artefact) is not None:
+                self.counts["duplicate"] += 1
+                return np.source_uri
+            if self.storage:
+                (self.storage / f"{artefact}.trig").write_text(trig, encoding="utf-8")
+            else:
+                self.nanopubs[artefact] = trig
+            self.counts["accepted"] += 1
+        return np.source_uri
+
+    def get(self, artefact: str):
+        if self.storage:
+            path = self.storage / f"{artefact}.trig"
+            return path.read_text(encoding="utf-8") if path.exists() else None
+        return self.nanopubs.get(artefact)
+
+
+def make_handler(registry: NanopubRegistry, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+    """Request handler class bound to a registry and fault-injection settings"""
+
+    class RegistryHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, body: str = "", content_type: str = "text/plain"):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _inject(self):
+            """Apply the configured latency and return True if this request should fail"""
+            delay = latency + (random.uniform(-jitter, jitter) if jitter else 0.0)
+            if delay > 0:
+                time.sleep(delay)
+            if error_rate and random.random() < error_rate:
+                with registry.lock:
+                    registry.counts["injected_errors"] += 1
+                self._reply(503, "Injected error\n")
+                return True
+            return False
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+            if self._inject():
+                return
+            try:
+                uri = registry.add(body)
+            except ValueError as e:
+                with registry.lock:
+                    registry.counts["rejected"] += 1
+                self._reply(400, f"{e}\n")
+                return
+            self._reply(201, f"{uri}\n")
+
+        def do_GET(self):
+            if self._inject():
+                return
+            artefact = self.path.strip("/").rsplit("/", 1)[-1]
+            if artefact == "":
+                self._reply(200, "".join(f"{key}: {value}\n" for key, value in registry.counts.items()))
+                return
+            trig = registry.get(artefact.removesuffix(".trig"))
+            if trig is None:
+                self._reply(404, "Not found\n")
+            else:
+                self._reply(200, trig, "application/trig")
+
+        def log_message(self, format, *args):
+            pass
+
+    return RegistryHandler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8080, storage: Path = None, verify: bool = True,
+          latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+    """Create the registry HTTP server (call serve_forever() on it, or run it in a thread)"""
+    registry = NanopubRegistry(storage, verify)
+    server = ThreadingHTTPServer((host, port), make_handler(registry, latency, jitter, error_rate))
+    server.daemon_threads = True
+    server.registry = registry
+    return server
+
+
+def percentile(sorted_values, fraction: float):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def load_test(url: str, trigs, count: int, concurrency: int = 16):
+    """POST `count` nanopubs (cycling through `trigs`) with `concurrency` clients, return the statistics"""
+    local = threading.local()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def publish(trig):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.monotonic()
+        try:
+            r = local.session.post(url, headers={"Content-Type": "application/trig"}, data=trig.encode("utf-8"))
+            r.raise_for_status()
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        with lock:
+            latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(publish, islice(cycle(trigs), count)))
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    return {
+        "published": len(latencies),
+        "errors": len(errors),
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p90": percentile(latencies, 0.90),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def main():
+    """Run the local registry, or generate publishing load against a registry."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("serve", help="run the local registry")
+    run.add_argument("--host", default="127.0.0.1")
+    run.add_argument("--port", type=int, default=8080)
+    run.add_argument("--storage", type=Path, help="directory to store nanopubs in (default: memory)")
+    run.add_argument("--no-verify", action="store_true", help="skip trusty URI and signature checks")
+    run.add_argument("--latency", type=float, default=0.0, help="added latency per request in seconds")
+    run.add_argument("--jitter", type=float, default=0.0, help="random +/- variation of the latency in seconds")
+    run.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+
+    load = sub.add_parser("load", help="publish signed nanopubs concurrently and report latency percentiles")
+    load.add_argument("paths", nargs="+", type=Path, help="signed .trig files or directories")
+    load.add_argument("--url", default="http://127.0.0.1:8080/")
+    load.add_argument("--count", type=int, default=1000)
+    load.add_argument("--concurrency", type=int, default=16)
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = serve(args.host, args.port, args.storage, not args.no_verify,
+                       args.latency, args.jitter, args.error_rate)
+        print(f"✓ Local nanopub registry listening on http://{args.host}:{args.port}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            print(", ".join(f"{key}: {value}" for key, value in server.registry.counts.items()))
+        return
+
+    trigs = [path.read_text(encoding="utf-8") for path in iter_nanopub_files(args.paths) if path.suffix == ".trig"]
+    if not trigs:
+        parser.error("No signed .trig files found")
+    stats = load_test(args.url, trigs, args.count, args.concurrency)
+    print(f"✓ Published {stats['published']} nanopubs ({stats['errors']} errors) in {stats['seconds']:.2f}s: "
+          f"{stats['throughput']:.1f} nanopubs/s")
+    print(f"Latency (ms): mean {stats['mean'] * 1000:.1f}, p50 {stats['p50'] * 1000:.1f}, "
+          f"p90 {stats['p90'] * 1000:.1f}, p99 {stats['p99'] * 1000:.1f}, max {stats['max'] * 1000:.1f}")
+
+
+if __name__ == "__main__":
+    main()
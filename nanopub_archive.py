@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Compact binary archive of a nanopub corpus, in the spirit of HDT.
+
+TriG repeats the same IRIs in every file: the ntemplate terms, the CiTO
+predicates, the author's ORCID, the namespace prefixes. An archive stores every
+distinct term once, in one of three dictionaries (subjects and objects,
+predicates, graph names), and every quad as integer IDs:
+
+- a dictionary is the sorted list of the terms' N3 forms (as in quad_store.py),
+  front-coded in blocks of 16: the first term of a block is stored whole, the
+  others as the length of the prefix they share with the previous term plus
+  the rest. A term's ID is its position, found by binary search over the
+  blocks' first terms;
+- the quads are sorted by graph, subject, predicate and object and stored as
+  three columns of IDs (1, 2 or 4 bytes wide, whatever the largest ID needs),
+  with the first row of every graph, so the quads of a graph are one slice;
+- three permutations of the rows (SPO, POS, OSP) answer every triple pattern
+  with a binary search, like the indexes of quad_store.py.
+
+The file is memory-mapped and read in place: opening it costs nothing, a
+lookup only touches the pages it reads, and nothing is decompressed.
+`to_dataset()` reloads a whole archive, or some graphs of it, without parsing
+any TriG; each distinct term is decoded once.
+
+    python nanopub_archive.py corpus.npa build signed_nanopubs
+    python nanopub_archive.py corpus.npa match --p http://purl.org/spar/cito/usesDataFrom
+    python nanopub_archive.py corpus.npa get http://purl.org/np/RA...
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from rdflib import Dataset, URIRef
+from rdflib.util import from_n3
+
+from aida_records import NP, iter_nanopub_files
+
+MAGIC = b"NPARCH01"
+# magic, counts (quads, terms, predicates, graphs, block size, widths of S, P, O) and 13 section offsets
+HEADER = struct.Struct("<8s8Q13Q")
+BLOCK = 16
+SHARD_SUFFIXES = (".trig.gz", ".trig.zst")
+NP_PARTS = (NP.hasAssertion, NP.hasProvenance, NP.hasPublicationInfo)
+
+
+def _padded(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 8)
+
+
+def _typecode(largest: int) -> str:
+    return "B" if largest < 1 << 8 else "H" if largest < 1 << 16 else "I"
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(blob, position: int):
+    value = shift = 0
+    while True:
+        byte = blob[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def front_code(keys, block: int = BLOCK):
+    """(block offsets, blob) of sorted byte strings, front-coded in blocks"""
+    offsets, blob = array("Q"), bytearray()
+    previous = b""
+    for i, key in enumerate(keys):
+        if i % block == 0:
+            offsets.append(len(blob))
+            blob += _varint(len(key)) + key
+        else:
+            shared = 0
+            limit = min(len(key), len(previous))
+            while shared < limit and key[shared] == previous[shared]:
+                shared += 1
+            blob += _varint(shared) + _varint(len(key) - shared) + key[shared:]
+        previous = key
+    offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+class _Dictionary:
+    """Read-only front-coded dictionary: ID <-> byte string"""
+
+    def __init__(self, count: int, block: int, offsets, blob):
+        self.count = count
+        self.block = block
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return self.count
+
+    def _first(self, block: int) -> bytes:
+        length, position = _read_varint(self.blob, self.offsets[block])
+        return bytes(self.blob[position:position + length])
+
+    def _scan(self, block: int):
+        """Yield the strings of a block in order"""
+        key = self._first(block)
+        yield key
+        position = self.offsets[block]
+        length, position = _read_varint(self.blob, position)
+        position += length
+        end = self.offsets[block + 1]
+        while position < end:
+            shared, position = _read_varint(self.blob, position)
+            length, position = _read_varint(self.blob, position)
+            key = key[:shared] + bytes(self.blob[position:position + length])
+            position += length
+            yield key
+
+    def __getitem__(self, term_id: int) -> bytes:
+        if not 0 <= term_id < self.count:
+            raise IndexError(term_id)
+        for i, key in enumerate(self._scan(term_id // self.block)):
+            if i == term_id % self.block:
+                return key
+
+    def find(self, key: bytes):
+        """ID of a string, or None"""
+        lo, hi = 0, len(self.offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._first(mid) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        for i, candidate in enumerate(self._scan(lo - 1)):
+            if candidate == key:
+                return (lo - 1) * self.block + i
+            if candidate > key:
+                return None
+        return None
+
+
+def _sort_rows(columns):
+    """Row numbers ordered by the given columns (the first is the most significant)"""
+    if numpy is not None and columns and len(columns[0]):
+        return array("I", numpy.lexsort([numpy.frombuffer(column, dtype=numpy.uint32)
+                                         for column in reversed(columns)]).astype(numpy.uint32).tobytes())
+    return array("I", sorted(range(len(columns[0])), key=lambda row: tuple(column[row] for column in columns)))
+
+
+def _read_quads(path: str):
+    """N3 forms (s, p, o, g) of every quad of a nanopub file or shard"""
+    if path.endswith(SHARD_SUFFIXES):
+        from sharded_output import iter_shard
+
+        documents = [(trig, "trig") for _, trig in iter_shard(path)]
+    else:
+        documents = [(Path(path).read_text(encoding="utf-8"), "nquads" if path.endswith(".nq") else "trig")]
+    quads = []
+    for data, fmt in documents:
+        ds = Dataset()
+        ds.parse(data=data, format=fmt)
+        quads.extend((s.n3(), p.n3(), o.n3(), g.n3()) for s, p, o, g in ds.quads((None, None, None, None)))
+    return quads
+
+
+def iter_sources(paths):
+    """Nanopub files and shard files of files and directories"""
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            yield from iter_nanopub_files([path])
+            for suffix in SHARD_SUFFIXES:
+                yield from sorted(path.rglob(f"*{suffix}"))
+        else:
+            yield path
+
+
+def build_archive(paths, output: Path, workers: int = None) -> dict:
+    """Parse nanopub files and shards on a process pool into an archive file; return its counts"""
+    files = [str(path) for path in iter_sources(paths)]
+    dictionaries = ({}, {}, {})  # N3 -> provisional ID, for terms, predicates and graphs
+    columns = tuple(array("I") for _ in range(4))  # s, p, o, g in provisional IDs
+    workers = max(1, min(workers or os.cpu_count(), len(files) or 1))
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        results = pool.map(_read_quads, files, chunksize=32) if pool else map(_read_quads, files)
+        terms, predicates, graphs = dictionaries
+        for quads in results:
+            for s, p, o, g in quads:
+                columns[0].append(terms.setdefault(s, len(terms)))
+                columns[1].append(predicates.setdefault(p, len(predicates)))
+                columns[2].append(terms.setdefault(o, len(terms)))
+                columns[3].append(graphs.setdefault(g, len(graphs)))
+    finally:
+        if pool:
+            pool.shutdown()
+
+    # final IDs are the positions in the sorted dictionaries
+    sorted_keys, remaps = [], []
+    for dictionary in dictionaries:
+        keys = sorted((key.encode("utf-8"), provisional) for key, provisional in dictionary.items())
+        remap = array("I", bytes(4 * len(keys)))
+        for final, (_, provisional) in enumerate(keys):
+            remap[provisional] = final
+        sorted_keys.append([key for key, _ in keys])
+        remaps.append(remap)
+    s, p, o, g = (array("I", (remap[value] for value in column))
+                  for column, remap in zip(columns, (remaps[0], remaps[1], remaps[0], remaps[2])))
+
+    # rows in graph, subject, predicate, object order, without duplicates
+    order = _sort_rows([g, s, p, o])
+    rows, last = [], None
+    for row in order:
+        quad = (g[row], s[row], p[row], o[row])
+        if quad != last:
+            rows.append(quad)
+            last = quad
+    g, s, p, o = (array("I", (quad[i] for quad in rows)) for i in range(4))
+    graph_start = array("Q", [0] * (len(sorted_keys[2]) + 1))
+    for graph in g:
+        graph_start[graph + 1] += 1
+    for i in range(1, len(graph_start)):
+        graph_start[i] += graph_start[i - 1]
+    spo, pos, osp = _sort_rows([s, p, o]), _sort_rows([p, o, s]), _sort_rows([o, s, p])
+
+    widths = [_typecode(max(column, default=0)) for column in (s, p, o)]
+    sections = []
+    for keys in sorted_keys:
+        offsets, blob = front_code(keys)
+        sections += [offsets.tobytes(), blob]
+    sections += [array(code, column).tobytes() for code, column in zip(widths, (s, p, o))]
+    sections += [graph_start.tobytes(), spo.tobytes(), pos.tobytes(), osp.tobytes()]
+    offsets, position = [], HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position += len(_padded(section))
+
+    output = Path(output)
+    tmp = output.with_name(output.name + ".part")
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(rows), *(len(keys) for keys in sorted_keys), BLOCK,
+                            *(array(code).itemsize for code in widths), *offsets))
+        for section in sections:
+            f.write(_padded(section))
+    tmp.replace(output)
+    return {"files": len(files), "quads": len(rows), "terms": len(sorted_keys[0]),
+            "predicates": len(sorted_keys[1]), "graphs": len(sorted_keys[2]), "bytes": position}
+
+
+def _decode(n3: bytes):
+    text = n3.decode("utf-8")
+    # IRIs are most terms and need no unescaping
+    if text.startswith("<") and text.endswith(">"):
+        return URIRef(text[1:-1])
+    return from_n3(text)
+
+
+class NanopubArchive:
+    """Memory-mapped archive built by build_archive()"""
+
+    def __init__(self, path: Path, cache_size: int = 1 << 16):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, self.quads, n_terms, n_predicates, n_graphs, block, *rest = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a nanopub archive")
+        widths, offsets = rest[:3], rest[3:]
+        ends = offsets[1:] + [len(view)]
+        sections = [view[start:end] for start, end in zip(offsets, ends)]
+
+        def dictionary(count, offsets_section, blob):
+            blocks = (count + block - 1) // block
+            return _Dictionary(count, block, offsets_section[:8 * (blocks + 1)].cast("Q"), blob)
+
+        self.terms = dictionary(n_terms, sections[0], sections[1])
+        self.predicates = dictionary(n_predicates, sections[2], sections[3])
+        self.graphs = dictionary(n_graphs, sections[4], sections[5])
+        self.s, self.p, self.o = (section[:width * self.quads].cast({1: "B", 2: "H", 4: "I"}[width])
+                                  for section, width in zip(sections[6:9], widths))
+        self.graph_start = sections[9][:8 * (n_graphs + 1)].cast("Q")
+        self.spo, self.pos, self.osp = (section[:4 * self.quads].cast("I") for section in sections[10:13])
+        self._views = [view, *sections, self.terms.offsets, self.predicates.offsets, self.graphs.offsets,
+                       self.s, self.p, self.o, self.graph_start, self.spo, self.pos, self.osp]
+        self.term = lru_cache(maxsize=cache_size)(lambda term_id: _decode(self.terms[term_id]))
+        self.predicate = lru_cache(maxsize=cache_size)(lambda term_id: _decode(self.predicates[term_id]))
+        self.graph = lru_cache(maxsize=cache_size)(lambda term_id: _decode(self.graphs[term_id]))
+
+    def close(self):
+        for cache in (self.term, self.predicate, self.graph):
+            cache.cache_clear()
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.quads
+
+    def _range(self, index, columns, prefix):
+        """Slice lo..hi of an index whose rows start with the given IDs"""
+        def key(i):
+            row = index[i]
+            return tuple(column[row] for column in columns[:len(prefix)])
+
+        lo, hi = 0, len(index)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        start, hi = lo, len(index)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key(mid) <= prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return start, lo
+
+    def _rows(self, s, p, o, g):
+        """Row numbers that can match a pattern of IDs (None matches anything)"""
+        if g is not None:
+            return range(self.graph_start[g], self.graph_start[g + 1])
+        if s is not None:
+            index, columns, prefix = self.spo, (self.s, self.p, self.o), (s,) + ((p,) + ((o,) if o is not None
+                                                                                      else ()) if p is not None
+                                                                                 else ())
+        elif p is not None:
+            index, columns, prefix = self.pos, (self.p, self.o, self.s), (p,) + ((o,) if o is not None else ())
+        elif o is not None:
+            index, columns, prefix = self.osp, (self.o, self.s, self.p), (o,)
+        else:
+            return range(self.quads)
+        lo, hi = self._range(index, columns, prefix)
+        return (index[i] for i in range(lo, hi))
+
+    def _ids(self, s=None, p=None, o=None, g=None):
+        """IDs of the terms of a pattern, or None if a term is not in the archive"""
+        ids = []
+        for term, dictionary in ((s, self.terms), (p, self.predicates), (o, self.terms), (g, self.graphs)):
+            if term is None:
+                ids.append(None)
+                continue
+            term_id = dictionary.find(term.n3().encode("utf-8"))
+            if term_id is None:
+                return None
+            ids.append(term_id)
+        return ids
+
+    def match_ids(self, s=None, p=None, o=None, g=None):
+        """Yield the rows (s, p, o, g IDs) matching a pattern of rdflib terms"""
+        ids = self._ids(s, p, o, g)
+        if ids is None:
+            return
+        si, pi, oi, gi = ids
+        for row in self._rows(si, pi, oi, gi):
+            if (si is None or self.s[row] == si) and (pi is None or self.p[row] == pi) and \
+                    (oi is None or self.o[row] == oi):
+                graph = gi if gi is not None else bisect_right(self.graph_start, row) - 1
+                yield self.s[row], self.p[row], self.o[row], graph
+
+    def match(self, s=None, p=None, o=None, g=None):
+        """Yield the (s, p, o, g) quads matching a pattern (None matches anything)"""
+        for si, pi, oi, gi in self.match_ids(s, p, o, g):
+            yield self.term(si), self.predicate(pi), self.term(oi), self.graph(gi)
+
+    def count(self, s=None, p=None, o=None, g=None) -> int:
+        """Number of quads matching a pattern, without decoding any term"""
+        return sum(1 for _ in self.match_ids(s, p, o, g))
+
+    def graph_names(self):
+        """Yield the names of all graphs"""
+        for graph in range(len(self.graphs)):
+            yield self.graph(graph)
+
+    def to_dataset(self, graphs=None) -> Dataset:
+        """Dataset of the whole archive, or of the given graph names"""
+        ds = Dataset()
+        if graphs is None:
+            graph_ids = range(len(self.graphs))
+        else:
+            graph_ids = [self.graphs.find(URIRef(name).n3().encode("utf-8")) for name in graphs]
+        for graph in graph_ids:
+            if graph is None:
+                continue
+            context = ds.graph(self.graph(graph))
+            context.addN((self.term(self.s[row]), self.predicate(self.p[row]), self.term(self.o[row]), context)
+                         for row in range(self.graph_start[graph], self.graph_start[graph + 1]))
+        return ds
+
+    def nanopub(self, uri: str) -> Dataset:
+        """The four graphs of a nanopub, or None if the archive does not have it"""
+        found = [(o, g) for _, p, o, g in self.match(s=URIRef(uri)) if p in NP_PARTS]
+        if not found:
+            return None
+        head = found[0][1]
+        return self.to_dataset([head] + [o for o, _ in found])
+
+
+def _parse_term(value: str):
+    if value is None:
+        return None
+    return from_n3(value) if value.startswith(("<", '"', "_:")) else URIRef(value)
+
+
+def main():
+    """Build a binary nanopub archive, or query one."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("archive", type=Path, help="archive file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="archive signed nanopub files, shards or directories")
+    build.add_argument("paths", nargs="+", type=Path)
+    build.add_argument("--workers", type=int, help="parser processes (default: all cores)")
+
+    match = sub.add_parser("match", help="print the quads of a pattern as N-Quads")
+    for position in ("s", "p", "o", "g"):
+        match.add_argument(f"--{position}", help="IRI, or a term in N3 form (\"text\"@en, _:b0)")
+    match.add_argument("--count", action="store_true", help="only print the number of quads")
+
+    get = sub.add_parser("get", help="print a nanopub as TriG")
+    get.add_argument("uri")
+
+    sub.add_parser("stats", help="print the counts of the archive")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.monotonic()
+        original = sum(path.stat().st_size for path in iter_sources(args.paths))
+        counts = build_archive(args.paths, args.archive, args.workers)
+        print(f"✓ {counts['quads']} quads of {counts['graphs']} graphs from {counts['files']} files, "
+              f"{original / 1e6:.1f} MB -> {counts['bytes'] / 1e6:.1f} MB in {time.monotonic() - start:.1f}s")
+        return
+
+    with NanopubArchive(args.archive) as archive:
+        if args.command == "match":
+            pattern = {position: _parse_term(getattr(args, position)) for position in ("s", "p", "o", "g")}
+            if args.count:
+                print(archive.count(**pattern))
+                return
+            for quad in archive.match(**pattern):
+                print(" ".join(term.n3() for term in quad) + " .")
+        elif args.command == "get":
+            ds = archive.nanopub(args.uri)
+            if ds is None:
+                parser.error(f"{args.uri} is not in {args.archive}")
+            print(ds.serialize(format="trig"))
+        else:
+            print(f"quads      {len(archive)}")
+            print(f"terms      {len(archive.terms)}")
+            print(f"predicates {len(archive.predicates)}")
+            print(f"graphs     {len(archive.graphs)}")
+            print(f"bytes      {args.archive.stat().st_size}")
+
+
+if __name__ == "__main__":
+    main()
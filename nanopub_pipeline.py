@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+"""
+Pipelined build -> sign -> store -> publish runner for batches of nanopublications.
+
+The create_*_template_and_publish.py scripts run these steps strictly in sequence.
+Here every stage is a worker pool connected to the next one by a bounded queue:
+
+- build: threads calling the user's build function (returns an unsigned Nanopub, or its TriG)
+- sign: a process pool (signing is CPU bound); each worker parses the signing keys once
+- store: threads writing the signed TriG files, or appending them to compressed
+  shards with one shard writer per thread (see sharded_output.py), and adding
+  them to a quad store and to AIDA spatial, temporal or text indexes, optionally
+- publish: an asyncio loop posting to the nanopub server with bounded concurrency,
+  over a pool of kept-alive connections, optionally rate-limited, retrying
+  429/5xx answers with backoff (publishing a nanopub twice is harmless)
+
+Bounded queues give backpressure (a slow stage blocks the ones before it instead of
+buffering the whole batch in memory), so end-to-end throughput approaches that of
+the slowest stage. Each stage keeps throughput counters.
+
+With a journal (see batch_journal.py) every state change of every item is
+recorded, and a restarted run skips finished items, stores items that were
+already signed (their signed TriG is spooled next to the output as .trig.part)
+and publishes items that were already stored, without signing anything twice.
+With shards, the spooled TriG is kept until the item is published, each append
+is flushed before it is journaled, and a restarted run moves the nanopubs of the
+crashed run's unsealed shards to its own shards (see sharded_output.salvage), so
+that every nanopub ends up in them once.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from nanopub import Profile
+from nanopub.definitions import NANOPUB_SERVER_LIST, NANOPUB_TEST_SERVER
+
+from batch_journal import BatchJournal, BUILT, SIGNED, STORED, PUBLISHED
+from key_pool import AuthorKey, KeyPool, sign_as, use_fast_metadata
+from pipeline_metrics import PipelineMetrics, TextfileExporter, serve_metrics
+from aida_spatial_index import AidaSpatialIndex
+from aida_temporal_index import AidaTemporalIndex
+from aida_text_index import AidaTextIndex
+from quad_store import SQLiteQuadStore
+from sharded_output import COMPRESSIONS, ShardWriter, salvage, write_manifest, writer_name
+
+_DONE = object()
+
+# Index kinds accepted by --index
+AIDA_INDEXES = {"spatial": AidaSpatialIndex, "temporal": AidaTemporalIndex, "text": AidaTextIndex}
+
+# Signing key and key pool of the current sign worker process (see _init_sign_worker)
+_worker_key = None
+_worker_pool = None
+
+
+class StageCounter:
+    """Throughput counters of one pipeline stage"""
+
+    def __init__(self, name: str, workers: int, metrics=None):
+        self.name = name
+        self.workers = workers
+        self.metrics = metrics
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.timed = 0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float = None, error: bool = False):
+        """Count one finished item, or one failed item (seconds is None if it was not timed)"""
+        with self._lock:
+            if self.started is None:
+                self.started = time.monotonic() - (seconds or 0.0)
+            self.finished = time.monotonic()
+            if seconds is not None:
+                self.busy += seconds
+                self.timed += 1
+            if error:
+                self.errors += 1
+            else:
+                self.items += 1
+        if self.metrics is not None:
+            self.metrics.observe(self.name, seconds, error)
+
+    @property
+    def throughput(self):
+        """Items per second of wall-clock time this stage was active"""
+        if not self.started or self.finished == self.started:
+            return 0.0
+        return self.items / (self.finished - self.started)
+
+    def __str__(self):
+        return (f"{self.name:<8} {self.items:>8} items {self.errors:>5} errors "
+                f"{self.throughput:>9.1f} items/s {self.busy / max(self.timed, 1) * 1000:>9.2f} ms/item "
+                f"({self.workers} workers)")
+
+
+def _init_sign_worker(profile_args, key_pool=None):
+    """Load the signing key (and key pool) once per sign worker process"""
+    global _worker_key, _worker_pool
+    use_fast_metadata()
+    if profile_args:
+        orcid_id, name, private_key, public_key = profile_args
+        _worker_key = AuthorKey(Profile(orcid_id=orcid_id, name=name, private_key=private_key, public_key=public_key))
+    if key_pool:
+        _worker_pool = KeyPool(key_pool)
+
+
+def _sign_trig(trig: str, orcid_id: str = None):
+    """Sign an unsigned nanopub given as TriG, return (elapsed, source URI, signed TriG)"""
+    # the build stage already added the generated-at-time and attribution triples,
+    # so signing must not add them a second time; with a key pool the attribution
+    # is re-stamped for the item's author
+    if orcid_id is not None:
+        return sign_as(trig, _worker_pool.get(orcid_id))
+    return sign_as(trig, _worker_key, stamp=False)
+
+
+def output_path(output_dir: Path, source_uri: str) -> Path:
+    """TriG file of a signed nanopub, named after its trusty URI artefact"""
+    return Path(output_dir) / f"{source_uri.rsplit('/', 1)[-1]}.trig"
+
+
+def spool_path(output_dir: Path, source_uri: str) -> Path:
+    """Signed but not yet stored nanopub, kept so that a resumed run does not re-sign it"""
+    return Path(output_dir) / f"{source_uri.rsplit('/', 1)[-1]}.trig.part"
+
+
+class NanopubPipeline:
+    """Runs build -> sign -> store -> publish over a batch of items"""
+
+    def __init__(self, build, profile: Profile, output_dir: Path, publish: bool = False,
+                 use_test_server: bool = True, server: str = None,
+                 build_workers: int = 2, sign_workers: int = None, store_workers: int = 4,
+                 publish_concurrency: int = 16, queue_size: int = 256, on_result=None,
+                 journal: Path = None, key_pool: Path = None, author=None, quad_store=None,
+                 metrics=None, publish_rate: float = None, publish_retries: int = 3,
+                 shards: int = None, compression: str = "gzip", indexes=()):
+        if profile is None and (key_pool is None or author is None):
+            raise ValueError("Either a profile or a key pool and an author function are required")
+        self.build = build
+        self.profile = profile
+        self.key_pool = key_pool
+        self.author = author
+        self.quad_store = quad_store
+        self.indexes = list(indexes)
+        self.output_dir = Path(output_dir)
+        self.shards = shards
+        self.compression = compression
+        self.writers = []
+        self.salvaged = set()
+        self.publish = publish
+        self.server = server or (NANOPUB_TEST_SERVER if use_test_server else NANOPUB_SERVER_LIST[0])
+        self.sign_workers = sign_workers or os.cpu_count()
+        self.publish_concurrency = publish_concurrency
+        self.publish_rate = publish_rate
+        self.publish_retries = publish_retries
+        self.on_result = on_result
+        self.journal = None
+        if journal is not None:
+            self.journal = BatchJournal(journal, final_state=PUBLISHED if publish else STORED)
+        self.skipped = 0
+        self.queues = {
+            "build": queue.Queue(queue_size),
+            "sign": queue.Queue(queue_size),
+            "store": queue.Queue(queue_size),
+            "publish": queue.Queue(queue_size),
+        }
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.queue_depths = self.queue_depths
+        self.counters = {
+            "build": StageCounter("build", build_workers, metrics),
+            "sign": StageCounter("sign", self.sign_workers, metrics),
+            "store": StageCounter("store", store_workers, metrics),
+            "publish": StageCounter("publish", publish_concurrency if publish else 0, metrics),
+        }
+
+    def queue_depths(self):
+        return {name: q.qsize() for name, q in self.queues.items()}
+
+    def _build_worker(self):
+        inbox, outbox = self.queues["build"], self.queues["sign"]
+        while (entry := inbox.get()) is not _DONE:
+            position, item = entry
+            start = time.monotonic()
+            try:
+                built = self.build(item)
+                trig = built if isinstance(built, str) else built.rdf.serialize(format="trig")
+            except Exception as e:
+                print(f"Error building nanopub for {item!r}: {e}")
+                self.counters["build"].record(time.monotonic() - start, error=True)
+                continue
+            self.counters["build"].record(time.monotonic() - start)
+            if self.journal:
+                self.journal.record(position, BUILT)
+            outbox.put((position, item, trig))
+
+    def _sign_dispatcher(self):
+        """Feed the process pool, keeping a bounded number of signatures in flight"""
+        inbox, outbox = self.queues["sign"], self.queues["store"]
+        in_flight = deque()
+        counter = self.counters["sign"]
+
+        def collect(future, position, item):
+            try:
+                elapsed, source_uri, trig = future.result()
+                if self.journal:
+                    spool_path(self.output_dir, source_uri).write_text(trig, encoding="utf-8")
+                    self.journal.record(position, SIGNED, source_uri)
+            except Exception as e:
+                print(f"Error signing nanopub for {item!r}: {e}")
+                counter.record(error=True)
+                return
+            counter.record(elapsed)
+            outbox.put((position, item, source_uri, trig))
+
+        profile_args = None
+        if self.profile is not None:
+            profile_args = (self.profile.orcid_id, self.profile.name, self.profile.private_key, self.profile.public_key)
+        # the build threads are already running: forking now could copy a lock one
+        # of them holds (e.g. the import lock) into a worker, so workers come from a forkserver
+        entry = None
+        try:
+            with ProcessPoolExecutor(
+                self.sign_workers,
+                mp_context=multiprocessing.get_context("forkserver"),
+                initializer=_init_sign_worker,
+                initargs=(profile_args, self.key_pool),
+            ) as pool:
+                while (entry := inbox.get()) is not _DONE:
+                    position, item, trig = entry
+                    try:
+                        orcid_id = self.author(item) if self.author else None
+                    except Exception as e:
+                        print(f"Error signing nanopub for {item!r}: {e}")
+                        counter.record(error=True)
+                        continue
+                    in_flight.append((pool.submit(_sign_trig, trig, orcid_id), position, item))
+                    entry = None
+                    if len(in_flight) >= 2 * self.sign_workers:
+                        collect(*in_flight.popleft())
+                while in_flight:
+                    collect(*in_flight.popleft())
+        except Exception as e:
+            # the pool itself failed (e.g. BrokenProcessPool): fail the signatures in flight
+            # and everything still to come, but keep taking items so the build stage never blocks
+            print(f"Sign workers failed: {e!r}")
+            while in_flight:
+                collect(*in_flight.popleft())
+            if entry is not None and entry is not _DONE:
+                print(f"Error signing nanopub for {entry[1]!r}: {e!r}")
+                counter.record(error=True)
+            if entry is not _DONE:
+                while (entry := inbox.get()) is not _DONE:
+                    print(f"Error signing nanopub for {entry[1]!r}: {e!r}")
+                    counter.record(error=True)
+
+    def _store_worker(self, index: int = 0):
+        inbox, outbox = self.queues["store"], self.queues["publish"]
+        writer = self.writers[index] if self.shards else None
+        while (entry := inbox.get()) is not _DONE:
+            position, item, source_uri, trig = entry
+            start = time.monotonic()
+            try:
+                if writer is not None:
+                    written = writer.bytes_written
+                    # flushed before it is journaled as stored, so that a restart finds it in the shard
+                    path = writer.write(source_uri, trig, flush=self.journal is not None)
+                    if self.journal:
+                        self.journal.record(position, STORED, source_uri)
+                        if not self.publish:
+                            spool_path(self.output_dir, source_uri).unlink(missing_ok=True)
+                else:
+                    path = output_path(self.output_dir, source_uri)
+                    if self.journal:
+                        os.replace(spool_path(self.output_dir, source_uri), path)
+                        self.journal.record(position, STORED, source_uri)
+                    else:
+                        path.write_text(trig, encoding="utf-8")
+                if self.quad_store is not None:
+                    # the quad store replaces what a file contributed when it is added again,
+                    # which would drop the other nanopubs of a shard
+                    self.quad_store.add_nanopub(trig, path=None if writer else str(path.resolve()))
+                for index in self.indexes:
+                    if writer:
+                        index.add_nanopub(trig, f"{path.resolve()}#{source_uri.rsplit('/', 1)[-1]}")
+                    else:
+                        index.add_nanopub(trig, str(path.resolve()), path.stat().st_mtime)
+                if self.metrics is not None:
+                    self.metrics.bytes_written.inc(writer.bytes_written - written if writer else path.stat().st_size)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Error storing {source_uri}: {e}")
+                self.counters["store"].record(time.monotonic() - start, error=True)
+                continue
+            self.counters["store"].record(time.monotonic() - start)
+            if self.publish:
+                outbox.put((position, item, source_uri, trig, path))
+            elif self.on_result:
+                self.on_result(item, source_uri, path)
+
+    async def _publish_loop(self):
+        inbox = self.queues["publish"]
+        loop = asyncio.get_running_loop()
+        session = requests.Session()
+        # one kept-alive connection per concurrent request (the default pool keeps 10)
+        adapter = HTTPAdapter(pool_maxsize=self.publish_concurrency, max_retries=Retry(
+            total=self.publish_retries, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504),
+            allowed_methods=None, respect_retry_after_header=True, raise_on_status=False))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        limit = asyncio.Semaphore(self.publish_concurrency)
+        interval = 1.0 / self.publish_rate if self.publish_rate else 0.0
+        next_slot = loop.time()
+        # blocking HTTP calls run on their own threads so they do not stall the event loop
+        executor = ThreadPoolExecutor(self.publish_concurrency, thread_name_prefix="publish")
+        tasks = set()
+
+        def post(trig):
+            r = session.post(self.server, headers={"Content-Type": "application/trig"}, data=trig.encode("utf-8"))
+            r.raise_for_status()
+
+        async def publish_one(position, item, source_uri, trig, path):
+            start = time.monotonic()
+            try:
+                await loop.run_in_executor(executor, post, trig)
+            except Exception as e:
+                print(f"Error publishing {source_uri}: {e}")
+                self.counters["publish"].record(time.monotonic() - start, error=True)
+            else:
+                self.counters["publish"].record(time.monotonic() - start)
+                if self.journal:
+                    self.journal.record(position, PUBLISHED, source_uri)
+                    if self.shards:
+                        spool_path(self.output_dir, source_uri).unlink(missing_ok=True)
+                if self.on_result:
+                    self.on_result(item, source_uri, path)
+            finally:
+                limit.release()
+
+        while (entry := await loop.run_in_executor(None, inbox.get)) is not _DONE:
+            await limit.acquire()
+            if interval:
+                # at most publish_rate requests start per second
+                now = loop.time()
+                if next_slot > now:
+                    await asyncio.sleep(next_slot - now)
+                next_slot = max(now, next_slot) + interval
+            task = asyncio.create_task(publish_one(*entry))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        executor.shutdown()
+        session.close()
+
+    def run(self, items, progress_every: float = None):
+        """Push all items through the pipeline and return the stage counters"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stages = [
+            ("build", self._build_worker, self.counters["build"].workers),
+            ("sign", self._sign_dispatcher, 1),
+            ("store", self._store_worker, self.counters["store"].workers),
+        ]
+        if self.publish:
+            stages.append(("publish", lambda: asyncio.run(self._publish_loop()), 1))
+
+        if self.shards:
+            run = writer_name()
+            self.writers = [ShardWriter(self.output_dir, self.shards, self.compression, f"{run}-{i}")
+                            for i in range(self.counters["store"].workers)]
+            if self.journal:
+                # the shards of a crashed run: their nanopubs are stored, journaled or not
+                self.salvaged = salvage(self.output_dir, self.writers[0])
+
+        threads = {}
+        for name, target, count in stages:
+            threads[name] = [threading.Thread(target=target, name=f"{name}-{i}", args=(i,) if name == "store" else (),
+                                              daemon=True) for i in range(count)]
+            for thread in threads[name]:
+                thread.start()
+
+        last_report = time.monotonic()
+        for position, item in enumerate(items):
+            self._submit(position, item)
+            if progress_every and time.monotonic() - last_report >= progress_every:
+                last_report = time.monotonic()
+                print(self.progress())
+
+        # shut stages down in order, once every worker of the previous stage has finished
+        for name, _, count in stages:
+            for _ in range(count):
+                self.queues[name].put(_DONE)
+            for thread in threads[name]:
+                thread.join()
+            if name == "store" and self.shards:
+                for writer in self.writers:
+                    writer.close()
+                write_manifest(self.output_dir)
+        if self.journal:
+            self.journal.close()
+        return self.counters
+
+    def _submit(self, position, item):
+        """Send an item to the first stage it still has to go through"""
+        if self.journal is None:
+            self.queues["build"].put((position, item))
+            return
+        if self.journal.is_done(position):
+            self.skipped += 1
+            return
+        state, source_uri = self.journal.state(position)
+        if state == SIGNED and (source_uri in self.salvaged if self.shards
+                                else output_path(self.output_dir, source_uri).exists()):
+            # stored, but the journal record was lost in the crash
+            self.journal.record(position, STORED, source_uri)
+            state = STORED
+            if self.journal.is_done(position):
+                self.skipped += 1
+                return
+        if state == SIGNED and spool_path(self.output_dir, source_uri).exists():
+            trig = spool_path(self.output_dir, source_uri).read_text(encoding="utf-8")
+            self.queues["store"].put((position, item, source_uri, trig))
+        elif state == STORED:
+            path = spool_path if self.shards else output_path
+            trig = path(self.output_dir, source_uri).read_text(encoding="utf-8")
+            self.queues["publish"].put((position, item, source_uri, trig, path(self.output_dir, source_uri)))
+        else:
+            self.queues["build"].put((position, item))
+
+    def progress(self):
+        depths = self.queue_depths()
+        return " | ".join(f"{name}: {counter.items} done, {depths[name]} queued"
+                          for name, counter in self.counters.items())
+
+    def report(self):
+        lines = [str(counter) for counter in self.counters.values()]
+        if self.journal:
+            lines.append(f"{self.skipped} items already complete in the journal were skipped")
+        return "\n".join(lines)
+
+
+def main():
+    """Build, sign and store (and optionally publish) the repo's templates through the pipeline."""
+    from create_aida_template_and_publish import create_aida_spatiotemporal_template, create_memory_profile
+    from create_paper_template_and_publish import create_scientific_paper_template
+    from create_rosetta_template_and_publish import create_rosetta_statement_template
+
+    builders = {
+        "aida": create_aida_spatiotemporal_template,
+        "paper": create_scientific_paper_template,
+        "rosetta": create_rosetta_statement_template,
+    }
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("templates", nargs="*", help=f"templates to build: {', '.join(builders)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=1, help="build each template this many times (benchmarking)")
+    parser.add_argument("--output-dir", type=Path, default=Path("signed_nanopubs"))
+    parser.add_argument("--publish", action="store_true")
+    parser.add_argument("--test-server", action="store_true", help="publish to the nanopub test server")
+    parser.add_argument("--server", help="publish to this server instead (e.g. a local_registry.py instance)")
+    parser.add_argument("--publish-rate", type=float, help="publish at most this many nanopubs per second")
+    parser.add_argument("--sign-workers", type=int)
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument("--journal", type=Path, help="journal file to resume an interrupted run")
+    parser.add_argument("--quad-store", type=Path, help="also add the stored nanopubs to this SQLite quad store")
+    parser.add_argument("--index", action="append", default=[], metavar="KIND=PATH",
+                        help=f"also add the stored AIDA nanopubs to an index ({', '.join(AIDA_INDEXES)}), "
+                             "e.g. temporal=aida_temporal.db")
+    parser.add_argument("--shards", type=int, help="append the nanopubs to this many compressed shard files")
+    parser.add_argument("--compression", choices=list(COMPRESSIONS), default="gzip", help="compression of the shards")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    parser.add_argument("--metrics-file", type=Path, help="write Prometheus metrics to this .prom file")
+    args = parser.parse_args()
+    templates = args.templates or list(builders)
+    for name in templates:
+        if name not in builders:
+            parser.error(f"Unknown template {name!r}, expected one of {', '.join(builders)}")
+
+    profile = create_memory_profile(
+        name="Anne Fouilloux",
+        orcid_id="https://orcid.org/0000-0002-1784-2920"
+    )
+    metrics = exporter = None
+    if args.metrics_port or args.metrics_file:
+        metrics = PipelineMetrics()
+        if args.metrics_port:
+            serve_metrics(metrics.registry, args.metrics_port)
+            print(f"✓ Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+        if args.metrics_file:
+            exporter = TextfileExporter(metrics.registry, args.metrics_file).start()
+    indexes = []
+    for spec in args.index:
+        kind, _, path = spec.partition("=")
+        if kind not in AIDA_INDEXES or not path:
+            parser.error(f"--index expects KIND=PATH with KIND one of {', '.join(AIDA_INDEXES)}, got {spec!r}")
+        indexes.append(AIDA_INDEXES[kind](Path(path)))
+    try:
+        pipeline = NanopubPipeline(
+            build=lambda name: builders[name](),
+            profile=profile,
+            output_dir=args.output_dir,
+            publish=args.publish,
+            use_test_server=args.test_server,
+            server=args.server,
+            publish_rate=args.publish_rate,
+            sign_workers=args.sign_workers,
+            queue_size=args.queue_size,
+            journal=args.journal,
+            quad_store=SQLiteQuadStore(args.quad_store) if args.quad_store else None,
+            metrics=metrics,
+            shards=args.shards,
+            compression=args.compression,
+            indexes=indexes,
+            on_result=lambda item, source_uri, path: print(f"✓ {item}: {source_uri} -> {path}"),
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    start = time.monotonic()
+    pipeline.run((name for _ in range(args.repeat) for name in templates), progress_every=10)
+    if pipeline.quad_store is not None:
+        pipeline.quad_store.close()
+    for index in indexes:
+        index.close()
+    if exporter is not None:
+        exporter.stop()
+    print(f"\nProcessed in {time.monotonic() - start:.1f}s")
+    print(pipeline.report())
+
+
+if __name__ == "__main__":
+    main()
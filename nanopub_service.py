@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Local HTTP service that builds, fills, signs and stores nanopubs on demand.
+
+Forking a script per nanopub pays the rdflib/nanopub imports and the key setup
+every time. The service keeps them warm: parsed templates (template_inheritance.py
+caches them per file and modification time), the signing key, or a key pool,
+and a pool of sign worker processes that each load the keys once.
+
+Every endpoint takes a JSON object, or `{"items": [...]}` for a batch of any
+size, and answers with the result, or `{"results": [...]}` with one result (or
+`{"error": ...}`) per item:
+
+    POST /build  derivation specs (see template_watch.py) whose parent is a template
+                 of --templates, by file name or stem -> unsigned template TriG
+    POST /fill   records of synthetic_workload.py ({"template": "aida", ...}) -> unsigned TriG
+    POST /sign   {"trig": unsigned TriG} -> signed TriG
+    POST /store  {"trig": signed TriG} -> file in --output-dir (and --quad-store)
+    GET  /       request and item counters
+
+/build and /fill also take `"sign": true` and `"store": true` to sign and store
+the results in the same request. Items with an "author" ORCID are signed (and
+attributed) with that author's key of --key-pool, the others with the service's
+key. /sign and /store also accept a single raw TriG body (Content-Type:
+application/trig). /build and /fill items are built on the worker pool in
+chunks, so a large batch uses every core. Sign jobs of concurrent requests are
+coalesced into batches for the worker pool, so one IPC round trip signs many
+nanopubs whether they come from one request or from many small ones.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from rdflib import ConjunctiveGraph
+from nanopub import Nanopub, Profile
+
+from key_pool import AuthorKey, KeyPool, sign_as, use_fast_metadata
+from nanopub_pipeline import output_path
+from quad_store import SQLiteQuadStore
+from synthetic_workload import build_record
+from template_watch import derive, load_key
+
+ACTIONS = ("build", "fill", "sign", "store")
+SIGN_BATCH_SIZE = 64
+SIGN_LINGER = 0.002
+MAKE_BATCH_SIZE = 16
+# pending connections the listening socket holds (socketserver's default is 5)
+REQUEST_QUEUE_SIZE = 1024
+_STOP = object()
+_parse_lock = threading.Lock()
+
+# Keys of the current sign worker process (see _init_worker)
+_worker_key = None
+_worker_pool = None
+
+
+def _init_worker(profile_args, key_pool=None):
+    global _worker_key, _worker_pool
+    use_fast_metadata()
+    orcid_id, name, private_key, public_key = profile_args
+    _worker_key = AuthorKey(Profile(orcid_id=orcid_id, name=name, private_key=private_key, public_key=public_key))
+    if key_pool:
+        _worker_pool = KeyPool(key_pool)
+
+
+def _sign_batch(entries):
+    """Sign (TriG, author or None) entries, return (source URI, signed TriG, error) for each"""
+    results = []
+    for trig, author in entries:
+        try:
+            if author is None:
+                # built with the service's profile, already attributed to it
+                _, source_uri, signed = sign_as(trig, _worker_key, stamp=False)
+            elif _worker_pool is None:
+                raise ValueError("Signing as another author needs a key pool (--key-pool)")
+            else:
+                _, source_uri, signed = sign_as(trig, _worker_pool.get(author))
+        except Exception as e:
+            results.append((None, None, f"{type(e).__name__}: {e}"))
+            continue
+        results.append((source_uri, signed, None))
+    return results
+
+
+def _make_batch(action, entries):
+    """Build ((spec, template path) entries) or fill (records) on a worker, return (TriG, error) for each"""
+    results = []
+    for entry in entries:
+        try:
+            if action == "build":
+                spec, path = entry
+                np = derive(spec, Path(path)).build(_worker_key.profile)
+            else:
+                np = build_record(entry, _worker_key.profile)
+        except Exception as e:
+            results.append((None, f"{type(e).__name__}: {e}"))
+            continue
+        results.append((np if isinstance(np, str) else np.rdf.serialize(format="trig"), None))
+    return results
+
+
+class SignBatcher:
+    """Coalesces sign jobs of concurrent requests into batches for a process pool"""
+
+    def __init__(self, key: AuthorKey, key_pool: Path = None, workers: int = None,
+                 batch_size: int = SIGN_BATCH_SIZE, linger: float = SIGN_LINGER):
+        profile = key.profile
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            # the HTTP server's threads must not be forked into the workers
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=_init_worker,
+            initargs=((profile.orcid_id, profile.name, profile.private_key, profile.public_key), key_pool),
+        )
+        self.batch_size = batch_size
+        self.linger = linger
+        self.inbox = queue.Queue()
+        self.thread = threading.Thread(target=self._dispatch, daemon=True)
+        self.thread.start()
+
+    def submit(self, trig: str, author: str = None) -> Future:
+        """Future of (source URI, signed TriG, error)"""
+        future = Future()
+        self.inbox.put((trig, author, future))
+        return future
+
+    def _dispatch(self):
+        while True:
+            job = self.inbox.get()
+            if job is _STOP:
+                return
+            jobs = [job]
+            deadline = time.monotonic() + self.linger
+            while len(jobs) < self.batch_size:
+                try:
+                    job = self.inbox.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    self.inbox.put(_STOP)
+                    break
+                jobs.append(job)
+            try:
+                batch = self.pool.submit(_sign_batch, [(trig, author) for trig, author, _ in jobs])
+            except Exception as e:
+                for _, _, future in jobs:
+                    future.set_exception(e)
+                continue
+            batch.add_done_callback(lambda batch, futures=[future for _, _, future in jobs]:
+                                    self._resolve(batch, futures))
+
+    @staticmethod
+    def _resolve(batch, futures):
+        try:
+            results = batch.result()
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+    def close(self):
+        self.inbox.put(_STOP)
+        self.thread.join()
+        self.pool.shutdown()
+
+
+class NanopubService:
+    """Warm state shared by the request handlers"""
+
+    def __init__(self, key: AuthorKey, templates: Path = None, output_dir: Path = None, key_pool: Path = None,
+                 quad_store: SQLiteQuadStore = None, sign_workers: int = None):
+        self.key = key
+        self.templates = Path(templates) if templates else None
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.quad_store = quad_store
+        self.signer = SignBatcher(key, key_pool, sign_workers)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "items": 0, "errors": 0}
+        if self.output_dir:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+
+    def template_path(self, parent: str) -> Path:
+        """Template file of --templates by file name or stem"""
+        if self.templates is None:
+            raise ValueError("No template directory (--templates)")
+        for candidate in (self.templates / parent, self.templates / f"{parent}.trig"):
+            if candidate.is_file() and candidate.resolve().parent == self.templates.resolve():
+                return candidate
+        raise ValueError(f"No template {parent!r} in {self.templates}")
+
+    def store(self, trig: str, source_uri: str = None) -> Path:
+        """Write a signed nanopub (and add it to the quad store), return its file"""
+        if self.output_dir is None:
+            raise ValueError("No output directory (--output-dir)")
+        if source_uri is None:
+            source_uri = signed_uri(trig)
+        path = output_path(self.output_dir, source_uri)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_text(trig, encoding="utf-8")
+        os.replace(tmp, path)
+        if self.quad_store is not None:
+            self.quad_store.add_nanopub(trig, path=str(path.resolve()))
+        return path
+
+    def handle(self, action: str, body: dict, batch: bool):
+        """Results of a request body: one item, or a batch under "items" """
+        items = body["items"] if batch else [body]
+        sign = action == "sign" or (action in ("build", "fill") and body.get("sign", False))
+        store = action == "store" or (action != "store" and body.get("store", False))
+        if store and action in ("build", "fill") and not sign:
+            raise ValueError("Only signed nanopubs can be stored, add \"sign\": true")
+        results = [{} for _ in items]
+
+        # build or fill on the worker pool in chunks, then sign the whole batch at once
+        if action in ("build", "fill"):
+            jobs = []
+            for result, item in zip(results, items):
+                try:
+                    jobs.append((result, (item, str(self.template_path(item["parent"]))) if action == "build"
+                                 else item))
+                except Exception as e:
+                    result["error"] = f"{type(e).__name__}: {e}"
+            chunks = [jobs[i:i + MAKE_BATCH_SIZE] for i in range(0, len(jobs), MAKE_BATCH_SIZE)]
+            futures = [self.signer.pool.submit(_make_batch, action, [entry for _, entry in chunk])
+                       for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                try:
+                    made = future.result()
+                except Exception as e:
+                    made = [(None, f"{type(e).__name__}: {e}")] * len(chunk)
+                for (result, _), (trig, error) in zip(chunk, made):
+                    if error:
+                        result["error"] = error
+                    else:
+                        result["trig"] = trig
+        else:
+            for result, item in zip(results, items):
+                result["trig"] = item["trig"] if isinstance(item, dict) else item
+
+        pending = []
+        if sign:
+            for result, item in zip(results, items):
+                if "error" not in result:
+                    author = item.get("author") if isinstance(item, dict) else None
+                    pending.append((result, self.signer.submit(result["trig"], author)))
+        for result, future in pending:
+            try:
+                source_uri, signed, error = future.result()
+            except Exception as e:
+                source_uri, signed, error = None, None, f"{type(e).__name__}: {e}"
+            if error:
+                del result["trig"]
+                result["error"] = error
+            else:
+                result["uri"], result["trig"] = source_uri, signed
+
+        for result in results:
+            if store and "error" not in result:
+                try:
+                    result["path"] = str(self.store(result["trig"], result.get("uri")))
+                except Exception as e:
+                    del result["trig"]
+                    result["error"] = f"{type(e).__name__}: {e}"
+            if body.get("omit_trig", action == "store"):
+                result.pop("trig", None)
+
+        with self.lock:
+            self.counts["requests"] += 1
+            self.counts["items"] += len(items)
+            self.counts["errors"] += sum("error" in result for result in results)
+        return {"results": results} if batch else results[0]
+
+    def close(self):
+        self.signer.close()
+        if self.quad_store is not None:
+            self.quad_store.close()
+
+
+def signed_uri(trig: str) -> str:
+    """Trusty URI of a signed nanopub; raises ValueError if it is not signed"""
+    g = ConjunctiveGraph()
+    g.parse(data=trig, format="trig")
+    # rdflib's SPARQL parser (used by nanopub to extract the metadata) is not thread-safe
+    with _parse_lock:
+        np = Nanopub(rdf=g)
+    if not np.metadata.signature:
+        raise ValueError("Nanopub is not signed")
+    return np.source_uri
+
+
+def make_handler(service: NanopubService):
+    """Request handler class bound to a service"""
+
+    class ServiceHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+            action = self.path.strip("/")
+            if action not in ACTIONS:
+                self._reply(404, {"error": f"Unknown endpoint {self.path}, expected one of "
+                                           f"{', '.join('/' + a for a in ACTIONS)}"})
+                return
+            try:
+                if self.headers.get("Content-Type", "").startswith("application/trig"):
+                    if action not in ("sign", "store"):
+                        raise ValueError(f"/{action} takes JSON")
+                    body = {"trig": data}
+                else:
+                    body = json.loads(data)
+                batch = isinstance(body, dict) and "items" in body
+                if not isinstance(body, dict) or (batch and not isinstance(body["items"], list)):
+                    raise ValueError("Expected a JSON object, or {\"items\": [...]}")
+                result = service.handle(action, body, batch)
+            except ValueError as e:
+                self._reply(400, {"error": str(e)})
+                return
+            self._reply(200, result)
+
+        def do_GET(self):
+            if self.path.strip("/"):
+                self._reply(404, {"error": "Not found"})
+                return
+            with service.lock:
+                self._reply(200, dict(service.counts))
+
+        def log_message(self, format, *args):
+            pass
+
+    return ServiceHandler
+
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    request_queue_size = REQUEST_QUEUE_SIZE
+    daemon_threads = True
+
+
+def serve(service: NanopubService, host: str = "127.0.0.1", port: int = 8090):
+    """Create the service's HTTP server (call serve_forever() on it, or run it in a thread)"""
+    server = ServiceHTTPServer((host, port), make_handler(service))
+    server.service = service
+    return server
+
+
+def main():
+    """Run the build, fill, sign and store service."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--templates", type=Path, help="directory of template .trig files for /build")
+    parser.add_argument("--output-dir", type=Path, default=Path("signed_nanopubs"), help="where /store writes")
+    parser.add_argument("--quad-store", type=Path, help="also add stored nanopubs to this SQLite quad store")
+    parser.add_argument("--key-pool", type=Path, help="key pool to sign items with an \"author\" (see key_pool.py)")
+    parser.add_argument("--author", help="ORCID of the key pool to sign everything else with")
+    parser.add_argument("--sign-workers", type=int)
+    args = parser.parse_args()
+
+    try:
+        _, key = load_key(args.key_pool, args.author)
+    except (KeyError, ValueError) as e:
+        parser.error(str(e))
+    service = NanopubService(key, args.templates, args.output_dir, args.key_pool,
+                             SQLiteQuadStore(args.quad_store) if args.quad_store else None, args.sign_workers)
+    server = serve(service, args.host, args.port)
+    print(f"✓ Nanopub service listening on http://{args.host}:{args.port}/ (signing as {key.orcid_id})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print(", ".join(f"{key}: {value}" for key, value in service.counts.items()))
+
+
+if __name__ == "__main__":
+    main()
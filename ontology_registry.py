@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Registry of the ontology terms used by the templates, with their labels, domains and ranges.
+
+The templates label the classes and properties they use (CiTO, FaBiO, DoCO, DEO,
+DCAT, schema.org, Dublin Core, ...) so that Nanodash can display them. Those
+labels are kept here in TEMPLATE_LABELS, once for all templates, and
+`term_labels` hands them out; a term without a template label gets the
+rdfs:label of its ontology.
+
+`build` loads local copies of the ontologies (.ttl, .owl, .rdf, .nt, .jsonld,
+optionally gzipped) once and pickles every class, property and individual they
+declare (IRI, label, kind, domain and range) to ontology_terms.pickle next to
+this module. A namespace is covered when a file declares it as an owl:Ontology
+or defines most of its terms in it, so terms of imported ontologies that a file
+merely mentions do not count. `validate_terms` then rejects every IRI of a
+covered namespace that its ontology does not define, for instance a misspelled
+`DOCO.hasContent` or `CITO.usesDataFrom`; IRIs of namespaces that were not
+loaded are not checked.
+
+The index is memory-mapped and unpickled the first time a label or a check is
+needed (a few milliseconds for the whole SPAR suite and schema.org), so
+importing this module costs nothing.
+
+    python ontology_registry.py build cito.ttl fabio.ttl doco.ttl deo.ttl dcat.ttl schemaorg-current-http.ttl
+    python ontology_registry.py show http://purl.org/spar/cito/usesDataFrom
+"""
+
+import argparse
+import gzip
+import mmap
+import pickle
+import time
+from collections import Counter, namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+DEFAULT_INDEX = Path(__file__).with_name("ontology_terms.pickle")
+VERSION = 1
+
+RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+RDFS = "http://www.w3.org/2000/01/rdf-schema#"
+OWL = "http://www.w3.org/2002/07/owl#"
+SKOS = "http://www.w3.org/2004/02/skos/core#"
+SCHEMA = "http://schema.org/"
+DCTERMS = "http://purl.org/dc/terms/"
+CITO = "http://purl.org/spar/cito/"
+FABIO = "http://purl.org/spar/fabio/"
+DOCO = "http://purl.org/spar/doco/"
+DEO = "http://purl.org/spar/deo/"
+DCAT = "http://www.w3.org/ns/dcat#"
+BIBO = "http://purl.org/ontology/bibo/"
+FOAF = "http://xmlns.com/foaf/0.1/"
+PROV = "http://www.w3.org/ns/prov#"
+HYCL = "http://purl.org/petapico/o/hycl#"
+ROSETTA = "https://w3id.org/rosetta/"
+
+KINDS = {
+    OWL + "Class": "class",
+    RDFS + "Class": "class",
+    RDFS + "Datatype": "class",
+    RDF + "Property": "property",
+    OWL + "ObjectProperty": "property",
+    OWL + "DatatypeProperty": "property",
+    OWL + "AnnotationProperty": "property",
+    OWL + "FunctionalProperty": "property",
+    OWL + "TransitiveProperty": "property",
+    OWL + "SymmetricProperty": "property",
+    OWL + "InverseFunctionalProperty": "property",
+    OWL + "NamedIndividual": "individual",
+}
+DOMAINS = (RDFS + "domain", SCHEMA + "domainIncludes", "https://schema.org/domainIncludes")
+RANGES = (RDFS + "range", SCHEMA + "rangeIncludes", "https://schema.org/rangeIncludes")
+FORMATS = {".ttl": "turtle", ".owl": "xml", ".rdf": "xml", ".xml": "xml", ".nt": "nt", ".n3": "n3",
+           ".jsonld": "json-ld", ".trig": "trig"}
+
+# Labels the templates display for the terms they use, shared by all templates
+TEMPLATE_LABELS = {
+    RDF + "type": "is a - connects a thing to a class it belongs to",
+
+    CITO + "cites": "cites",
+    CITO + "citesAsSourceDocument": "cites as source document",
+    CITO + "citesAsEvidence": "cites as evidence",
+    CITO + "obtainsSupportFrom": "obtains support from",
+    CITO + "includesQuotationFrom": "includes quotation from",
+    CITO + "extends": "extends",
+    CITO + "supports": "supports",
+    CITO + "agreesWith": "agrees with",
+    CITO + "disagreesWith": "disagrees with",
+    CITO + "usesMethodIn": "uses method in",
+    CITO + "usesDataFrom": "uses data from",
+
+    FABIO + "ScholarlyWork": "scholarly work - any kind of scholarly work, such as an article, book, etc.",
+    FABIO + "ResearchPaper": "research paper - a scholarly paper reporting original research results",
+    FABIO + "hasPageNumber": "has page number",
+    BIBO + "AcademicArticle": "academic article - a scholarly article published in an academic venue",
+
+    DOCO + "TextChunk": "text chunk - a piece of text from a document",
+    DOCO + "Section": "document section",
+    DOCO + "Paragraph": "document paragraph",
+    DOCO + "hasSection": "has document section",
+    DEO + "Introduction": "introduction - opening section that establishes context and purpose",
+    DEO + "Methods": "methods - section describing methodology and procedures",
+    DEO + "Results": "results - section presenting findings and outcomes",
+    DEO + "Discussion": "discussion - section analyzing and interpreting results",
+    DEO + "hasGoal": "has research goal",
+    DEO + "hasHypothesis": "has hypothesis",
+
+    DCTERMS + "title": "has title",
+    DCTERMS + "abstract": "has abstract",
+    DCTERMS + "date": "has publication date",
+    DCTERMS + "created": "created - timestamp of creation",
+    DCTERMS + "creator": "has author/creator",
+    DCTERMS + "isPartOf": "is part of (journal or venue)",
+    DCTERMS + "subject": "has subject/research field",
+    DCTERMS + "spatial": "has spatial coverage",
+    DCTERMS + "temporal": "has temporal extent",
+    DCTERMS + "type": "has extraction type",
+    DCAT + "spatialResolutionInMeters": "has spatial resolution in meters",
+    DCAT + "temporalResolution": "has temporal resolution",
+
+    SCHEMA + "about": "is about - connects a thing (left) to a subject matter that this thing is about (right)",
+    SKOS + "related": "is related to",
+    FOAF + "name": "has name",
+    PROV + "wasAttributedTo": "was attributed to - attribution of statement",
+    HYCL + "AIDA-Sentence": "AIDA sentence - an English sentence that is Atomic, Independent, Declarative, and Absolute",
+
+    # the Rosetta Statement vocabulary is defined by the Rosetta template itself
+    ROSETTA + "RosettaStatement": "Rosetta Statement - a natural language statement modeled semantically",
+    ROSETTA + "subject": "has subject - connects statement to its subject resource",
+    ROSETTA + "requiredObjectPosition1": "required object position 1 - first mandatory object",
+    ROSETTA + "requiredObjectPosition2": "required object position 2 - second mandatory object",
+    ROSETTA + "optionalObjectPosition1": "optional object position 1 - first optional object",
+    ROSETTA + "optionalObjectPosition2": "optional object position 2 - second optional object",
+    ROSETTA + "optionalObjectPosition3": "optional object position 3 - third optional object",
+    ROSETTA + "requiredLiteralObjectPosition1": "required literal object position 1 - first mandatory literal",
+    ROSETTA + "optionalLiteralObjectPosition1": "optional literal object position 1 - first optional literal",
+    ROSETTA + "hasStatementType": "has statement type - connects to Rosetta Statement class",
+    ROSETTA + "hasDynamicLabel": "has dynamic label - template for natural language display",
+    ROSETTA + "hasConfidenceLevel": "has confidence level - degree of certainty (0-1)",
+    ROSETTA + "hasContext": "has context - scholarly publication or broader context",
+    ROSETTA + "isNegation": "is negation - whether this statement is negated",
+    ROSETTA + "hasSourceReference": "has source reference - supporting evidence",
+    ROSETTA + "hasVersion": "has version - links to statement version",
+    ROSETTA + "anchorStatement": "anchor statement - version-independent statement identity",
+}
+
+Term = namedtuple("Term", "iri label kind domain range")
+
+
+def namespace_of(iri: str) -> str:
+    """Namespace of an IRI: everything up to its last '#' or '/'"""
+    return iri[:max(iri.rfind("#"), iri.rfind("/")) + 1]
+
+
+def _normalize(iri: str) -> str:
+    # schema.org publishes both http and https IRIs, the templates use http
+    return SCHEMA + iri[len("https://schema.org/"):] if iri.startswith("https://schema.org/") else iri
+
+
+def _parse(path: Path):
+    from rdflib import Graph
+
+    path = Path(path)
+    suffix = path.suffixes[-2] if path.suffix == ".gz" and len(path.suffixes) > 1 else path.suffix
+    if suffix not in FORMATS:
+        raise ValueError(f"Unknown ontology format {suffix!r} of {path}, expected one of {', '.join(FORMATS)}")
+    g = Graph()
+    if path.suffix == ".gz":
+        with gzip.open(path, "rb") as f:
+            g.parse(f, format=FORMATS[suffix])
+    else:
+        g.parse(path, format=FORMATS[suffix])
+    return g
+
+
+def _label(g, subject):
+    from rdflib import URIRef
+
+    labels = list(g.objects(subject, URIRef(RDFS + "label"))) or list(g.objects(subject, URIRef(SKOS + "prefLabel")))
+    if not labels:
+        return None
+    english = [label for label in labels if getattr(label, "language", None) in ("en", None)]
+    return str(min(english or labels, key=lambda label: (label.language is not None, str(label))))
+
+
+def read_terms(path: Path):
+    """(terms, covered namespaces) of an ontology file, terms as {IRI: (label, kind, domain, range)}"""
+    from rdflib import URIRef
+
+    g = _parse(path)
+    rdf_type = URIRef(RDF + "type")
+    terms = {}
+    for kind_iri, kind in KINDS.items():
+        for subject in g.subjects(rdf_type, URIRef(kind_iri)):
+            if not isinstance(subject, URIRef):
+                continue
+            iri = _normalize(str(subject))
+            if iri in terms:
+                continue
+            domain = tuple(sorted({_normalize(str(o)) for p in DOMAINS for o in g.objects(subject, URIRef(p))
+                                   if isinstance(o, URIRef)}))
+            range_ = tuple(sorted({_normalize(str(o)) for p in RANGES for o in g.objects(subject, URIRef(p))
+                                   if isinstance(o, URIRef)}))
+            terms[iri] = (_label(g, subject), kind, domain, range_)
+    namespaces = set()
+    for ontology in g.subjects(rdf_type, URIRef(OWL + "Ontology")):
+        iri = _normalize(str(ontology)).rstrip("/#")
+        namespaces.update(ns for ns in (iri + "/", iri + "#") if any(t.startswith(ns) for t in terms))
+    counts = Counter(namespace_of(iri) for iri in terms)
+    if counts:
+        namespace, count = counts.most_common(1)[0]
+        if count * 2 > len(terms):
+            namespaces.add(namespace)
+    return terms, namespaces
+
+
+def build(paths, output: Path = DEFAULT_INDEX) -> dict:
+    """Read ontology files into the pickled term index, return it"""
+    terms, namespaces = {}, set()
+    for path in paths:
+        file_terms, file_namespaces = read_terms(path)
+        for iri, term in file_terms.items():
+            # a term declared by its own ontology wins over a mention in another one
+            if iri not in terms or namespace_of(iri) in file_namespaces:
+                terms[iri] = term
+        namespaces |= file_namespaces
+    index = {"version": VERSION, "terms": terms, "namespaces": sorted(namespaces),
+             "sources": [Path(path).name for path in paths]}
+    output = Path(output)
+    tmp = output.with_name(f".{output.name}.tmp")
+    tmp.write_bytes(pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL))
+    tmp.replace(output)
+    return index
+
+
+class OntologyRegistry:
+    """Terms of the loaded ontologies plus the template labels"""
+
+    def __init__(self, path: Path = DEFAULT_INDEX):
+        self.path = Path(path)
+        index = {"terms": {}, "namespaces": [], "sources": []}
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                index = pickle.loads(mapped)
+            if index.get("version") != VERSION:
+                raise ValueError(f"{self.path} has version {index.get('version')}, rebuild it with "
+                                 f"`python ontology_registry.py build`")
+        self._terms = index["terms"]
+        self.namespaces = frozenset(index["namespaces"])
+        self.sources = index["sources"]
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __contains__(self, iri) -> bool:
+        return str(iri) in self._terms
+
+    def term(self, iri):
+        """The Term of an IRI, or None if no loaded ontology defines it"""
+        entry = self._terms.get(str(iri))
+        return None if entry is None else Term(str(iri), *entry)
+
+    def label(self, iri) -> str:
+        """Template label of a term, or the label of its ontology"""
+        label = TEMPLATE_LABELS.get(str(iri))
+        if label is None:
+            entry = self._terms.get(str(iri))
+            label = entry[0] if entry else None
+        if label is None:
+            raise ValueError(f"No label for {iri}: add it to TEMPLATE_LABELS or load its ontology")
+        return label
+
+    def unknown(self, iris):
+        """IRIs of covered namespaces that their ontology does not define, in order"""
+        found = []
+        for iri in iris:
+            iri = str(iri)
+            if iri not in self._terms and namespace_of(iri) in self.namespaces and iri not in found:
+                found.append(iri)
+        return found
+
+    def validate(self, iris):
+        """Raise ValueError if a loaded ontology does not define one of the IRIs"""
+        unknown = self.unknown(iris)
+        if unknown:
+            raise ValueError(f"Not defined by their ontologies: {', '.join(unknown)}")
+
+
+@lru_cache(maxsize=None)
+def registry() -> OntologyRegistry:
+    """The registry of the default index, loaded on first use"""
+    return OntologyRegistry()
+
+
+def term_labels(iris, overrides: dict = None) -> dict:
+    """{IRI: label} of terms for a template, in order; `overrides` rewords labels for one template"""
+    overrides = overrides or {}
+    return {iri: overrides[iri] if iri in overrides else registry().label(iri) for iri in iris}
+
+
+def graph_iris(graph):
+    """Every IRI of a graph, as subject, predicate or object"""
+    from rdflib import URIRef
+
+    for triple in graph:
+        for node in triple:
+            if isinstance(node, URIRef):
+                yield node
+
+
+def validate_terms(graph):
+    """Check every IRI of a template's assertion graph against the loaded ontologies"""
+    registry().validate(graph_iris(graph))
+
+
+def main():
+    """Build the ontology term index or look terms up in it."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="index local ontology files")
+    build_parser.add_argument("ontologies", nargs="+", type=Path, help="ontology files (.ttl, .owl, .rdf, .nt, ...)")
+
+    show_parser = sub.add_parser("show", help="print the label, kind, domain and range of terms")
+    show_parser.add_argument("iris", nargs="+")
+
+    check_parser = sub.add_parser("check", help="check the IRIs of TriG/Turtle files against the ontologies")
+    check_parser.add_argument("files", nargs="+", type=Path)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "build":
+            start = time.monotonic()
+            index = build(args.ontologies, args.index)
+            print(f"✓ {len(index['terms'])} terms of {len(index['namespaces'])} namespaces "
+                  f"in {args.index} ({time.monotonic() - start:.1f}s)")
+            for namespace in index["namespaces"]:
+                print(f"  {namespace}")
+            return
+
+        start = time.perf_counter()
+        terms = OntologyRegistry(args.index)
+        print(f"✓ Loaded {len(terms)} terms in {(time.perf_counter() - start) * 1000:.1f} ms")
+        if args.command == "show":
+            for iri in args.iris:
+                term = terms.term(iri)
+                if term is None:
+                    status = "not defined" if namespace_of(iri) in terms.namespaces else "namespace not loaded"
+                    print(f"✗ {iri}: {status}")
+                    continue
+                print(f"{iri}\n  label:  {TEMPLATE_LABELS.get(iri) or term.label}\n  kind:   {term.kind}")
+                if term.domain:
+                    print(f"  domain: {', '.join(term.domain)}")
+                if term.range:
+                    print(f"  range:  {', '.join(term.range)}")
+            return
+
+        from rdflib import Dataset
+
+        failed = False
+        for path in args.files:
+            ds = Dataset(default_union=True)
+            ds.parse(path, format="trig" if path.suffix == ".trig" else None)
+            unknown = terms.unknown(graph_iris(ds))
+            failed = failed or bool(unknown)
+            for iri in unknown:
+                print(f"✗ {path}: {iri} is not defined by its ontology")
+        if failed:
+            raise SystemExit(1)
+        print(f"✓ Every IRI of covered namespaces is defined ({', '.join(sorted(terms.namespaces)) or 'none loaded'})")
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Parse raw patent claim text into structured claims for the patent claim nanopub.
+
+create_patent_claim_template_and_publish.py expects a claim already split into
+preamble ("An apparatus"), transitional phrase ("comprising") and elements ("a
+handle", "a head portion connected to the handle"). Full-text dumps only have
+the claim text:
+
+    1. An apparatus comprising: a handle; and a head portion connected to the handle.
+    2. The apparatus of claim 1, wherein the handle is made of wood.
+
+parse_claim() splits such a text into its number, preamble, transitional phrase,
+elements and the claims it depends on ("of claim 3", "according to any one of
+claims 1 to 3"), using patterns compiled once at import. Words such as "having"
+or "including" only count as the transition when the claim has no "comprising",
+"consisting of" or similar ("A film having high strength, comprising: ...").
+Files are parsed in batches on a process pool (one claim per line, or JSONL with
+a "text" key whose other keys are kept), and the parsed claims are written as
+JSONL or built, signed and stored through nanopub_pipeline.py with
+create_patent_claim().
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+# longest phrases first, so that "consisting essentially of" is not read as "consisting of"
+TRANSITIONAL_PHRASES = (
+    "consisting essentially of", "consisting of", "further comprising", "comprising", "which comprises",
+    "characterized in that", "characterised in that", "characterized by", "characterised by",
+    "including", "having", "wherein", "containing", "composed of",
+)
+# phrases that are also everyday words ("a film having high strength", "a container for
+# containing") only count as the transition of a claim that has none of the others
+GENERIC_PHRASES = {"including", "having", "wherein", "containing", "composed of"}
+
+NUMBER_RE = re.compile(r"^\s*(\d+)\s*[.):]\s*")
+TRANSITIONAL_RE = re.compile(r"(?:,\s*|\s+)(" + "|".join(re.escape(p) for p in TRANSITIONAL_PHRASES) + r")\b\s*[:,]?\s*",
+                             re.IGNORECASE)
+DEPENDENCY_RE = re.compile(r"\bclaims?\s+(\d+(?:\s*(?:,|or|and|to|through|-|–)\s*(?:claims?\s+)?\d+)*)", re.IGNORECASE)
+CLAIM_RANGE_RE = re.compile(r"(\d+)(?:\s*(?:to|through|-|–)\s*(\d+))?")
+DEPENDENCY_PHRASE_RE = re.compile(
+    r",?\s*(?:(?:as\s+)?(?:claimed|recited|defined|set forth|described)\s+in|according\s+to|of|in|as in)"
+    r"\s+(?:any\s+(?:one\s+)?of\s+(?:the\s+)?(?:preceding\s+)?)?claims?\s+\d.*$",
+    re.IGNORECASE)
+# "The apparatus of claim 1, wherein ...": a transition right after the claim reference
+AFTER_REFERENCE_RE = re.compile(r"\bclaims?\s+\d+(?:\s*(?:,|or|and|to|through|-|–)\s*(?:claims?\s+)?\d+)*\s*$",
+                                re.IGNORECASE)
+ARTICLE_RE = re.compile(r"^(?:an?|the|one or more)\s+", re.IGNORECASE)
+ELEMENT_SPLIT_RE = re.compile(r"\s*;\s*")
+# "A system for ..., the system comprising": the category is the part before the self-reference
+SELF_REFERENCE_RE = re.compile(r",\s*(?:the|said)\s+[\w-]+$", re.IGNORECASE)
+LEADING_AND_RE = re.compile(r"^(?:and|or)\s+", re.IGNORECASE)
+TRAILING_AND_RE = re.compile(r"[,;]?\s+(?:and|or)$", re.IGNORECASE)
+WHITESPACE_RE = re.compile(r"\s+")
+
+BATCH_SIZE = 5000
+
+
+class ClaimParseError(ValueError):
+    pass
+
+
+def _dependencies(preamble: str):
+    """Claim numbers a preamble refers to, with ranges expanded ("claims 1 to 3" -> [1, 2, 3])"""
+    match = DEPENDENCY_RE.search(preamble)
+    if match is None:
+        return []
+    numbers = []
+    for start, end in CLAIM_RANGE_RE.findall(match.group(1)):
+        if end and int(end) >= int(start) and int(end) - int(start) < 1000:
+            numbers.extend(range(int(start), int(end) + 1))
+        else:
+            numbers.append(int(start))
+    return numbers
+
+
+def _transition_rank(text: str, match):
+    """
+    Sort key of a transitional phrase match; the best one is taken: right after
+    the claim reference of a dependent claim, else comprising/consisting of/...
+    before generic phrases, each preferably set off by a comma or followed by a
+    colon, else the first
+    """
+    phrase = match.group(1).lower()
+    if AFTER_REFERENCE_RE.search(text, 0, match.start()):
+        tier = 0
+    else:
+        set_off = match.group(0).startswith(",") or match.group(0).rstrip().endswith(":")
+        tier = 1 + 2 * (phrase in GENERIC_PHRASES) + (not set_off)
+    return tier, match.start()
+
+
+def split_elements(body: str):
+    """Elements of a claim body: 'a handle; and a head portion.' -> ['a handle', 'a head portion']"""
+    body = body.strip()
+    if body.endswith("."):
+        body = body[:-1]
+    elements = []
+    for element in ELEMENT_SPLIT_RE.split(body):
+        element = TRAILING_AND_RE.sub("", LEADING_AND_RE.sub("", element)).strip(" ,")
+        if element:
+            elements.append(element)
+    return elements
+
+
+def claim_category(preamble: str) -> str:
+    """What a claim is about: 'The apparatus of claim 1' -> 'apparatus'"""
+    category = DEPENDENCY_PHRASE_RE.sub("", preamble) if DEPENDENCY_RE.search(preamble) else preamble
+    return ARTICLE_RE.sub("", SELF_REFERENCE_RE.sub("", category))
+
+
+def parse_claim(text: str, position: int = None) -> dict:
+    """
+    Split one claim into a dict with position, preamble, category, transitional
+    phrase, elements, depends_on (None, a claim number, or a list of them) and
+    text; raises ClaimParseError if no transitional phrase is found.
+    """
+    text = WHITESPACE_RE.sub(" ", text).strip()
+    number = NUMBER_RE.match(text)
+    if number is not None:
+        position = int(number.group(1))
+        text = text[number.end():]
+    match = min(TRANSITIONAL_RE.finditer(text), key=lambda m: _transition_rank(text, m), default=None)
+    if match is None:
+        raise ClaimParseError(f"No transitional phrase in claim {text[:80]!r}")
+
+    preamble = text[:match.start()].strip()
+    transitional = match.group(1).lower()
+    elements = split_elements(text[match.end():])
+    dependencies = _dependencies(preamble)
+    if not preamble or not elements:
+        raise ClaimParseError(f"Claim without preamble or elements {text[:80]!r}")
+
+    return {
+        "position": position,
+        "preamble": preamble,
+        "category": claim_category(preamble),
+        "transitional": transitional,
+        "elements": elements,
+        "depends_on": (dependencies[0] if len(dependencies) == 1 else dependencies) or None,
+        "text": text,
+    }
+
+
+def _parse_line(line: str, position: int):
+    """Parsed claim of an input line (plain claim text or a JSONL object with "text"), or None"""
+    line = line.strip()
+    if not line:
+        return None
+    extra = {}
+    if line.startswith("{"):
+        extra = json.loads(line)
+        line = extra.pop("text")
+        position = extra.pop("position", position)
+    try:
+        claim = parse_claim(line, position)
+    except ClaimParseError as e:
+        return {**extra, "text": line, "error": str(e)}
+    return {**extra, **claim}
+
+
+def parse_batch(lines, first: int = 1):
+    """Parse a batch of input lines; claims without a number are numbered from `first`"""
+    claims = []
+    for offset, line in enumerate(lines):
+        claim = _parse_line(line, first + offset)
+        if claim is not None:
+            claims.append(claim)
+    return claims
+
+
+def parse_lines(lines, workers: int = None, batch_size: int = BATCH_SIZE):
+    """Yield parsed claims of an iterable of lines, in order, parsing batches on a process pool"""
+    workers = workers or os.cpu_count()
+    lines = iter(lines)
+    if workers == 1:
+        first = 1
+        while batch := list(islice(lines, batch_size)):
+            yield from parse_batch(batch, first)
+            first += len(batch)
+        return
+    in_flight = deque()
+    first = 1
+    with ProcessPoolExecutor(workers) as pool:
+        while batch := list(islice(lines, batch_size)):
+            in_flight.append(pool.submit(parse_batch, batch, first))
+            first += len(batch)
+            if len(in_flight) >= 2 * workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def main():
+    """Parse raw patent claims into structured claims (JSONL), or build patent claim nanopubs from them."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input", type=Path, help="claims, one per line (plain text or JSONL with a 'text' key)")
+    parser.add_argument("--output", type=Path, help="JSONL file of parsed claims (default: standard output)")
+    parser.add_argument("--workers", type=int, help="parser processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--pipeline", action="store_true",
+                        help="build, sign and store a patent claim nanopub per parsed claim instead")
+    parser.add_argument("--output-dir", type=Path, default=Path("signed_nanopubs"), help="with --pipeline")
+    parser.add_argument("--sign-workers", type=int, help="with --pipeline")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    with open(args.input, encoding="utf-8") as f:
+        claims = parse_lines(f, args.workers, args.batch_size)
+        if args.pipeline:
+            from create_patent_claim_template_and_publish import create_memory_profile, create_patent_claim
+            from nanopub_pipeline import NanopubPipeline
+
+            profile = create_memory_profile(
+                name="Anne Fouilloux",
+                orcid_id="https://orcid.org/0000-0002-1784-2920"
+            )
+            failed = 0
+
+            def parsed():
+                nonlocal failed
+                for claim in claims:
+                    if "error" in claim:
+                        print(f"Skipping: {claim['error']}")
+                        failed += 1
+                    else:
+                        yield claim
+
+            pipeline = NanopubPipeline(
+                build=lambda claim: create_patent_claim(claim, profile),
+                profile=profile,
+                output_dir=args.output_dir,
+                sign_workers=args.sign_workers,
+            )
+            pipeline.run(parsed(), progress_every=10)
+            print(f"\nProcessed in {time.monotonic() - start:.1f}s ({failed} claims not parsed)")
+            print(pipeline.report())
+            return
+
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        parsed_count = failed = 0
+        try:
+            for claim in claims:
+                out.write(json.dumps(claim, ensure_ascii=False) + "\n")
+                if "error" in claim:
+                    failed += 1
+                else:
+                    parsed_count += 1
+        finally:
+            if args.output:
+                out.close()
+    if args.output:
+        elapsed = time.monotonic() - start
+        print(f"✓ Parsed {parsed_count} claims in {elapsed:.1f}s "
+              f"({parsed_count / max(elapsed, 1e-9) * 3600:,.0f} claims/hour)"
+              + (f", {failed} not parsed" if failed else ""))
+
+
+if __name__ == "__main__":
+    main()
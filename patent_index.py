@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+Element-level inverted index over patent claim nanopubs, queried by bitmap intersection.
+
+Claim elements (split from schema:description) are tokenized into normalized
+terms: lowercase words without articles and claim boilerplate ("said", "at least
+one", "plurality"), with plurals folded, plus the word pairs of every element
+so that phrases such as "head portion" can be matched (claims matching the word
+pairs of a longer phrase are re-checked against their elements). The transitional phrase,
+the claim category and whether the claim is dependent are indexed as terms too.
+
+Each term maps to a compressed bitmap of claim IDs (Roaring layout: sorted
+16-bit arrays for sparse chunks of 65536 claims, bitsets for dense ones) stored
+in SQLite. A query such as
+
+    claims with elements "handle" and "head portion" and transitional phrase "consisting of"
+
+decodes one bitmap per term and intersects them, which takes milliseconds even
+for tens of millions of claims. Re-indexed files clear their old claims from the
+bitmap of live claims instead of rewriting every posting.
+
+numpy is used to list the claim IDs of dense chunks when it is installed.
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import struct
+import time
+from array import array
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+
+from rdflib import Namespace
+from rdflib.namespace import RDF
+
+from aida_records import NP, iter_nanopub_files, load_nanopub_dataset
+from patent_claims import claim_category, split_elements
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - optional speed-up
+    numpy = None
+
+SCHEMA = Namespace("http://schema.org/")
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+STOP_WORDS = {
+    "a", "an", "the", "said", "at", "least", "one", "plurality", "of", "to", "and", "or", "is", "are",
+    "be", "being", "in", "on", "for", "with", "by", "from", "that", "which", "each", "wherein", "whereby",
+}
+# reserved term of the bitmap of claims that have not been replaced by a re-indexed file
+LIVE = ""
+# Roaring container limits: an array of more than 4096 16-bit values is larger than a 8 KiB bitset
+ARRAY_MAX = 4096
+BITSET_BYTES = 8192
+FLUSH_EVERY = 200_000
+CACHE_SIZE = 256
+
+
+def normalize(word: str) -> str:
+    """Fold plurals: 'portions' -> 'portion', 'assemblies' -> 'assembly'"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str):
+    """Normalized words of an element, without stop words"""
+    return [normalize(word) for word in TOKEN_RE.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def element_terms(element: str):
+    """Terms of one element: its words and its adjacent word pairs"""
+    words = tokenize(element)
+    terms = {f"e:{word}" for word in words}
+    terms.update(f"e:{a} {b}" for a, b in zip(words, words[1:]))
+    return terms
+
+
+def phrase_terms(phrase: str):
+    """Terms that all claims with an element containing `phrase` have"""
+    words = tokenize(phrase)
+    if len(words) == 1:
+        return [f"e:{words[0]}"]
+    return [f"e:{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def contains_phrase(elements, words) -> bool:
+    """Whether one of the elements contains the normalized words in a row"""
+    n = len(words)
+    for element in elements:
+        tokens = tokenize(element)
+        if any(tokens[i:i + n] == words for i in range(len(tokens) - n + 1)):
+            return True
+    return False
+
+
+def claim_terms(claim: dict):
+    terms = set()
+    for element in claim["elements"]:
+        terms.update(element_terms(element))
+    if claim.get("transitional"):
+        terms.add(f"t:{claim['transitional'].lower()}")
+    if claim.get("category"):
+        terms.add(f"c:{claim['category'].lower()}")
+    terms.add("d:dependent" if claim.get("depends_on") else "d:independent")
+    return terms
+
+
+class Bitmap:
+    """
+    A compressed set of claim IDs in the layout of Roaring bitmaps: IDs are split
+    into chunks of 65536 by their high bits, and each chunk is kept as a sorted
+    array of the low 16 bits while it holds at most 4096 IDs, else as a 65536-bit
+    bitset (a Python int, so AND/OR run in C). Sparse terms cost a few bytes per
+    claim, dense ones 8 KiB per chunk.
+    """
+
+    __slots__ = ("containers",)
+
+    def __init__(self, containers=None):
+        # chunk number -> array("H") of sorted low bits, or int bitset
+        self.containers = containers or {}
+
+    @classmethod
+    def from_ids(cls, ids):
+        chunks = defaultdict(list)
+        for i in ids:
+            chunks[i >> 16].append(i & 0xFFFF)
+        return cls({high: _container(sorted(set(lows))) for high, lows in chunks.items()})
+
+    def __len__(self):
+        return sum(len(c) if isinstance(c, array) else c.bit_count() for c in self.containers.values())
+
+    def __bool__(self):
+        return bool(self.containers)
+
+    def _combine(self, other, operation, keep_missing: bool):
+        containers = {}
+        for high, container in self.containers.items():
+            if high in other.containers:
+                combined = operation(container, other.containers[high])
+                if combined:
+                    containers[high] = combined
+            elif keep_missing:
+                containers[high] = container
+        return containers
+
+    def __and__(self, other):
+        if len(self.containers) > len(other.containers):
+            self, other = other, self
+        return Bitmap(self._combine(other, _and, keep_missing=False))
+
+    def __or__(self, other):
+        containers = self._combine(other, _or, keep_missing=True)
+        for high, container in other.containers.items():
+            containers.setdefault(high, container)
+        return Bitmap(containers)
+
+    def __sub__(self, other):
+        return Bitmap(self._combine(other, _and_not, keep_missing=True))
+
+    def ids(self, limit: int = None):
+        """IDs in increasing order"""
+        ids = []
+        for high in sorted(self.containers):
+            base = high << 16
+            ids.extend(base + low for low in _lows(self.containers[high]))
+            if limit is not None and len(ids) >= limit:
+                return ids[:limit]
+        return ids
+
+    def to_bytes(self) -> bytes:
+        parts = [struct.pack("<I", len(self.containers))]
+        for high in sorted(self.containers):
+            container = self.containers[high]
+            if isinstance(container, array):
+                parts.append(struct.pack("<IBH", high, 0, len(container) - 1))
+                parts.append(container.tobytes())
+            else:
+                parts.append(struct.pack("<IBH", high, 1, 0))
+                parts.append(container.to_bytes(BITSET_BYTES, "little"))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        containers = {}
+        (count,), offset = struct.unpack_from("<I", data), 4
+        for _ in range(count):
+            high, kind, size = struct.unpack_from("<IBH", data, offset)
+            offset += 7
+            if kind == 0:
+                end = offset + 2 * (size + 1)
+                containers[high] = array("H", data[offset:end])
+            else:
+                end = offset + BITSET_BYTES
+                containers[high] = int.from_bytes(data[offset:end], "little")
+            offset = end
+        return cls(containers)
+
+
+def _container(lows):
+    """Array container for up to ARRAY_MAX sorted low bits, bitset container beyond"""
+    return array("H", lows) if len(lows) <= ARRAY_MAX else _container_bits(lows)
+
+
+def _lows(container):
+    if isinstance(container, array):
+        return container
+    if numpy is not None:
+        bits = numpy.unpackbits(numpy.frombuffer(container.to_bytes(BITSET_BYTES, "little"), dtype=numpy.uint8),
+                                bitorder="little")
+        return numpy.flatnonzero(bits).tolist()
+    data = container.to_bytes(BITSET_BYTES, "little")
+    return [(index << 3) + bit for index, byte in enumerate(data) if byte for bit in range(8) if byte >> bit & 1]
+
+
+def _bitset_contains(bitset_bytes: bytes, lows):
+    return [low for low in lows if bitset_bytes[low >> 3] >> (low & 7) & 1]
+
+
+def _and(a, b):
+    a_array, b_array = isinstance(a, array), isinstance(b, array)
+    if a_array and b_array:
+        small, large = (a, b) if len(a) <= len(b) else (b, a)
+        return array("H", sorted(set(small).intersection(large)))
+    if a_array or b_array:
+        lows, bitset = (a, b) if a_array else (b, a)
+        return array("H", _bitset_contains(bitset.to_bytes(BITSET_BYTES, "little"), lows))
+    result = a & b
+    return _container(_lows(result)) if result.bit_count() <= ARRAY_MAX else result
+
+
+def _or(a, b):
+    if isinstance(a, array) and isinstance(b, array):
+        return _container(sorted(set(a).union(b)))
+    a = a if isinstance(a, int) else _container_bits(a)
+    b = b if isinstance(b, int) else _container_bits(b)
+    return a | b
+
+
+def _and_not(a, b):
+    if isinstance(a, array):
+        if isinstance(b, array):
+            removed = set(b)
+            return array("H", [low for low in a if low not in removed])
+        return array("H", sorted(set(a).difference(_bitset_contains(b.to_bytes(BITSET_BYTES, "little"), a))))
+    result = a & ~(b if isinstance(b, int) else _container_bits(b))
+    return _container(_lows(result)) if result.bit_count() <= ARRAY_MAX else result
+
+
+def _container_bits(lows) -> int:
+    bits = bytearray(BITSET_BYTES)
+    for low in lows:
+        bits[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bits, "little")
+
+
+def extract_patent_claims(ds):
+    """Claims (as dicts like patent_claims.parse_claim returns) of the patent claim nanopubs in a dataset"""
+    nanopub = next(ds.subjects(RDF.type, NP.Nanopublication), None)
+    claims = []
+    for claim in ds.subjects(RDF.type, SCHEMA.CreativeWork):
+        description = ds.value(claim, SCHEMA.description)
+        if description is None:
+            continue
+        properties = defaultdict(list)
+        for prop in ds.objects(claim, SCHEMA.additionalProperty):
+            properties[str(ds.value(prop, SCHEMA.name))].append(ds.value(prop, SCHEMA.value))
+        preamble = str(ds.value(claim, SCHEMA.category) or "")
+        position = ds.value(claim, SCHEMA.position)
+        patent = ds.value(claim, SCHEMA.isPartOf)
+        depends_on = sorted(int(v) for v in properties.get("dependsOnClaim", ()))
+        claims.append({
+            "nanopub": str(nanopub) if nanopub is not None else None,
+            "claim": str(claim),
+            "patent": str(patent) if patent is not None else None,
+            "position": int(position) if position is not None else None,
+            "preamble": preamble,
+            "category": claim_category(preamble),
+            "transitional": str(properties["transitionalPhrase"][0]) if properties.get("transitionalPhrase") else None,
+            "elements": split_elements(str(description)),
+            "depends_on": depends_on or None,
+        })
+    return claims
+
+
+class PatentClaimIndex:
+    """SQLite-backed inverted index of claim element terms to compressed claim ID bitmaps"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS claims (
+                id INTEGER PRIMARY KEY,
+                file TEXT NOT NULL,
+                nanopub TEXT,
+                claim TEXT,
+                patent TEXT,
+                position INTEGER,
+                preamble TEXT,
+                transitional TEXT,
+                elements TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS claims_file ON claims (file);
+            CREATE TABLE IF NOT EXISTS postings (term TEXT PRIMARY KEY, bitmap BLOB NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL NOT NULL);
+        """)
+        self._pending = defaultdict(list)
+        self._pending_claims = 0
+        self._removed = []
+        self._cache = OrderedDict()
+        self._next_id = (self.db.execute("SELECT MAX(id) FROM claims").fetchone()[0] or 0) + 1
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _remove_file(self, file: str):
+        self._removed.extend(row[0] for row in self.db.execute("SELECT id FROM claims WHERE file = ?", (file,)))
+        self.db.execute("DELETE FROM claims WHERE file = ?", (file,))
+
+    def add_claims(self, file: str, claims):
+        """Index claims from one file (nanopub or parsed-claims JSONL), replacing any previous claims of it"""
+        self._remove_file(file)
+        rows = []
+        for claim in claims:
+            claim_id = self._next_id
+            self._next_id += 1
+            rows.append((claim_id, file, claim.get("nanopub"), claim.get("claim"), claim.get("patent"),
+                         claim.get("position"), claim.get("preamble"), claim.get("transitional"),
+                         json.dumps(claim["elements"], ensure_ascii=False)))
+            for term in claim_terms(claim):
+                self._pending[term].append(claim_id)
+            self._pending[LIVE].append(claim_id)
+        self.db.executemany("INSERT INTO claims VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self._pending_claims += len(rows)
+        if self._pending_claims >= FLUSH_EVERY:
+            self.flush()
+        return len(rows)
+
+    def flush(self):
+        """Merge the pending postings into the stored bitmaps"""
+        if not self._pending and not self._removed:
+            return
+        with self.db:
+            for term, ids in self._pending.items():
+                row = self.db.execute("SELECT bitmap FROM postings WHERE term = ?", (term,)).fetchone()
+                bitmap = Bitmap.from_ids(ids)
+                if row:
+                    bitmap = Bitmap.from_bytes(row[0]) | bitmap
+                self.db.execute("INSERT OR REPLACE INTO postings VALUES (?, ?)", (term, bitmap.to_bytes()))
+            if self._removed:
+                live = self._bitmap(LIVE, cached=False) - Bitmap.from_ids(self._removed)
+                self.db.execute("INSERT OR REPLACE INTO postings VALUES (?, ?)", (LIVE, live.to_bytes()))
+        self._pending.clear()
+        self._pending_claims = 0
+        self._removed.clear()
+        self._cache.clear()
+
+    def add_files(self, paths, force: bool = False):
+        """
+        Index every patent claim nanopub file (or parsed claims .jsonl file) under
+        the given paths; files unchanged since they were last indexed are skipped.
+        """
+        indexed = skipped = claims = 0
+        for path in iter_nanopub_files(paths):
+            file = str(Path(path).resolve())
+            mtime = Path(path).stat().st_mtime
+            row = self.db.execute("SELECT mtime FROM files WHERE path = ?", (file,)).fetchone()
+            if row and row[0] == mtime and not force:
+                skipped += 1
+                continue
+            if Path(path).suffix == ".jsonl":
+                with open(path, encoding="utf-8") as f:
+                    parsed = (json.loads(line) for line in f if line.strip())
+                    claims += self.add_claims(file, (c for c in parsed if "error" not in c))
+            else:
+                claims += self.add_claims(file, extract_patent_claims(load_nanopub_dataset(path)))
+            self.db.execute("INSERT OR REPLACE INTO files (path, mtime) VALUES (?, ?)", (file, mtime))
+            indexed += 1
+        self.flush()
+        self.db.commit()
+        return {"indexed": indexed, "skipped": skipped, "claims": claims}
+
+    def _bitmap(self, term: str, cached: bool = True) -> Bitmap:
+        if cached and term in self._cache:
+            self._cache.move_to_end(term)
+            return self._cache[term]
+        row = self.db.execute("SELECT bitmap FROM postings WHERE term = ?", (term,)).fetchone()
+        bitmap = Bitmap.from_bytes(row[0]) if row else Bitmap()
+        if cached:
+            self._cache[term] = bitmap
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return bitmap
+
+    def match(self, elements=(), transitional: str = None, category: str = None, dependent: bool = None,
+              exclude=()) -> Bitmap:
+        """
+        Bitmap of the claims having all `elements` (words or phrases) and none of `exclude`.
+        The word pairs of a longer phrase can come from different elements, so the claims
+        matching them are re-checked against their stored elements.
+        """
+        terms = [LIVE]
+        long_phrases = []
+        for phrase in elements:
+            terms.extend(phrase_terms(phrase) or ["e:"])
+            if len(tokenize(phrase)) > 2:
+                long_phrases.append(tokenize(phrase))
+        if transitional is not None:
+            terms.append(f"t:{transitional.lower()}")
+        if category is not None:
+            terms.append(f"c:{category.lower()}")
+        if dependent is not None:
+            terms.append("d:dependent" if dependent else "d:independent")
+        # intersect the rarest bitmaps first: the running result shrinks fastest
+        bitmaps = sorted((self._bitmap(term) for term in terms), key=len)
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            if not result:
+                break
+            result &= bitmap
+        if long_phrases and result:
+            result = self._containing(result, long_phrases)
+        for phrase in exclude:
+            terms = phrase_terms(phrase)
+            if not terms or not result:
+                continue
+            excluded = result
+            for term in terms:
+                excluded &= self._bitmap(term)
+            if len(terms) > 1 and excluded:
+                excluded = self._containing(excluded, [tokenize(phrase)])
+            result -= excluded
+        return result
+
+    def _containing(self, bitmap: Bitmap, phrases) -> Bitmap:
+        """The claims of a bitmap with an element containing each of the phrases (lists of words)"""
+        ids = bitmap.ids()
+        kept = []
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            sql = f"SELECT id, elements FROM claims WHERE id IN ({', '.join('?' * len(chunk))})"
+            for claim_id, elements in self.db.execute(sql, chunk):
+                elements = json.loads(elements)
+                if all(contains_phrase(elements, words) for words in phrases):
+                    kept.append(claim_id)
+        return Bitmap.from_ids(kept)
+
+    def claims(self, ids):
+        """Stored claims of a list of claim IDs"""
+        columns = ("id", "file", "nanopub", "claim", "patent", "position", "preamble", "transitional", "elements")
+        found = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            sql = f"SELECT {', '.join(columns)} FROM claims WHERE id IN ({', '.join('?' * len(chunk))})"
+            for row in self.db.execute(sql, chunk):
+                claim = dict(zip(columns, row))
+                claim["elements"] = json.loads(claim["elements"])
+                found[claim["id"]] = claim
+        return [found[i] for i in ids if i in found]
+
+    def query(self, elements=(), transitional: str = None, category: str = None, dependent: bool = None,
+              exclude=(), limit: int = 20):
+        """(number of matching claims, the first `limit` of them)"""
+        bitmap = self.match(elements, transitional, category, dependent, exclude)
+        return len(bitmap), self.claims(bitmap.ids(limit))
+
+    def __len__(self):
+        return len(self._bitmap(LIVE))
+
+
+def main():
+    """Build or query the element-level index of patent claims from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("index", type=Path, help="SQLite index file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="index patent claim nanopubs or parsed claims (.jsonl from patent_claims.py)")
+    build.add_argument("paths", nargs="+", type=Path, help=".trig/.nq/.jsonl files or directories")
+    build.add_argument("--force", action="store_true", help="re-index unchanged files")
+
+    query = sub.add_parser("query", help="find claims by their elements")
+    query.add_argument("--element", action="append", default=[], help="word or phrase an element must contain")
+    query.add_argument("--exclude", action="append", default=[], help="word or phrase no element may contain")
+    query.add_argument("--transitional", help="e.g. comprising, 'consisting of'")
+    query.add_argument("--category", help="e.g. apparatus, method")
+    query.add_argument("--dependent", action="store_true", default=None, help="only dependent claims")
+    query.add_argument("--independent", dest="dependent", action="store_false", help="only independent claims")
+    query.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args()
+
+    with PatentClaimIndex(args.index) as index:
+        if args.command == "build":
+            stats = index.add_files(args.paths, force=args.force)
+            print(f"✓ Indexed {stats['claims']} claims from {stats['indexed']} files "
+                  f"({stats['skipped']} unchanged), {len(index)} claims in {args.index}")
+            return
+        start = time.perf_counter()
+        count, claims = index.query(args.element, args.transitional, args.category, args.dependent,
+                                    args.exclude, args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for claim in claims:
+            print(f"{claim['patent'] or claim['file']}\t{claim['position']}\t{claim['preamble']} "
+                  f"{claim['transitional']}: {'; '.join(claim['elements'])}\t{claim['nanopub'] or ''}")
+        print(f"{count} claims ({elapsed:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Prometheus/OpenMetrics metrics for long-running nanopub generation jobs.
+
+Counters, gauges and histograms are kept in a small thread-safe registry and
+exposed in the Prometheus text format (or OpenMetrics, if the scraper asks for
+it) on a local HTTP endpoint, and/or written periodically to a .prom file for
+node_exporter's textfile collector. PipelineMetrics defines the metrics of
+nanopub_pipeline.py: items and errors per stage, bytes written, sign and publish
+latency, queue depths and the time of the last progress, for stall alerts such as
+
+    time() - nanopub_pipeline_last_progress_timestamp_seconds > 300
+"""
+
+import argparse
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+STAGES = ("build", "sign", "store", "publish")
+# seconds; signing takes milliseconds, publishing up to seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric family with optional labels"""
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self, openmetrics: bool = False):
+        name = self.name[:-len("_total")] if openmetrics and self.kind == "counter" else self.name
+        return [f"# HELP {name} {self.documentation}", f"# TYPE {name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Metric):
+    """A gauge; with `callback`, its value is read when the metrics are rendered"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback is not None:
+            # the callback returns a number, or a dict of label tuple -> number
+            values = self.callback()
+            items = sorted(values.items()) if isinstance(values, dict) else [((), values)]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self, openmetrics: bool = False) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.header(openmetrics))
+            lines.extend(metric.samples())
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(registry: MetricsRegistry, port: int = 9464, host: str = "127.0.0.1"):
+    """Serve the registry on http://host:port/metrics from a daemon thread, return the server"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            body = registry.render(openmetrics).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+class TextfileExporter:
+    """Writes the registry to a .prom file every `interval` seconds (atomically, for node_exporter)"""
+
+    def __init__(self, registry: MetricsRegistry, path: Path, interval: float = 15.0):
+        self.registry = registry
+        self.path = Path(path)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-textfile", daemon=True)
+
+    def write(self):
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.registry.render(), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def start(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.write()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the exporter, writing the final values"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.write()
+
+
+class PipelineMetrics:
+    """The metrics of a NanopubPipeline run"""
+
+    def __init__(self, registry: MetricsRegistry = None, queue_depths=None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.items = r.counter("nanopub_pipeline_items_total", "Items that completed a stage", ["stage"])
+        self.errors = r.counter("nanopub_pipeline_errors_total", "Items that failed in a stage", ["stage"])
+        self.bytes_written = r.counter("nanopub_pipeline_bytes_written_total", "Bytes of signed TriG written")
+        self.stage_seconds = r.histogram("nanopub_pipeline_stage_seconds",
+                                         "Time spent on one item that completed a stage", ["stage"])
+        self.last_progress = r.gauge("nanopub_pipeline_last_progress_timestamp_seconds",
+                                     "Unix time at which an item last completed any stage")
+        self.started = r.gauge("nanopub_pipeline_start_timestamp_seconds", "Unix time at which the run started")
+        self.started.set(time.time())
+        self.last_progress.set(time.time())
+        # export every stage from the start, so rate() and error alerts work before the first item
+        for stage in STAGES:
+            self.items.inc(0, stage=stage)
+            self.errors.inc(0, stage=stage)
+        self.queue_depths = queue_depths
+        r.gauge("nanopub_pipeline_queue_depth", "Items waiting in the queue in front of a stage", ["stage"],
+                callback=lambda: {(name,): depth for name, depth in (self.queue_depths() if self.queue_depths else {}).items()})
+
+    def observe(self, stage: str, seconds: float, error: bool = False):
+        """Record one item finished (or failed) by a stage; only finished items are timed"""
+        if error:
+            self.errors.inc(stage=stage)
+        else:
+            self.items.inc(stage=stage)
+            self.last_progress.set(time.time())
+            self.stage_seconds.observe(seconds, stage=stage)
+
+
+def main():
+    """Print the metrics a pipeline run exposes, or serve an empty registry for a quick check."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--serve", type=int, metavar="PORT", help="serve the metrics until interrupted")
+    parser.add_argument("--openmetrics", action="store_true")
+    args = parser.parse_args()
+
+    metrics = PipelineMetrics(queue_depths=lambda: dict.fromkeys(STAGES, 0))
+    if args.serve:
+        server = serve_metrics(metrics.registry, args.serve)
+        print(f"✓ Serving pipeline metrics on http://127.0.0.1:{args.serve}/metrics")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+    print(metrics.registry.render(args.openmetrics), end="")
+
+
+if __name__ == "__main__":
+    main()
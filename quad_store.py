@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Persistent, indexed on-disk quad store for generated nanopublications, so the
+whole corpus can be queried without re-parsing .trig files or loading it into
+memory.
+
+The store is an rdflib Store backed by SQLite. RDF terms are dictionary-encoded
+as integers (terms table, keyed by their N3 form) and quads are kept in a
+clustered SPO table with POS, OSP and graph indexes, so every triple pattern is
+answered by an index range scan. Because it is an rdflib Store, SPARQL queries
+run directly against it through rdflib's query engine:
+
+    store = SQLiteQuadStore("nanopubs.db")
+    for row in store.sparql(QUERY):
+        ...
+
+Nanopub files are added incrementally (unchanged files are skipped, changed
+files replace the quads they contributed before).
+"""
+
+import argparse
+import sqlite3
+import sys
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from rdflib import BNode, Dataset, Graph, Literal, URIRef, Variable
+from rdflib.graph import DATASET_DEFAULT_GRAPH_ID
+from rdflib.plugins.sparql import CUSTOM_EVALS
+from rdflib.plugins.sparql.evaluate import _join, evalPart
+from rdflib.store import Store, VALID_STORE
+from rdflib.util import from_n3
+
+from aida_records import iter_nanopub_files
+
+SCHEMA = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS quads (
+    s INTEGER NOT NULL, p INTEGER NOT NULL, o INTEGER NOT NULL, g INTEGER NOT NULL,
+    PRIMARY KEY (s, p, o, g)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS quads_pos ON quads (p, o, s);
+CREATE INDEX IF NOT EXISTS quads_osp ON quads (o, s, p);
+CREATE INDEX IF NOT EXISTS quads_g ON quads (g);
+CREATE TABLE IF NOT EXISTS namespaces (prefix TEXT PRIMARY KEY, namespace TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS file_graphs (path TEXT NOT NULL, g INTEGER NOT NULL, PRIMARY KEY (path, g));
+"""
+
+
+class SQLiteQuadStore(Store):
+    """rdflib Store keeping dictionary-encoded quads in SQLite with SPO/POS/OSP indexes"""
+
+    context_aware = True
+    graph_aware = True
+    formula_aware = False
+    transaction_aware = False
+
+    def __init__(self, configuration=None, identifier=None, cache_size: int = 100_000):
+        super().__init__(configuration, identifier)
+        self.db = None
+        self._lock = threading.RLock()
+        self._term = lru_cache(maxsize=cache_size)(self._load_term)
+        self._term_ids = {}
+        self._cache_size = cache_size
+        if configuration is not None:
+            self.open(configuration, create=True)
+
+    def open(self, configuration, create: bool = True):
+        self.path = Path(configuration)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction: bool = False):
+        if self.db is not None:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # term dictionary
+
+    def _load_term(self, term_id: int):
+        return from_n3(self.db.execute("SELECT term FROM terms WHERE id = ?", (term_id,)).fetchone()[0])
+
+    def _lookup(self, term):
+        """Id of a term, or None if the store has never seen it"""
+        key = term.n3()
+        term_id = self._term_ids.get(key)
+        if term_id is None:
+            row = self.db.execute("SELECT id FROM terms WHERE term = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            term_id = self._remember(key, row[0])
+        return term_id
+
+    def _encode(self, term) -> int:
+        """Id of a term, adding it to the dictionary if needed"""
+        term_id = self._lookup(term)
+        if term_id is None:
+            key = term.n3()
+            term_id = self._remember(key, self.db.execute("INSERT INTO terms (term) VALUES (?)", (key,)).lastrowid)
+        return term_id
+
+    def _forget_terms(self):
+        """Drop the cached term ids after a rollback: the ids of rolled back terms are handed out again"""
+        self._term_ids.clear()
+        self._term.cache_clear()
+
+    def _remember(self, key, term_id):
+        if len(self._term_ids) >= self._cache_size:
+            self._term_ids.clear()
+        self._term_ids[key] = term_id
+        return term_id
+
+    @staticmethod
+    def _context_id(context):
+        identifier = getattr(context, "identifier", context)
+        return DATASET_DEFAULT_GRAPH_ID if identifier is None else identifier
+
+    # rdflib Store interface
+
+    def add(self, triple, context=None, quoted=False):
+        with self._lock:
+            s, p, o = triple
+            self.db.execute(
+                "INSERT OR IGNORE INTO quads VALUES (?, ?, ?, ?)",
+                (self._encode(s), self._encode(p), self._encode(o), self._encode(self._context_id(context))),
+            )
+        super().add(triple, context, quoted)
+
+    def addN(self, quads):
+        with self._lock:
+            self.db.executemany("INSERT OR IGNORE INTO quads VALUES (?, ?, ?, ?)", [
+                (self._encode(s), self._encode(p), self._encode(o), self._encode(self._context_id(c)))
+                for s, p, o, c in quads
+            ])
+
+    def remove(self, triple_pattern, context=None):
+        where, params = self._where(triple_pattern, context)
+        if where is None:
+            return
+        with self._lock:
+            self.db.execute(f"DELETE FROM quads{where}", params)
+
+    def _where(self, triple_pattern, context):
+        """SQL WHERE clause for a pattern; (None, None) if a bound term is unknown (no matches)"""
+        clauses = []
+        params = []
+        terms = list(zip("spo", triple_pattern))
+        if context is not None:
+            terms.append(("g", self._context_id(context)))
+        for column, term in terms:
+            if term is None:
+                continue
+            term_id = self._lookup(term)
+            if term_id is None:
+                return None, None
+            clauses.append(f"{column} = ?")
+            params.append(term_id)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def triples(self, triple_pattern, context=None):
+        where, params = self._where(triple_pattern, context)
+        if where is None:
+            return
+        if context is not None:
+            graph = context if isinstance(context, Graph) else Graph(self, identifier=context)
+            for s, p, o in self.db.execute(f"SELECT s, p, o FROM quads{where}", params):
+                yield (self._term(s), self._term(p), self._term(o)), iter((graph,))
+            return
+        rows = self.db.execute(f"SELECT s, p, o, group_concat(g) FROM quads{where} GROUP BY s, p, o", params)
+        for s, p, o, graphs in rows:
+            contexts = [Graph(self, identifier=self._term(int(g))) for g in graphs.split(",")]
+            yield (self._term(s), self._term(p), self._term(o)), iter(contexts)
+
+    def __len__(self, context=None):
+        if context is None:
+            return self.db.execute("SELECT count(*) FROM (SELECT DISTINCT s, p, o FROM quads)").fetchone()[0]
+        graph_id = self._lookup(self._context_id(context))
+        if graph_id is None:
+            return 0
+        return self.db.execute("SELECT count(*) FROM quads WHERE g = ?", (graph_id,)).fetchone()[0]
+
+    def contexts(self, triple=None):
+        if triple is None:
+            rows = self.db.execute("SELECT DISTINCT g FROM quads")
+        else:
+            where, params = self._where(triple, None)
+            if where is None:
+                return
+            rows = self.db.execute(f"SELECT DISTINCT g FROM quads{where}", params)
+        for (graph_id,) in rows.fetchall():
+            yield Graph(self, identifier=self._term(graph_id))
+
+    def graph_ids(self, triple_pattern):
+        """Ids of the graphs containing triples that match a pattern"""
+        where, params = self._where(triple_pattern, None)
+        if where is None:
+            return set()
+        return {row[0] for row in self.db.execute(f"SELECT DISTINCT g FROM quads{where}", params)}
+
+    def add_graph(self, graph):
+        pass
+
+    def remove_graph(self, graph):
+        self.remove((None, None, None), graph)
+
+    def bind(self, prefix, namespace, override=True):
+        with self._lock:
+            if not override and self.namespace(prefix) is not None:
+                return
+            self.db.execute("INSERT OR REPLACE INTO namespaces VALUES (?, ?)", (prefix, str(namespace)))
+
+    def namespace(self, prefix):
+        row = self.db.execute("SELECT namespace FROM namespaces WHERE prefix = ?", (prefix,)).fetchone()
+        return URIRef(row[0]) if row else None
+
+    def prefix(self, namespace):
+        row = self.db.execute("SELECT prefix FROM namespaces WHERE namespace = ?", (str(namespace),)).fetchone()
+        return row[0] if row else None
+
+    def namespaces(self):
+        for prefix, namespace in self.db.execute("SELECT prefix, namespace FROM namespaces").fetchall():
+            yield prefix, URIRef(namespace)
+
+    def commit(self):
+        with self._lock:
+            self.db.commit()
+
+    def rollback(self):
+        with self._lock:
+            self.db.rollback()
+            self._forget_terms()
+
+    # nanopub corpus
+
+    def dataset(self) -> Dataset:
+        """Dataset view of the store; the default graph is the union of all graphs"""
+        return Dataset(store=self, default_union=True)
+
+    def sparql(self, query: str, **kwargs):
+        """Run a SPARQL query over the whole store"""
+        return self.dataset().query(query, **kwargs)
+
+    def match(self, s=None, p=None, o=None, g=None):
+        """Yield the (s, p, o, g) quads matching a pattern (None matches anything)"""
+        where, params = self._where((s, p, o), g)
+        if where is None:
+            return
+        for row in self.db.execute(f"SELECT s, p, o, g FROM quads{where}", params):
+            yield tuple(self._term(term_id) for term_id in row)
+
+    def add_nanopub(self, data: str, fmt: str = "trig", path: str = None):
+        """Add a nanopub given as TriG/N-Quads (read from `path`, if given), return the identifiers of its graphs"""
+        ds = Dataset()
+        ds.parse(data=data, format=fmt)
+        with self._lock:
+            try:
+                with self.db:
+                    if path is not None:
+                        self._forget_file(path)
+                    graphs = set()
+                    for s, p, o, g in ds.quads((None, None, None, None)):
+                        graphs.add(g)
+                    self.addN(ds.quads((None, None, None, None)))
+                    for prefix, namespace in ds.namespaces():
+                        if prefix not in ("this", "sub") and self.namespace(prefix) is None:
+                            self.bind(prefix, namespace)
+                    if path is not None:
+                        self.db.executemany("INSERT OR IGNORE INTO file_graphs VALUES (?, ?)",
+                                            [(path, self._encode(g)) for g in graphs])
+                        if Path(path).exists():
+                            self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?)",
+                                            (path, Path(path).stat().st_mtime))
+            except BaseException:
+                self._forget_terms()
+                raise
+        return graphs
+
+    def _forget_file(self, path: str):
+        """Remove the quads of the graphs a file contributed"""
+        self.db.execute("DELETE FROM quads WHERE g IN (SELECT g FROM file_graphs WHERE path = ?)", (path,))
+        self.db.execute("DELETE FROM file_graphs WHERE path = ?", (path,))
+
+    def add_files(self, paths, force: bool = False):
+        """
+        Add nanopub files, skipping the ones unchanged since they were added; return
+        (added, skipped, errors), errors being (path, message) for every file that failed
+        """
+        added = skipped = 0
+        errors = []
+        for path in iter_nanopub_files(paths):
+            key = str(Path(path).resolve())
+            mtime = path.stat().st_mtime
+            row = self.db.execute("SELECT mtime FROM files WHERE path = ?", (key,)).fetchone()
+            if row and row[0] == mtime and not force:
+                skipped += 1
+                continue
+            try:
+                self.add_nanopub(path.read_text(encoding="utf-8"), "nquads" if path.suffix == ".nq" else "trig", key)
+            except Exception as e:
+                errors.append((str(path), f"{type(e).__name__}: {e}"))
+                continue
+            added += 1
+        return added, skipped, errors
+
+    def stats(self):
+        return {
+            "quads": self.db.execute("SELECT count(*) FROM quads").fetchone()[0],
+            "terms": self.db.execute("SELECT count(*) FROM terms").fetchone()[0],
+            "graphs": self.db.execute("SELECT count(DISTINCT g) FROM quads").fetchone()[0],
+            "files": self.db.execute("SELECT count(*) FROM files").fetchone()[0],
+        }
+
+
+def _eval_graph(ctx, part):
+    """
+    GRAPH ?g { basic graph pattern } over a SQLiteQuadStore: visit only the graphs
+    that contain matches for every constant term of the pattern, instead of
+    evaluating the pattern against each graph of the store in turn.
+    """
+    store = getattr(ctx.dataset, "store", None)
+    if part.name != "Graph" or not isinstance(store, SQLiteQuadStore) or ctx[part.term] is not None \
+            or part.p.name != "BGP":
+        raise NotImplementedError()
+    graph_ids = None
+    for triple in part.p.triples:
+        pattern = tuple(ctx[term] if isinstance(term, Variable) else term for term in triple)
+        pattern = tuple(term if isinstance(term, (URIRef, Literal, BNode)) else None for term in pattern)
+        if pattern == (None, None, None):
+            continue
+        ids = store.graph_ids(pattern)
+        graph_ids = ids if graph_ids is None else graph_ids & ids
+    if graph_ids is None:
+        raise NotImplementedError()
+
+    return _eval_graphs(ctx.clone(), part, store, sorted(graph_ids))
+
+
+def _eval_graphs(ctx, part, store, graph_ids):
+    prev_graph = ctx.graph
+    for graph_id in graph_ids:
+        graph = ctx.dataset.get_context(store._term(graph_id))
+        if graph.identifier == DATASET_DEFAULT_GRAPH_ID:
+            continue
+        c = ctx.pushGraph(graph).push()
+        for x in _join(evalPart(c, part.p), [{part.term: graph.identifier}]):
+            x.ctx.graph = prev_graph
+            yield x
+
+
+CUSTOM_EVALS["quad_store_graph"] = _eval_graph
+
+
+def main():
+    """Load nanopub files into the quad store, or run a SPARQL query against it."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--store", type=Path, default=Path("nanopubs.db"), help="SQLite quad store file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    load = sub.add_parser("load", help="add nanopub files (unchanged files are skipped)")
+    load.add_argument("paths", nargs="+", type=Path, help=".trig/.nq files or directories")
+    load.add_argument("--force", action="store_true", help="re-add unchanged files")
+
+    query = sub.add_parser("query", help="run a SPARQL query (a string, a file, or - for stdin)")
+    query.add_argument("query")
+
+    sub.add_parser("stats", help="print the size of the store")
+
+    args = parser.parse_args()
+
+    with SQLiteQuadStore(args.store) as store:
+        if args.command == "load":
+            added, skipped, errors = store.add_files(args.paths, force=args.force)
+            for path, error in errors:
+                print(f"✗ {path}: {error}")
+            print(f"✓ Added {added} files to {args.store} ({skipped} unchanged"
+                  + (f", {len(errors)} failed)" if errors else ")"))
+        elif args.command == "query":
+            if args.query == "-":
+                text = sys.stdin.read()
+            elif Path(args.query).is_file():
+                text = Path(args.query).read_text(encoding="utf-8")
+            else:
+                text = args.query
+            result = store.sparql(text)
+            if result.type == "ASK":
+                print(result.askAnswer)
+            elif result.type == "CONSTRUCT" or result.type == "DESCRIBE":
+                print(result.serialize(format="turtle").decode("utf-8"))
+            else:
+                for row in result:
+                    print("\t".join("" if value is None else str(value) for value in row))
+        else:
+            for name, count in store.stats().items():
+                print(f"{name:<8} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Bulk retraction and superseding of published nanopublications.
+
+When a template or a data source is fixed, the nanopubs published from it have
+to be retracted (a new nanopub whose assertion is `<author> npx:retracts <old>`)
+or superseded (the corrected nanopub, with `<this> npx:supersedes <old>` in its
+pubinfo). Both only count when signed with the key of the original, so the
+nanopubs are signed through a key pool (see key_pool.py) as the author of each
+original, found with --author or from the original itself.
+
+The nanopubs to replace come from a file of trusty URIs, from a quad store
+(see quad_store.py) as all nanopubs created from a template or the first column
+of a SPARQL query, or, for superseding, from a TSV file of `old URI<TAB>new
+unsigned .trig file` lines. Originals are looked up in the quad store or in a
+directory of signed files to check that the signing key matches (skip the check
+with --force). Building, signing and publishing run through nanopub_pipeline.py,
+whose publish stage keeps a pool of connections, retries 429/5xx answers and can
+be rate-limited, and a journal makes interrupted runs resumable.
+"""
+
+import argparse
+import threading
+import time
+from pathlib import Path
+
+from rdflib import ConjunctiveGraph, Graph, URIRef
+from rdflib.namespace import PROV
+from nanopub import Nanopub, NanopubConf
+from nanopub.namespaces import NPX
+
+from aida_records import NP
+from key_pool import KeyPool, declared_author
+from nanopub_pipeline import NanopubPipeline
+from quad_store import SQLiteQuadStore
+
+NT_CREATED_FROM_TEMPLATE = URIRef("https://w3id.org/np/o/ntemplate/wasCreatedFromTemplate")
+
+# Nanopub(rdf=...) extracts the metadata with rdflib's SPARQL parser, which is not
+# thread-safe, and the build stage runs on several threads
+_parse_lock = threading.Lock()
+
+
+def _parse_nanopub(source, **kwargs) -> Nanopub:
+    g = ConjunctiveGraph()
+    g.parse(source, format="trig", **kwargs)
+    with _parse_lock:
+        return Nanopub(rdf=g)
+
+
+def read_uris(path: Path):
+    """Trusty URIs of a file, one per line ('#' starts a comment)"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                yield line
+
+
+def read_replacements(path: Path):
+    """(old URI, new unsigned .trig file) pairs of a TSV file; relative files are relative to it"""
+    for line in read_uris(path):
+        uri, _, replacement = line.partition("\t")
+        if not replacement:
+            raise ValueError(f"No replacement file for {uri} in {path}")
+        yield uri, Path(path).parent / replacement.strip()
+
+
+def uris_from_store(store: SQLiteQuadStore, template: str = None, sparql: str = None):
+    """Nanopubs created from a template, or the first column of a SPARQL query"""
+    if template is not None:
+        seen = set()
+        for s, _, _, _ in store.match(p=NT_CREATED_FROM_TEMPLATE, o=URIRef(template)):
+            if s not in seen:
+                seen.add(s)
+                yield str(s)
+        return
+    for row in store.sparql(sparql):
+        yield str(row[0])
+
+
+class Originals:
+    """Author and public key of published nanopubs, from a quad store and/or a directory of signed files"""
+
+    def __init__(self, store: SQLiteQuadStore = None, directory: Path = None):
+        self.store = store
+        self.directory = Path(directory) if directory else None
+        # the quad store's SQLite connection is shared by the build threads
+        self._lock = threading.Lock()
+
+    def lookup(self, uri: str):
+        """(author ORCID, public key) of the original, or (None, None) if it is not found"""
+        if self.store is not None:
+            with self._lock:
+                for _, _, pubinfo, _ in self.store.match(URIRef(uri), NP.hasPublicationInfo):
+                    author = next((o for _, _, o, _ in self.store.match(URIRef(uri), PROV.wasAttributedTo, None,
+                                                                          pubinfo)), None)
+                    key = next((o for _, _, o, _ in self.store.match(None, NPX.hasPublicKey, None, pubinfo)), None)
+                    return (str(author) if author else None), (str(key) if key else None)
+        if self.directory is not None:
+            path = self.directory / f"{uri.rsplit('/', 1)[-1]}.trig"
+            if path.exists():
+                np = _parse_nanopub(path)
+                return declared_author(np), np.metadata.public_key
+        return None, None
+
+
+def build_retraction(uri: str, author: str) -> Nanopub:
+    """Unsigned nanopub retracting `uri` on behalf of `author`"""
+    assertion = Graph()
+    assertion.add((URIRef(author), NPX.retracts, URIRef(uri)))
+    np = Nanopub(conf=NanopubConf(add_prov_generated_time=True, add_pubinfo_generated_time=True),
+                 assertion=assertion)
+    np.provenance.add((np.metadata.assertion, PROV.wasAttributedTo, URIRef(author)))
+    np.pubinfo.add((np.metadata.np_uri, PROV.wasAttributedTo, URIRef(author)))
+    return np
+
+
+def build_superseding(trig: str, uri: str) -> Nanopub:
+    """The unsigned replacement nanopub (TriG) with `<this> npx:supersedes <uri>` added to its pubinfo"""
+    np = _parse_nanopub(None, data=trig)
+    if np.metadata.signature:
+        raise ValueError(f"Replacement for {uri} is already signed ({np.source_uri})")
+    np.pubinfo.add((np.metadata.np_uri, NPX.supersedes, URIRef(uri)))
+    return np
+
+
+class Replacer:
+    """Builds the retracting or superseding nanopub of an item, checking its author and key"""
+
+    def __init__(self, key_pool: KeyPool, originals: Originals, author: str = None, force: bool = False):
+        self.key_pool = key_pool
+        self.originals = originals
+        self.author = author
+        self.force = force
+
+    def _author(self, item: dict, replacement: Nanopub = None) -> str:
+        original_author, public_key = self.originals.lookup(item["uri"])
+        author = self.author or original_author or (declared_author(replacement) if replacement else None)
+        if author is None:
+            raise ValueError(f"No author known for {item['uri']}: give --author or the originals")
+        if author not in self.key_pool:
+            raise ValueError(f"No key for {author} in the key pool")
+        if not self.force:
+            if public_key is None:
+                raise ValueError(f"Original of {item['uri']} not found, cannot check its key (use --force)")
+            if "".join(public_key.split()) != "".join(self.key_pool.get(author).public_key.split()):
+                raise ValueError(f"{item['uri']} was not signed with the key of {author}")
+        return author
+
+    def __call__(self, item: dict) -> Nanopub:
+        if item.get("replacement") is None:
+            # the pipeline asks for the item's author after building it
+            item["author"] = self._author(item)
+            return build_retraction(item["uri"], item["author"])
+        replacement = build_superseding(Path(item["replacement"]).read_text(encoding="utf-8"), item["uri"])
+        item["author"] = self._author(item, replacement)
+        return replacement
+
+
+def main():
+    """Retract or supersede published nanopubs in bulk."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    retract = sub.add_parser("retract", help="publish a retraction of each nanopub")
+    retract.add_argument("uris", nargs="?", type=Path, help="file of trusty URIs, one per line")
+    retract.add_argument("--template", help="retract every nanopub in --store created from this template")
+    retract.add_argument("--sparql", help="retract the nanopubs in the first column of this query on --store")
+
+    supersede = sub.add_parser("supersede", help="publish a replacement that supersedes each nanopub")
+    supersede.add_argument("replacements", type=Path, help="TSV file of 'old URI<TAB>new unsigned .trig file'")
+
+    for command in (retract, supersede):
+        command.add_argument("--key-pool", type=Path, required=True, help="key pool JSON file (see key_pool.py)")
+        command.add_argument("--author", help="sign everything as this ORCID instead of the originals' authors")
+        command.add_argument("--store", type=Path, help="quad store with the originals")
+        command.add_argument("--originals", type=Path, help="directory of the signed originals (<artefact>.trig)")
+        command.add_argument("--force", action="store_true", help="do not check that the originals' keys match")
+        command.add_argument("--output-dir", type=Path, default=Path("signed_nanopubs"))
+        command.add_argument("--publish", action="store_true")
+        command.add_argument("--test-server", action="store_true", help="publish to the nanopub test server")
+        command.add_argument("--server", help="publish to this server instead (e.g. a local_registry.py instance)")
+        command.add_argument("--publish-rate", type=float, help="publish at most this many nanopubs per second")
+        command.add_argument("--publish-concurrency", type=int, default=16)
+        command.add_argument("--sign-workers", type=int)
+        command.add_argument("--journal", type=Path, help="journal file to resume an interrupted run")
+
+    args = parser.parse_args()
+
+    store = SQLiteQuadStore(args.store) if args.store else None
+    if args.command == "retract":
+        if args.uris:
+            items = [{"uri": uri} for uri in read_uris(args.uris)]
+        elif store is not None and (args.template or args.sparql):
+            items = [{"uri": uri} for uri in uris_from_store(store, args.template, args.sparql)]
+        else:
+            parser.error("Give a file of URIs, or --store with --template or --sparql")
+    else:
+        items = [{"uri": uri, "replacement": path} for uri, path in read_replacements(args.replacements)]
+
+    key_pool = KeyPool(args.key_pool)
+    results = []
+    lock = threading.Lock()
+
+    def on_result(item, source_uri, path):
+        with lock:
+            results.append((item["uri"], source_uri))
+
+    pipeline = NanopubPipeline(
+        build=Replacer(key_pool, Originals(store, args.originals), args.author, args.force),
+        profile=None,
+        key_pool=args.key_pool,
+        author=lambda item: item["author"],
+        output_dir=args.output_dir,
+        publish=args.publish,
+        use_test_server=args.test_server,
+        server=args.server,
+        publish_rate=args.publish_rate,
+        publish_concurrency=args.publish_concurrency,
+        sign_workers=args.sign_workers,
+        journal=args.journal,
+        on_result=on_result,
+    )
+    start = time.monotonic()
+    pipeline.run(items, progress_every=10)
+    if store is not None:
+        store.close()
+
+    report = args.output_dir / f"{args.command}.tsv"
+    with open(report, "a", encoding="utf-8") as f:
+        for uri, source_uri in results:
+            f.write(f"{uri}\t{source_uri}\n")
+    action = {"retract": "retracted", "supersede": "superseded"}[args.command]
+    print(f"\n✓ {len(results)} of {len(items)} nanopubs {action} ({'published' if args.publish else 'signed'}) "
+          f"in {time.monotonic() - start:.1f}s, listed in {report}")
+    print(pipeline.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Sharded, compressed output for large batches of signed nanopubs.
+
+Instead of one uncompressed .trig file per nanopub, a ShardWriter appends each
+nanopub to one of N shard files, chosen by a hash of its trusty URI, through a
+streaming gzip (or zstd, if the zstandard package is installed) compressor.
+A shard is a valid TriG file: the concatenated nanopubs, each preceded by a
+`# nanopub <length> <trusty URI>` comment line so that single nanopubs can be
+read back.
+
+Every writer owns its shard files (shard-<shard>-<writer>.trig.gz), so any
+number of threads or processes write into the same directory without locks.
+When a writer is closed it writes a small manifest of its files; write_manifest
+merges them into manifest.json with the count, size and SHA-256 checksum of
+every file and the number of nanopubs of every shard. The shards of a writer
+that never closed (a crashed run) are unsealed: salvage() moves their readable
+nanopubs, without duplicates, to a new writer.
+
+    writer = ShardWriter("signed_nanopubs", shards=64)
+    writer.write(np.source_uri, trig)
+    writer.close()
+    write_manifest("signed_nanopubs")
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from aida_records import iter_nanopub_files
+
+COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+MANIFEST = "manifest.json"
+PART_MANIFEST_SUFFIX = ".manifest.json"
+HEADER_PREFIX = "# nanopub "
+
+
+def shard_of(source_uri: str, shards: int) -> int:
+    """Shard of a nanopub: CRC-32 of its trusty artefact, stable across processes and runs"""
+    return zlib.crc32(source_uri.rsplit("/", 1)[-1].encode()) % shards
+
+
+def writer_name() -> str:
+    """Unique name for a writer, so that runs and processes never share files"""
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{os.urandom(3).hex()}"
+
+
+class _HashingFile:
+    """Binary file that keeps the size and SHA-256 of everything written to it"""
+
+    def __init__(self, path: Path):
+        self.file = open(path, "xb")
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _Shard:
+    """One open shard file of a writer"""
+
+    def __init__(self, path: Path, compression: str, level: int = None):
+        self.path = path
+        self.raw = _HashingFile(path)
+        self.count = 0
+        if compression == "gzip":
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode="wb", compresslevel=level or 6, mtime=0)
+        elif compression == "zstd":
+            self.stream = zstandard.ZstdCompressor(level=level or 3).stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+
+    def write(self, source_uri: str, trig: str):
+        if not trig.endswith("\n"):
+            trig += "\n"
+        # the length in characters, a literal may contain anything that looks like a header
+        self.stream.write(f"{HEADER_PREFIX}{len(trig)} {source_uri}\n{trig}".encode("utf-8"))
+        self.count += 1
+
+    def flush(self):
+        """Push everything written so far to the file, so that it can be read back after a crash"""
+        if isinstance(self.stream, gzip.GzipFile):
+            self.stream.flush(zlib.Z_SYNC_FLUSH)
+        elif self.stream is not self.raw:
+            self.stream.flush(zstandard.FLUSH_BLOCK)
+        self.raw.flush()
+
+    def close(self) -> dict:
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+        return {"file": self.path.name, "count": self.count, "bytes": self.raw.size,
+                "sha256": self.raw.sha256.hexdigest()}
+
+
+class ShardWriter:
+    """Appends nanopubs to its own set of compressed shard files; one writer per thread or process"""
+
+    def __init__(self, output_dir: Path, shards: int = 16, compression: str = "gzip", name: str = None,
+                 level: int = None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of {', '.join(COMPRESSIONS)}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package (pip install zstandard)")
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.shards = shards
+        self.compression = compression
+        self.name = name or writer_name()
+        self.level = level
+        self._open = {}
+
+    def path(self, shard: int) -> Path:
+        return self.output_dir / f"shard-{shard:05d}-{self.name}.trig{COMPRESSIONS[self.compression]}"
+
+    def write(self, source_uri: str, trig: str, flush: bool = False) -> Path:
+        """Append a signed nanopub to its shard, return the shard file.
+        With flush=True the nanopub is on disk (and readable from an unsealed shard) on return."""
+        shard = shard_of(source_uri, self.shards)
+        entry = self._open.get(shard)
+        if entry is None:
+            entry = self._open[shard] = _Shard(self.path(shard), self.compression, self.level)
+        entry.write(source_uri, trig)
+        if flush:
+            entry.flush()
+        return entry.path
+
+    def flush(self):
+        """Push everything written so far to the shard files (see _Shard.flush)"""
+        for entry in self._open.values():
+            entry.flush()
+
+    @property
+    def bytes_written(self) -> int:
+        """Compressed bytes written so far (the compressors hold back a little until closed)"""
+        return sum(entry.raw.size for entry in self._open.values())
+
+    def close(self) -> dict:
+        """Close the shard files and write this writer's manifest, return it"""
+        files = []
+        for shard, entry in sorted(self._open.items()):
+            files.append({"shard": shard, **entry.close()})
+        self._open = {}
+        manifest = {"shards": self.shards, "compression": self.compression, "writer": self.name, "files": files}
+        if not files:
+            return manifest
+        part = self.output_dir / f"{self.name}{PART_MANIFEST_SUFFIX}"
+        tmp = part.with_name(f".{part.name}.tmp")
+        tmp.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+        os.replace(tmp, part)
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_manifest(output_dir: Path) -> dict:
+    """Merge the writers' manifests of a directory into manifest.json, return it"""
+    output_dir = Path(output_dir)
+    parts = [json.loads(path.read_text(encoding="utf-8"))
+             for path in sorted(output_dir.glob(f"*{PART_MANIFEST_SUFFIX}"))]
+    layouts = {(part["shards"], part["compression"]) for part in parts}
+    if len(layouts) > 1:
+        raise ValueError(f"{output_dir} mixes shard layouts {sorted(layouts)}")
+    shards, compression = layouts.pop() if layouts else (0, None)
+    files = sorted((entry for part in parts for entry in part["files"]),
+                   key=lambda entry: (entry["shard"], entry["file"]))
+    counts = [0] * shards
+    for entry in files:
+        counts[entry["shard"]] += entry["count"]
+    manifest = {
+        "shards": shards,
+        "compression": compression,
+        "hash": "crc32(trusty artefact) % shards",
+        "nanopubs": sum(counts),
+        "bytes": sum(entry["bytes"] for entry in files),
+        "shard_counts": counts,
+        "files": files,
+    }
+    tmp = output_dir / f".{MANIFEST}.tmp"
+    tmp.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    os.replace(tmp, output_dir / MANIFEST)
+    return manifest
+
+
+def open_shard(path: Path):
+    """Text stream of a (compressed) shard file, without newline translation"""
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise ValueError("Reading zstd shards needs the zstandard package (pip install zstandard)")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True),
+                                encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def iter_shard(path: Path, partial: bool = False):
+    """Yield (trusty URI, TriG) of every nanopub of a shard file, streaming.
+    With partial=True a shard cut off by a crash is read up to its last complete nanopub."""
+    with open_shard(path) as f:
+        try:
+            while header := f.readline():
+                if not header.startswith(HEADER_PREFIX) or not header.endswith("\n"):
+                    if partial:
+                        return
+                    raise ValueError(f"{path} is not a shard file (no header before {header[:40]!r})")
+                length, source_uri = header[len(HEADER_PREFIX):].split()
+                trig = f.read(int(length))
+                if partial and len(trig) < int(length):
+                    return
+                yield source_uri, trig
+        except (EOFError, zlib.error):
+            if not partial:
+                raise
+
+
+def unsealed_shards(output_dir: Path):
+    """Shard files that no writer's manifest lists: left behind by a writer that never closed"""
+    output_dir = Path(output_dir)
+    sealed = {entry["file"] for path in output_dir.glob(f"*{PART_MANIFEST_SUFFIX}")
+              for entry in json.loads(path.read_text(encoding="utf-8"))["files"]}
+    return sorted(path for path in output_dir.glob("shard-*.trig*") if path.name not in sealed)
+
+
+def salvage(output_dir: Path, writer: ShardWriter) -> set:
+    """
+    Move the readable nanopubs of the unsealed shards of a directory to `writer`, once
+    each, and delete those shards; return the trusty URIs found in them. Only call this
+    while no other writer is writing into the directory.
+    """
+    found = set()
+    paths = unsealed_shards(output_dir)
+    for path in paths:
+        for source_uri, trig in iter_shard(path, partial=True):
+            if source_uri not in found:
+                found.add(source_uri)
+                writer.write(source_uri, trig)
+    writer.flush()
+    for path in paths:
+        path.unlink()
+    return found
+
+
+def verify(output_dir: Path):
+    """Check every file of manifest.json against its size, checksum and count; return the problems"""
+    output_dir = Path(output_dir)
+    manifest = json.loads((output_dir / MANIFEST).read_text(encoding="utf-8"))
+    problems = []
+    for entry in manifest["files"]:
+        path = output_dir / entry["file"]
+        if not path.exists():
+            problems.append(f"{entry['file']}: missing")
+            continue
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            while block := f.read(1 << 20):
+                sha256.update(block)
+        if path.stat().st_size != entry["bytes"] or sha256.hexdigest() != entry["sha256"]:
+            problems.append(f"{entry['file']}: checksum mismatch")
+            continue
+        count = 0
+        for source_uri, _ in iter_shard(path):
+            count += 1
+            if shard_of(source_uri, manifest["shards"]) != entry["shard"]:
+                problems.append(f"{entry['file']}: {source_uri} belongs to another shard")
+        if count != entry["count"]:
+            problems.append(f"{entry['file']}: {count} nanopubs, the manifest says {entry['count']}")
+    return problems
+
+
+def _source_uri(trig: str) -> str:
+    """Trusty URI of a signed nanopub as serialized by rdflib (its `this:` prefix)"""
+    for line in trig.splitlines():
+        if line.startswith("@prefix this: <"):
+            return line[len("@prefix this: <"):line.index(">")]
+    raise ValueError("No `this:` prefix, not a signed nanopub")
+
+
+def _pack(paths, output_dir: str, shards: int, compression: str, name: str):
+    with ShardWriter(output_dir, shards, compression, name) as writer:
+        for path in paths:
+            trig = Path(path).read_text(encoding="utf-8")
+            writer.write(_source_uri(trig), trig)
+    return len(paths)
+
+
+def pack(paths, output_dir: Path, shards: int = 16, compression: str = "gzip", workers: int = None) -> dict:
+    """Shard signed .trig files into output_dir with parallel writers, return the merged manifest"""
+    files = [str(path) for path in iter_nanopub_files(paths) if path.suffix == ".trig"]
+    workers = max(1, min(workers or os.cpu_count(), len(files)))
+    run = writer_name()
+    with ProcessPoolExecutor(workers) as pool:
+        list(pool.map(_pack, [files[i::workers] for i in range(workers)], [str(output_dir)] * workers,
+                      [shards] * workers, [compression] * workers, [f"{run}-w{i:02d}" for i in range(workers)]))
+    return write_manifest(output_dir)
+
+
+def main():
+    """Pack signed nanopubs into compressed shards, rebuild or verify a manifest."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output_dir", type=Path, help="directory of the shards")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = sub.add_parser("pack", help="shard signed .trig files (the files are left in place)")
+    pack_parser.add_argument("paths", nargs="+", type=Path, help="signed .trig files or directories")
+    pack_parser.add_argument("--shards", type=int, default=16)
+    pack_parser.add_argument("--compression", choices=list(COMPRESSIONS), default="gzip")
+    pack_parser.add_argument("--workers", type=int)
+
+    sub.add_parser("manifest", help="rebuild manifest.json from the writers' manifests")
+    sub.add_parser("verify", help="check sizes, checksums, counts and shard assignment")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "pack":
+            start = time.monotonic()
+            original = sum(path.stat().st_size for path in iter_nanopub_files(args.paths) if path.suffix == ".trig")
+            manifest = pack(args.paths, args.output_dir, args.shards, args.compression, args.workers)
+            print(f"✓ {manifest['nanopubs']} nanopubs in {len(manifest['files'])} files, "
+                  f"{original / 1e6:.1f} MB -> {manifest['bytes'] / 1e6:.1f} MB in {time.monotonic() - start:.1f}s")
+        elif args.command == "manifest":
+            manifest = write_manifest(args.output_dir)
+            print(f"✓ {manifest['nanopubs']} nanopubs in {len(manifest['files'])} files")
+        else:
+            problems = verify(args.output_dir)
+            for problem in problems:
+                print(f"✗ {problem}")
+            if problems:
+                raise SystemExit(1)
+            print(f"✓ All files of {args.output_dir / MANIFEST} verified")
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Seeded synthetic workloads of filled AIDA, paper, patent claim and Rosetta nanopubs.
+
+Benchmarks and capacity planning need many realistic instances of every
+template, not the single example each create_*_template_and_publish.py script
+builds. This module generates any number of filled records per template from a
+seed, with configurable distributions for the sizes that drive the cost of a
+nanopub:
+
+    sentence_words  words per AIDA sentence (kept within the [\\S ]{5,500}\\. regex)
+    topics          topics per AIDA sentence
+    chunks          text chunks per AIDA sentence
+    chunk_words     words per text chunk
+    authors         authors per paper
+    citations       citations per paper
+    fields          research fields per paper
+    claims          claims per patent (each claim is one nanopub)
+    claim_elements  elements per patent claim
+    arity           object positions per Rosetta statement (1-4)
+    sources         source references per Rosetta statement
+
+A distribution is written as kind:parameters, e.g. fixed:3, uniform:1:8,
+poisson:3, geometric:0.3, lognormal:2.7:0.4 or choice:1,1,2,4. Records are
+generated sequentially from one random generator per template, so the first
+10k records of a 1M run are the 10k records of a 10k run with the same seed.
+
+Records stream to JSONL (AIDA records use the layout of aida_records.py and can
+be fed to aida_batch.py as they are) or straight into nanopub_pipeline.py.
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from itertools import accumulate, islice
+from pathlib import Path
+
+from rdflib import Graph, Literal, Namespace, URIRef
+from rdflib.namespace import DCTERMS, FOAF, RDF, RDFS, XSD
+from nanopub import Nanopub, NanopubConf, Profile
+from nanopub.definitions import NP_TEMP_PREFIX
+
+from aida_batch import AidaBatchWriter
+from aida_records import CITATION_TYPES as AIDA_CITATION_TYPES, CITO
+from create_aida_template_and_publish import EXTRACTION_TYPES
+from create_patent_claim_template_and_publish import claim_description, create_patent_claim
+
+DOCO = Namespace("http://purl.org/spar/doco/")
+DEO = Namespace("http://purl.org/spar/deo/")
+FABIO = Namespace("http://purl.org/spar/fabio/")
+ROSETTA = Namespace("https://w3id.org/rosetta/")
+WIKIDATA = Namespace("http://www.wikidata.org/entity/")
+
+# Introduced and local resources live in the nanopub's own namespace until signing
+BASE = NP_TEMP_PREFIX + "np#"
+
+TEMPLATES = ("aida", "paper", "patent", "rosetta")
+
+DEFAULT_DISTRIBUTIONS = {
+    "sentence_words": "lognormal:2.7:0.4",
+    "topics": "uniform:1:3",
+    "chunks": "poisson:3",
+    "chunk_words": "lognormal:3.5:0.5",
+    "authors": "uniform:1:8",
+    "citations": "poisson:12",
+    "fields": "uniform:0:3",
+    "claims": "poisson:15",
+    "claim_elements": "uniform:2:6",
+    "arity": "choice:1,1,1,2,2,3,4",
+    "sources": "poisson:1",
+}
+
+# (low, high) bounds every sample is clamped to; they keep records valid for
+# their template and below the nanopub size limit
+BOUNDS = {
+    "sentence_words": (1, 100),
+    "topics": (0, 20),
+    "chunks": (0, 100),
+    "chunk_words": (1, 400),
+    "authors": (1, 100),
+    "citations": (0, 500),
+    "fields": (0, 20),
+    "claims": (1, 200),
+    "claim_elements": (1, 20),
+    "arity": (1, 4),
+    "sources": (0, 50),
+}
+
+DOI_PREFIX = "https://doi.org/10.5555/synthetic."
+PATENT_PREFIX = "https://patents.google.com/patent/US"
+PAPER_CITATION_TYPES = [
+    CITO.cites, CITO.extends, CITO.supports, CITO.agreesWith,
+    CITO.disagreesWith, CITO.citesAsEvidence, CITO.usesMethodIn, CITO.usesDataFrom
+]
+SECTIONS = {"introduction": DEO.Introduction, "methods": DEO.Methods, "results": DEO.Results,
+            "discussion": DEO.Discussion}
+TRANSITIONAL_PHRASES = ["comprising", "including", "consisting of", "consisting essentially of", "having"]
+TRANSITIONAL_WEIGHTS = [70, 10, 8, 7, 5]
+CLAIM_CATEGORIES = ["apparatus", "method", "system", "device", "composition", "assembly", "kit", "process"]
+TEMPORAL_RESOLUTIONS = ["P1D", "P1M", "P1Y", "PT1H"]
+AUTHOR_POOL = 50_000
+# synthetic ORCID iDs start at 0000-0002-0000-0000
+ORCID_BASE = 2 * 10**7
+TOPIC_POOL = 20_000
+STATEMENT_TYPES = 200
+
+SYLLABLES = ("ba be bi bo bu da de di do du fa fe fi fo ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no "
+             "nu pa pe pi po pu ra re ri ro ru sa se si so su ta te ti to tu va ve vi vo za ze zi zo "
+             "an en in on ar er or al el il ol ex ion ter ster tral phy gen sis").split()
+
+# real words the claim parser and text indexes treat specially, never generated
+FUNCTION_WORDS = {"a", "an", "and", "or", "of", "in", "on", "to", "the", "at", "as", "is", "be", "by"}
+
+
+def _make_vocabulary(size: int = 4000, seed: int = 0):
+    """Pseudo-words with Zipf-like frequencies, the same for every run"""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.choice((1, 2, 2, 3, 3, 4))))
+        if word not in FUNCTION_WORDS:
+            words.add(word)
+    words = sorted(words, key=lambda w: (len(w), w))
+    return words, list(accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+WORDS, WORD_WEIGHTS = _make_vocabulary()
+
+
+class Distribution:
+    """A distribution of non-negative integers given as kind:parameters (e.g. poisson:3)"""
+
+    KINDS = ("fixed", "uniform", "poisson", "geometric", "lognormal", "choice")
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown distribution {kind!r} in {spec!r}, expected one of {', '.join(self.KINDS)}")
+        self.kind = kind
+        try:
+            if kind == "choice":
+                self.params = [int(v) for v in params.split(",")]
+            else:
+                self.params = [float(v) for v in params.split(":")]
+        except ValueError:
+            raise ValueError(f"Invalid parameters in distribution {spec!r}") from None
+        expected = {"fixed": 1, "uniform": 2, "poisson": 1, "geometric": 1, "lognormal": 2}.get(kind)
+        if expected is not None and len(self.params) != expected:
+            raise ValueError(f"{kind} takes {expected} parameter(s), got {spec!r}")
+        if kind == "geometric" and not 0 < self.params[0] <= 1:
+            raise ValueError(f"geometric needs 0 < p <= 1, got {spec!r}")
+
+    def sample(self, rng: random.Random) -> int:
+        kind, params = self.kind, self.params
+        if kind == "fixed":
+            return int(params[0])
+        if kind == "uniform":
+            return rng.randint(int(params[0]), int(params[1]))
+        if kind == "choice":
+            return rng.choice(params)
+        if kind == "lognormal":
+            return round(rng.lognormvariate(*params))
+        if kind == "geometric":
+            p = params[0]
+            return 0 if p == 1 else int(math.log(1.0 - rng.random()) / math.log(1.0 - p))
+        lam = params[0]
+        if lam > 30:
+            return max(0, round(rng.gauss(lam, math.sqrt(lam))))
+        # Knuth's method, fine for the small means used here
+        limit, k, p = math.exp(-lam), 0, rng.random()
+        while p > limit:
+            k += 1
+            p *= rng.random()
+        return k
+
+    def __repr__(self):
+        return f"Distribution({self.spec!r})"
+
+
+def parse_distributions(overrides=()):
+    """Default distributions updated with name=spec overrides"""
+    specs = dict(DEFAULT_DISTRIBUTIONS)
+    for override in overrides:
+        name, sep, spec = override.partition("=")
+        if not sep or name not in specs:
+            raise ValueError(f"Expected NAME=SPEC with NAME one of {', '.join(specs)}, got {override!r}")
+        specs[name] = spec
+    return {name: Distribution(spec) for name, spec in specs.items()}
+
+
+def orcid(number: int) -> str:
+    """A syntactically valid ORCID iD (ISO 7064 11-2 check digit) for a number"""
+    digits = f"{number % 10**15:015d}"
+    total = 0
+    for digit in digits:
+        total = (total + int(digit)) * 2
+    check = (12 - total % 11) % 11
+    base = digits + ("X" if check == 10 else str(check))
+    return "https://orcid.org/" + "-".join(base[i:i + 4] for i in range(0, 16, 4))
+
+
+def doi(number: int) -> str:
+    return f"{DOI_PREFIX}{number}"
+
+
+class WorkloadGenerator:
+    """Generates filled records of one template; records() is deterministic for a seed"""
+
+    def __init__(self, template: str, seed: int = 0, distributions: dict = None, count: int = None):
+        if template not in TEMPLATES:
+            raise ValueError(f"Unknown template {template!r}, expected one of {', '.join(TEMPLATES)}")
+        self.template = template
+        self.seed = seed
+        self.distributions = distributions or parse_distributions()
+        # number of papers the AIDA sentences and citations can refer to
+        self.papers = max(count or 0, 1000)
+        self.rng = random.Random(f"{seed}:{template}")
+
+    def size(self, name: str) -> int:
+        low, high = BOUNDS[name]
+        return min(max(self.distributions[name].sample(self.rng), low), high)
+
+    def words(self, count: int) -> str:
+        return " ".join(self.rng.choices(WORDS, cum_weights=WORD_WEIGHTS, k=count))
+
+    def sentence(self, words: int = None, max_length: int = 500) -> str:
+        """A sentence matching [\\S ]{5,max_length}\\."""
+        text = self.words(words or self.size("sentence_words")).capitalize()
+        if len(text) > max_length:
+            text = text[:max_length].rsplit(" ", 1)[0]
+        while len(text) < 5:
+            text += " " + self.words(1)
+        return text + "."
+
+    def abstract(self) -> str:
+        """A few sentences, within the .{50,2000} regex of the paper template"""
+        text = ""
+        while len(text) < 50:
+            text = " ".join(filter(None, (text, self.sentence())))
+        return text[:2000]
+
+    def author(self):
+        number = self.rng.randrange(AUTHOR_POOL)
+        # names are derived from the author number, so an ORCID always has the same name
+        rng = random.Random(number)
+        return {"orcid": orcid(ORCID_BASE + number),
+                "name": f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS).capitalize()}"}
+
+    def topic(self) -> str:
+        return str(WIKIDATA[f"Q{1 + int(self.rng.paretovariate(1.2) * 1000) % TOPIC_POOL}"])
+
+    def records(self, count: int):
+        """Yield `count` records"""
+        for record in islice(getattr(self, f"_{self.template}_records")(), count):
+            yield {"template": self.template, **record}
+
+    def _aida_records(self):
+        rng = self.rng
+        while True:
+            paper = doi(rng.randrange(self.papers))
+            lon, lat = rng.uniform(-180, 180), rng.uniform(-80, 80)
+            if rng.random() < 0.7:
+                spatial = f"POINT ({lon:.4f} {lat:.4f})"
+            else:
+                w, h = rng.uniform(0.1, 20), rng.uniform(0.1, 10)
+                spatial = (f"POLYGON (({lon:.4f} {lat:.4f}, {lon + w:.4f} {lat:.4f}, {lon + w:.4f} {lat + h:.4f}, "
+                           f"{lon:.4f} {lat + h:.4f}, {lon:.4f} {lat:.4f}))")
+            start = rng.randint(1950, 2024)
+            end = min(start + int(rng.expovariate(0.2)), 2025)
+            yield {
+                "sentence": self.sentence(),
+                "topics": [self.topic() for _ in range(self.size("topics"))],
+                "spatial": spatial,
+                "spatial_resolution": str(rng.choice((10, 100, 1000, 10000))),
+                "temporal_start": f"{start}-01-01T00:00:00",
+                "temporal_end": f"{end}-12-31T23:59:59",
+                "temporal_resolution": rng.choice(TEMPORAL_RESOLUTIONS),
+                "paper": paper,
+                "citation_type": str(rng.choice(AIDA_CITATION_TYPES)),
+                "chunks": [{
+                    "text": self.words(self.size("chunk_words")),
+                    "page": str(rng.randint(1, 30)),
+                    "section": rng.choice(("Introduction", "Methods", "Results", "Discussion")),
+                    "paragraph": str(rng.randint(1, 12)),
+                    "extraction_type": rng.choice(EXTRACTION_TYPES),
+                } for _ in range(self.size("chunks"))],
+            }
+
+    def _paper_records(self):
+        rng = self.rng
+        number = 0
+        while True:
+            cited = rng.sample(range(self.papers), min(self.size("citations"), self.papers))
+            yield {
+                "paper": doi(number),
+                "title": self.sentence(rng.randint(3, 15), max_length=199)[:-1],
+                "abstract": self.abstract() if rng.random() < 0.8 else None,
+                "date": f"{rng.randint(1950, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "journal": f"https://portal.issn.org/resource/ISSN/{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}"
+                if rng.random() < 0.9 else None,
+                "authors": [self.author() for _ in range(self.size("authors"))],
+                "sections": {name: rng.random() < 0.85 for name in SECTIONS},
+                "goal": self.sentence(rng.randint(5, 30)) if rng.random() < 0.6 else None,
+                "hypothesis": self.sentence(rng.randint(5, 30)) if rng.random() < 0.4 else None,
+                "citations": [{"type": str(rng.choice(PAPER_CITATION_TYPES)), "paper": doi(n)} for n in cited],
+                "fields": [self.topic() for _ in range(self.size("fields"))],
+            }
+            number += 1
+
+    def claim(self, patent: str, position: int, independent: dict = None):
+        """A claim record with its text; dependent claims refer to an earlier independent claim"""
+        rng = self.rng
+        elements, nouns = [], []
+        for _ in range(self.size("claim_elements")):
+            noun = self.words(rng.randint(1, 3))
+            quantity = rng.choices(("a", "at least one", "a plurality of"), (6, 2, 2))[0]
+            if quantity == "a" and noun[0] in "aeiou":
+                quantity = "an"
+            element = f"{quantity} {noun}"
+            if nouns and rng.random() < 0.3:
+                element += f" connected to the {rng.choice(nouns)}"
+            elements.append(element)
+            nouns.append(noun)
+        if independent is None:
+            category = rng.choice(CLAIM_CATEGORIES)
+            article = "An" if category[0] in "aeiou" else "A"
+            preamble = f"{article} {category}"
+            transitional = rng.choices(TRANSITIONAL_PHRASES, TRANSITIONAL_WEIGHTS)[0]
+            text = f"{preamble} {transitional} {claim_description(elements)}"
+            depends_on = None
+        else:
+            category = independent["category"]
+            preamble = f"The {category} of claim {independent['position']}"
+            transitional = "wherein" if rng.random() < 0.7 else "further comprising"
+            text = f"{preamble}, {transitional} {claim_description(elements)}"
+            depends_on = independent["position"]
+        return {"patent": patent, "position": position, "category": category, "preamble": preamble,
+                "transitional": transitional, "elements": elements, "depends_on": depends_on, "text": text}
+
+    def _patent_records(self):
+        rng = self.rng
+        number = 10_000_000
+        while True:
+            patent = f"{PATENT_PREFIX}{number}B2"
+            independent = []
+            for position in range(1, self.size("claims") + 1):
+                parent = rng.choice(independent) if independent and rng.random() < 0.8 else None
+                claim = self.claim(patent, position, parent)
+                if parent is None:
+                    independent.append(claim)
+                yield claim
+            number += 1
+
+    def _rosetta_records(self):
+        rng = self.rng
+        while True:
+            arity = self.size("arity")
+            subject_label = self.words(rng.randint(1, 3))
+            yield {
+                "statement_type": str(ROSETTA[f"StatementClass{rng.randrange(STATEMENT_TYPES)}"]),
+                "label": f"{subject_label} {self.words(rng.randint(3, 12))}"[:200],
+                "subject": self.topic(),
+                "subject_label": subject_label[:100],
+                "objects": [self.topic() for _ in range(arity)],
+                "confidence": f"{rng.random():.2f}" if rng.random() < 0.5 else None,
+                "context": doi(rng.randrange(self.papers)) if rng.random() < 0.5 else None,
+                "negation": "true" if rng.random() < 0.05 else "false",
+                "sources": [doi(rng.randrange(self.papers)) for _ in range(self.size("sources"))],
+                "version": str(rng.randint(1, 5)) if rng.random() < 0.3 else None,
+            }
+
+
+def generate(templates, count: int, seed: int = 0, distributions: dict = None):
+    """Yield `count` records of every template, interleaved like `nanopub_pipeline.py --repeat`"""
+    streams = [WorkloadGenerator(template, seed, distributions, count).records(count) for template in templates]
+    for records in zip(*streams):
+        yield from records
+
+
+def _np_conf(profile: Profile) -> NanopubConf:
+    return NanopubConf(
+        profile=profile,
+        use_test_server=True,
+        add_prov_generated_time=True,
+        add_pubinfo_generated_time=True,
+        attribute_publication_to_profile=True,
+    )
+
+
+def build_paper(record: dict, profile: Profile) -> Nanopub:
+    """Unsigned nanopub filling the scientific paper template with a record"""
+    assertion = Graph()
+    paper = URIRef(record["paper"])
+    assertion.add((paper, RDF.type, FABIO.ResearchPaper))
+    assertion.add((paper, DCTERMS.title, Literal(record["title"])))
+    if record.get("abstract"):
+        assertion.add((paper, DCTERMS.abstract, Literal(record["abstract"])))
+    assertion.add((paper, DCTERMS.date, Literal(record["date"], datatype=XSD.date)))
+    for author in record.get("authors") or ():
+        assertion.add((paper, DCTERMS.creator, URIRef(author["orcid"])))
+        assertion.add((URIRef(author["orcid"]), FOAF.name, Literal(author["name"])))
+    if record.get("journal"):
+        assertion.add((paper, DCTERMS.isPartOf, URIRef(record["journal"])))
+    for name, present in (record.get("sections") or {}).items():
+        if present:
+            assertion.add((paper, DOCO.hasSection, SECTIONS[name]))
+    if record.get("goal"):
+        assertion.add((paper, DEO.hasGoal, Literal(record["goal"])))
+    if record.get("hypothesis"):
+        assertion.add((paper, DEO.hasHypothesis, Literal(record["hypothesis"])))
+    for citation in record.get("citations") or ():
+        assertion.add((paper, URIRef(citation["type"]), URIRef(citation["paper"])))
+    for field in record.get("fields") or ():
+        assertion.add((paper, DCTERMS.subject, URIRef(field)))
+    return Nanopub(conf=_np_conf(profile), assertion=assertion)
+
+
+def build_rosetta(record: dict, profile: Profile) -> Nanopub:
+    """Unsigned nanopub filling the Rosetta statement template with a record"""
+    assertion = Graph()
+    statement = URIRef(BASE + "statement")
+    assertion.add((statement, RDF.type, ROSETTA.RosettaStatement))
+    assertion.add((statement, ROSETTA.hasStatementType, URIRef(record["statement_type"])))
+    if record.get("label"):
+        assertion.add((statement, ROSETTA.hasDynamicLabel, Literal(record["label"])))
+    subject = URIRef(record["subject"])
+    assertion.add((statement, ROSETTA.subject, subject))
+    if record.get("subject_label"):
+        assertion.add((subject, RDFS.label, Literal(record["subject_label"])))
+    positions = [ROSETTA.requiredObjectPosition1, ROSETTA.optionalObjectPosition1,
+                 ROSETTA.optionalObjectPosition2, ROSETTA.optionalObjectPosition3]
+    for position, obj in zip(positions, record["objects"]):
+        assertion.add((statement, position, URIRef(obj)))
+    if record.get("confidence"):
+        assertion.add((statement, ROSETTA.hasConfidenceLevel, Literal(record["confidence"], datatype=XSD.decimal)))
+    if record.get("context"):
+        assertion.add((statement, ROSETTA.hasContext, URIRef(record["context"])))
+    if record.get("negation"):
+        assertion.add((statement, ROSETTA.isNegation, Literal(record["negation"])))
+    for source in record.get("sources") or ():
+        assertion.add((statement, ROSETTA.hasSourceReference, URIRef(source)))
+    if record.get("version"):
+        assertion.add((statement, ROSETTA.hasVersion, Literal(record["version"])))
+        assertion.add((URIRef(BASE + "anchor"), ROSETTA.hasVersion, statement))
+    return Nanopub(conf=_np_conf(profile), assertion=assertion)
+
+
+def build_record(record: dict, profile: Profile):
+    """Unsigned nanopub (or its TriG, for AIDA records) of a generated record"""
+    template = record["template"]
+    if template == "aida":
+        return AidaBatchWriter(None, author=profile.orcid_id).render(record)
+    if template == "paper":
+        return build_paper(record, profile)
+    if template == "patent":
+        return create_patent_claim(record, profile)
+    if template == "rosetta":
+        return build_rosetta(record, profile)
+    raise ValueError(f"Unknown template {template!r}")
+
+
+def main():
+    """Generate a seeded synthetic workload as JSONL, or run it through the nanopub pipeline."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("templates", nargs="*", help=f"templates to generate: {', '.join(TEMPLATES)} (default: all)")
+    parser.add_argument("--count", type=int, default=10_000, help="records per template")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dist", action="append", default=[], metavar="NAME=SPEC",
+                        help=f"override a distribution, e.g. chunks=poisson:8 ({', '.join(DEFAULT_DISTRIBUTIONS)})")
+    parser.add_argument("--output", type=Path, help="JSONL file to write (default: standard output)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="build, sign and store the records with nanopub_pipeline.py instead")
+    parser.add_argument("--output-dir", type=Path, default=Path("signed_nanopubs"), help="with --pipeline")
+    parser.add_argument("--sign-workers", type=int, help="with --pipeline")
+    parser.add_argument("--queue-size", type=int, default=256, help="with --pipeline")
+    args = parser.parse_args()
+    templates = args.templates or list(TEMPLATES)
+    for name in templates:
+        if name not in TEMPLATES:
+            parser.error(f"Unknown template {name!r}, expected one of {', '.join(TEMPLATES)}")
+    try:
+        distributions = parse_distributions(args.dist)
+    except ValueError as e:
+        parser.error(str(e))
+
+    records = generate(templates, args.count, args.seed, distributions)
+    start = time.monotonic()
+    if args.pipeline:
+        from create_aida_template_and_publish import create_memory_profile
+        from nanopub_pipeline import NanopubPipeline
+
+        profile = create_memory_profile(
+            name="Anne Fouilloux",
+            orcid_id="https://orcid.org/0000-0002-1784-2920"
+        )
+        pipeline = NanopubPipeline(
+            build=lambda record: build_record(record, profile),
+            profile=profile,
+            output_dir=args.output_dir,
+            sign_workers=args.sign_workers,
+            queue_size=args.queue_size,
+        )
+        pipeline.run(records, progress_every=10)
+        print(f"\nProcessed in {time.monotonic() - start:.1f}s")
+        print(pipeline.report())
+        return
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        written = 0
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            written += 1
+    finally:
+        if args.output:
+            out.close()
+    if args.output:
+        print(f"✓ Wrote {written} records to {args.output} in {time.monotonic() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Derive new nanopub templates from existing (published) templates, instead of
+copying a create_*_template_and_publish.py script and editing it.
+
+A template nanopub is loaded from a .trig/.nq file or from a .zip/.tar(.gz)
+archive of them and parsed once into an immutable ParsedTemplate (template
+header, placeholders, statements and remaining triples such as property labels).
+Parsed templates are memoized per file, archive member and modification time,
+so deriving hundreds of variants from one base parses it only once.
+
+A TemplateDerivation starts from a parsed template, lets callers add, override
+or remove placeholders and statements, and builds an unsigned Nanopub whose
+provenance links the derived template to its parent with prov:wasDerivedFrom.
+
+    base = load_template("aida_template.trig")
+    derived = TemplateDerivation(base, label="AIDA sentence with depth range")
+    derived.add_placeholder("depth", NT.LiteralPlaceholder, "Depth in meters", datatype=XSD.decimal)
+    derived.add_statement("aida", SCHEMA.depth, "depth", optional=True)
+    derived.remove_placeholder("project")
+    np = derived.build(profile)
+"""
+
+import argparse
+import re
+import tarfile
+import zipfile
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+
+from rdflib import Dataset, Graph, Literal, Namespace, URIRef
+from rdflib.namespace import DCTERMS, FOAF, PROV, RDF, RDFS
+from nanopub import Nanopub, NanopubConf, Profile
+from nanopub.definitions import NP_TEMP_PREFIX
+
+from aida_records import NP, NANOPUB_SUFFIXES
+from ontology_registry import validate_terms
+
+NT = Namespace("https://w3id.org/np/o/ntemplate/")
+NPX = Namespace("http://purl.org/nanopub/x/")
+
+# Derived templates live in the nanopub's own namespace (sub:), which becomes
+# the trusty URI namespace when the nanopub is signed
+DEFAULT_BASE = NP_TEMP_PREFIX + "np#"
+
+STATEMENT_TYPES = {NT.OptionalStatement, NT.RepeatableStatement, NT.GroupedStatement}
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tgz", ".tar.gz")
+
+# keyword arguments of add_placeholder/override_placeholder and the predicates they set
+PLACEHOLDER_PROPERTIES = {
+    "regex": NT.hasRegex,
+    "datatype": NT.hasDatatype,
+    "prefix": NT.hasPrefix,
+    "prefix_label": NT.hasPrefixLabel,
+    "possible_values": NT.possibleValue,
+    "possible_values_from_api": NT.possibleValuesFromApi,
+}
+
+STATEMENT_NAME_RE = re.compile(r"^(.*?)(\d+)$")
+
+
+@dataclass(frozen=True)
+class ParsedTemplate:
+    """Immutable structure of a template; placeholders and statements map local names to (predicate, object) pairs"""
+
+    source: str
+    nanopub_uri: URIRef
+    template_uri: URIRef
+    base: str
+    header: tuple
+    placeholders: dict
+    statements: dict
+    other: tuple
+    namespaces: tuple
+
+    @property
+    def parent_uri(self) -> URIRef:
+        """What a derived template is derived from: the nanopub if it is published, else the template"""
+        if self.nanopub_uri is not None and not str(self.nanopub_uri).startswith(NP_TEMP_PREFIX):
+            return self.nanopub_uri
+        return self.template_uri
+
+
+def _local_name(uri) -> str:
+    return re.split(r"[#/]", str(uri))[-1]
+
+
+def _statement_key(name: str):
+    """Natural order of statement names (st2 before st10)"""
+    match = STATEMENT_NAME_RE.match(name)
+    return (match.group(1), int(match.group(2))) if match else (name, -1)
+
+
+def _read_source(path: Path, member: str = None):
+    """(TriG/N-Quads data, rdflib format, source description) of a file or archive member"""
+    name = path.name.lower()
+    if not name.endswith(ARCHIVE_SUFFIXES):
+        return path.read_bytes(), "nquads" if path.suffix == ".nq" else "trig", str(path)
+
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            names = [n for n in archive.namelist() if n.endswith(NANOPUB_SUFFIXES)]
+            chosen = _choose_member(path, names, member)
+            data = archive.read(chosen)
+    else:
+        with tarfile.open(path) as archive:
+            names = [m.name for m in archive.getmembers() if m.isfile() and m.name.endswith(NANOPUB_SUFFIXES)]
+            chosen = _choose_member(path, names, member)
+            data = archive.extractfile(chosen).read()
+    return data, "nquads" if chosen.endswith(".nq") else "trig", f"{path}:{chosen}"
+
+
+def _choose_member(path: Path, names, member: str = None) -> str:
+    if member is None:
+        if len(names) != 1:
+            raise ValueError(f"{path} contains {len(names)} nanopub files, choose one with `member`")
+        return names[0]
+    for name in names:
+        if name == member or Path(name).name == member or Path(name).stem == member:
+            return name
+    raise ValueError(f"No nanopub file {member!r} in {path}")
+
+
+def parse_template(data, fmt: str = "trig", source: str = "<data>") -> ParsedTemplate:
+    """Parse template nanopub TriG/N-Quads data into a ParsedTemplate"""
+    ds = Dataset(default_union=True)
+    ds.parse(data=data, format=fmt)
+    nanopub_uri = next(ds.subjects(RDF.type, NP.Nanopublication), None)
+    assertion_graph = next(ds.objects(nanopub_uri, NP.hasAssertion), None) if nanopub_uri else None
+    assertion = ds.graph(assertion_graph) if assertion_graph is not None else ds
+
+    template_uri = next(assertion.subjects(RDF.type, NT.AssertionTemplate), None)
+    if template_uri is None:
+        raise ValueError(f"{source} is not an assertion template (no nt:AssertionTemplate)")
+    base = str(template_uri)[:len(str(template_uri)) - len(_local_name(template_uri))]
+
+    statement_uris = set(assertion.objects(template_uri, NT.hasStatement))
+    placeholder_uris = set()
+    for subject, cls in assertion.subject_objects(RDF.type):
+        if cls in NT and cls != NT.AssertionTemplate and cls not in STATEMENT_TYPES and subject not in statement_uris:
+            placeholder_uris.add(subject)
+
+    header = []
+    placeholders = {}
+    statements = {}
+    other = []
+    for s, p, o in assertion:
+        if s == template_uri:
+            if p != NT.hasStatement:
+                header.append((p, o))
+        elif s in statement_uris:
+            statements.setdefault(_local_name(s), []).append((p, o))
+        elif s in placeholder_uris:
+            placeholders.setdefault(_local_name(s), []).append((p, o))
+        else:
+            other.append((s, p, o))
+
+    return ParsedTemplate(
+        source=source,
+        nanopub_uri=nanopub_uri,
+        template_uri=template_uri,
+        base=base,
+        header=tuple(sorted(header)),
+        placeholders=MappingProxyType({name: tuple(sorted(pairs)) for name, pairs in sorted(placeholders.items())}),
+        statements=MappingProxyType({name: tuple(sorted(statements[name]))
+                                     for name in sorted(statements, key=_statement_key)}),
+        other=tuple(sorted(other)),
+        namespaces=tuple((prefix, str(ns)) for prefix, ns in ds.namespaces() if prefix not in ("this", "sub")),
+    )
+
+
+@lru_cache(maxsize=64)
+def _load_template(path: str, member: str, mtime_ns: int) -> ParsedTemplate:
+    data, fmt, source = _read_source(Path(path), member)
+    return parse_template(data, fmt, source)
+
+
+def load_template(path: Path, member: str = None) -> ParsedTemplate:
+    """Load a template from a nanopub file or archive member, parsing each version of a file only once"""
+    path = Path(path).resolve()
+    return _load_template(str(path), member, path.stat().st_mtime_ns)
+
+
+class TemplateDerivation:
+    """Editable copy of a parsed template that builds a derived template nanopub"""
+
+    def __init__(self, parent: ParsedTemplate, base: str = DEFAULT_BASE, label: str = None,
+                 description: str = None, tags=None):
+        self.parent = parent
+        self.base = base
+        # the parent's (predicate, object) tuples are shared, edits replace whole entries
+        self.header = list(parent.header)
+        self.placeholders = dict(parent.placeholders)
+        self.statements = dict(parent.statements)
+        if label is not None:
+            self._set_header(RDFS.label, [Literal(label)])
+        if description is not None:
+            self._set_header(DCTERMS.description, [Literal(description)])
+        if tags is not None:
+            self._set_header(NT.hasTag, [Literal(tag) for tag in tags])
+
+    def _set_header(self, predicate, objects):
+        self.header = [(p, o) for p, o in self.header if p != predicate] + [(predicate, o) for o in objects]
+
+    def _term(self, value):
+        """A placeholder given by its local name, or an RDF term"""
+        if isinstance(value, (URIRef, Literal)):
+            return value
+        if value in self.placeholders:
+            return URIRef(self.parent.base + value)
+        raise KeyError(f"Unknown placeholder {value!r}")
+
+    @staticmethod
+    def _placeholder_pairs(pairs, label=None, **properties):
+        pairs = list(pairs)
+        if label is not None:
+            pairs = [(p, o) for p, o in pairs if p != RDFS.label] + [(RDFS.label, Literal(label))]
+        for key, value in properties.items():
+            if key not in PLACEHOLDER_PROPERTIES:
+                raise TypeError(f"Unknown placeholder property {key!r}")
+            predicate = PLACEHOLDER_PROPERTIES[key]
+            pairs = [(p, o) for p, o in pairs if p != predicate]
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            for v in values:
+                if key == "datatype" or isinstance(v, URIRef):
+                    pairs.append((predicate, URIRef(v)))
+                else:
+                    pairs.append((predicate, Literal(v)))
+        return tuple(pairs)
+
+    def add_placeholder(self, name: str, placeholder_type, label: str, **properties):
+        """Add a placeholder, e.g. add_placeholder("depth", NT.LiteralPlaceholder, "Depth", regex="[0-9]+")"""
+        if name in self.placeholders or name in self.statements:
+            raise ValueError(f"{name!r} already exists in the template")
+        types = placeholder_type if isinstance(placeholder_type, (list, tuple)) else [placeholder_type]
+        self.placeholders[name] = self._placeholder_pairs(
+            [(RDF.type, URIRef(t)) for t in types], label=label, **properties)
+
+    def override_placeholder(self, name: str, placeholder_type=None, label: str = None, **properties):
+        """Replace the type, label or properties of an existing placeholder"""
+        pairs = self.placeholders[name]
+        if placeholder_type is not None:
+            types = placeholder_type if isinstance(placeholder_type, (list, tuple)) else [placeholder_type]
+            pairs = [(p, o) for p, o in pairs if p != RDF.type] + [(RDF.type, URIRef(t)) for t in types]
+        self.placeholders[name] = self._placeholder_pairs(pairs, label=label, **properties)
+
+    def remove_placeholder(self, name: str):
+        """Remove a placeholder and every statement that uses it"""
+        del self.placeholders[name]
+        uri = URIRef(self.parent.base + name)
+        for statement, pairs in list(self.statements.items()):
+            if any(o == uri for p, o in pairs if p in (RDF.subject, RDF.predicate, RDF.object)):
+                del self.statements[statement]
+
+    def _next_statement_name(self):
+        numbers = [_statement_key(name)[1] for name in self.statements if _statement_key(name)[0] == "st"]
+        return f"st{max(numbers, default=-1) + 1}"
+
+    def add_statement(self, subject, predicate, obj, optional: bool = False, repeatable: bool = False,
+                      name: str = None) -> str:
+        """Add a statement; subject and object are placeholder names or RDF terms. Returns its name."""
+        name = name or self._next_statement_name()
+        if name in self.statements or name in self.placeholders:
+            raise ValueError(f"{name!r} already exists in the template")
+        pairs = [(RDF.subject, self._term(subject)), (RDF.predicate, URIRef(predicate)), (RDF.object, self._term(obj))]
+        if optional:
+            pairs.append((RDF.type, NT.OptionalStatement))
+        if repeatable:
+            pairs.append((RDF.type, NT.RepeatableStatement))
+        self.statements[name] = tuple(pairs)
+        return name
+
+    def override_statement(self, name: str, subject=None, predicate=None, obj=None,
+                           optional: bool = None, repeatable: bool = None):
+        """Replace parts of an existing statement; arguments left as None are kept"""
+        pairs = list(self.statements[name])
+        for predicate_, value in ((RDF.subject, subject), (RDF.predicate, predicate), (RDF.object, obj)):
+            if value is not None:
+                value = URIRef(value) if predicate_ == RDF.predicate else self._term(value)
+                pairs = [pair for pair in pairs if pair[0] != predicate_] + [(predicate_, value)]
+        for flag, cls in ((optional, NT.OptionalStatement), (repeatable, NT.RepeatableStatement)):
+            if flag is not None:
+                pairs = [pair for pair in pairs if pair != (RDF.type, cls)] + ([(RDF.type, cls)] if flag else [])
+        self.statements[name] = tuple(pairs)
+
+    def remove_statement(self, name: str):
+        del self.statements[name]
+
+    def _rebase(self, term):
+        if isinstance(term, URIRef) and str(term).startswith(self.parent.base):
+            return URIRef(self.base + str(term)[len(self.parent.base):])
+        return term
+
+    def assertion(self) -> Graph:
+        """The assertion graph of the derived template"""
+        assertion = Graph()
+        for prefix, namespace in self.parent.namespaces:
+            assertion.bind(prefix, namespace)
+        template_uri = self._rebase(self.parent.template_uri)
+        for s, p, o in self.parent.other:
+            assertion.add((self._rebase(s), p, self._rebase(o)))
+        for p, o in self.header:
+            assertion.add((template_uri, p, self._rebase(o)))
+        for name, pairs in self.placeholders.items():
+            for p, o in pairs:
+                assertion.add((URIRef(self.base + name), p, self._rebase(o)))
+        for name, pairs in self.statements.items():
+            statement = URIRef(self.base + name)
+            assertion.add((template_uri, NT.hasStatement, statement))
+            for p, o in pairs:
+                assertion.add((statement, p, self._rebase(o)))
+        return assertion
+
+    def build(self, profile: Profile) -> Nanopub:
+        """Unsigned nanopub of the derived template, attributed to the profile and linked to its parent"""
+        template_uri = self._rebase(self.parent.template_uri)
+        provenance = Graph()
+        provenance.add((template_uri, PROV.wasAttributedTo, URIRef(profile.orcid_id)))
+        provenance.add((template_uri, PROV.wasDerivedFrom, self.parent.parent_uri))
+
+        pubinfo = Graph()
+        pubinfo.add((URIRef(profile.orcid_id), FOAF.name, Literal(profile.name)))
+
+        np_conf = NanopubConf(
+            profile=profile,
+            use_test_server=False,
+            add_prov_generated_time=True,
+            add_pubinfo_generated_time=True,
+            attribute_publication_to_profile=True,
+        )
+        assertion = self.assertion()
+        validate_terms(assertion)
+        np = Nanopub(conf=np_conf, assertion=assertion, provenance=provenance, pubinfo=pubinfo)
+        np.pubinfo.add((np.metadata.sig_uri, NPX["signedBy"], URIRef(profile.orcid_id)))
+        return np
+
+
+def main():
+    """Show the structure of a template, or derive a new template from it."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("template", type=Path, help="template nanopub .trig/.nq file or archive")
+    parser.add_argument("--member", help="file of the archive to load")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("show", help="list the placeholders and statements of the template")
+
+    derive = sub.add_parser("derive", help="write an unsigned derived template")
+    derive.add_argument("--label", help="label of the derived template")
+    derive.add_argument("--remove-placeholder", action="append", default=[], metavar="NAME",
+                        help="remove a placeholder and the statements using it")
+    derive.add_argument("--remove-statement", action="append", default=[], metavar="NAME")
+    derive.add_argument("--optional", action="append", default=[], metavar="STATEMENT",
+                        help="make a statement optional")
+    derive.add_argument("--output", type=Path, default=Path("derived_template.trig"))
+
+    args = parser.parse_args()
+    try:
+        template = load_template(args.template, args.member)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.command == "show":
+        print(f"Template {template.template_uri} ({template.source})")
+        print(f"Placeholders ({len(template.placeholders)}):")
+        for name, pairs in template.placeholders.items():
+            label = next((o for p, o in pairs if p == RDFS.label), "")
+            types = ", ".join(_local_name(o) for p, o in pairs if p == RDF.type)
+            print(f"  {name:<24} {types:<32} {label}")
+        print(f"Statements ({len(template.statements)}):")
+        for name, pairs in template.statements.items():
+            terms = dict(pairs)
+            flags = " ".join(_local_name(o) for p, o in pairs if p == RDF.type)
+            print(f"  {name:<6} {_local_name(terms.get(RDF.subject))} {_local_name(terms.get(RDF.predicate))} "
+                  f"{_local_name(terms.get(RDF.object))} {flags}")
+        return
+
+    from create_aida_template_and_publish import create_memory_profile
+    profile = create_memory_profile(
+        name="Anne Fouilloux",
+        orcid_id="https://orcid.org/0000-0002-1784-2920"
+    )
+    derived = TemplateDerivation(template, label=args.label)
+    for name in args.remove_placeholder:
+        derived.remove_placeholder(name)
+    for name in args.remove_statement:
+        derived.remove_statement(name)
+    for name in args.optional:
+        derived.override_statement(name, optional=True)
+    np = derived.build(profile)
+    np.rdf.serialize(destination=args.output, format="trig")
+    print(f"✓ Derived template with {len(derived.placeholders)} placeholders and "
+          f"{len(derived.statements)} statements written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
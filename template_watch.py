@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Watch template sources and rebuild, re-sign and rewrite only what changed.
+
+Running a create_*_template_and_publish.py script after each edit re-imports
+rdflib and nanopub, generates a fresh key pair and rebuilds everything. This
+daemon imports the libraries and loads the signing key once, then watches:
+
+- the create_*_template_and_publish.py scripts (see TEMPLATE_SCRIPTS); an edited
+  script is re-executed as a fresh module and its template function called
+- derivation specs (*.derive.json), templates derived from a parent template
+  with template_inheritance.py:
+
+    {"parent": "aida_spatiotemporal_template.trig",
+     "label": "AIDA sentence with depth",
+     "remove_placeholders": ["project"],
+     "add_placeholders": [{"name": "depth", "type": "LiteralPlaceholder", "label": "Depth in meters",
+                           "datatype": "http://www.w3.org/2001/XMLSchema#decimal"}],
+     "add_statements": [{"subject": "aida", "predicate": "http://schema.org/depth", "object": "depth",
+                         "optional": true}],
+     "output": "aida_depth_template.trig"}
+
+When a source changes, its template is rebuilt, signed and written (atomically)
+to the output directory, followed by every template derived from it, in order.
+A relative parent is looked up in the output directory. A derivation whose
+parent is not built here is rebuilt when the parent file changes. Changes are
+picked up with inotify on Linux and by polling elsewhere.
+"""
+
+import argparse
+import ctypes
+import importlib.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+from pathlib import Path
+
+from rdflib import URIRef
+from nanopub import Profile
+
+from key_pool import AuthorKey, KeyPool, sign_nanopub, stamp_author, use_fast_metadata
+from template_inheritance import NT, TemplateDerivation, load_template
+
+# script -> (template function, output file), as written by the script's main()
+TEMPLATE_SCRIPTS = {
+    "create_aida_template_and_publish.py":
+        (lambda module: module.create_aida_spatiotemporal_template(), "aida_spatiotemporal_template.trig"),
+    "create_paper_template_and_publish.py":
+        (lambda module: module.create_scientific_paper_template(), "scientific_paper_template.trig"),
+    "create_rosetta_template_and_publish.py":
+        (lambda module: module.create_rosetta_statement_template(), "rosetta_statement_template.trig"),
+    "create_patent_claim_template_and_publish.py":
+        (lambda module: module.create_patent_claim(module.EXAMPLE_CLAIM, module.create_memory_profile(
+            name="Anne Fouilloux", orcid_id="https://orcid.org/0000-0002-1784-2920")),
+         "patent_claim_template.trig"),
+}
+SPEC_SUFFIX = ".derive.json"
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+EVENT = struct.Struct("iIII")
+
+
+def is_source(path: Path) -> bool:
+    return path.name in TEMPLATE_SCRIPTS or path.name.endswith(SPEC_SUFFIX)
+
+
+class Target:
+    """A template built from a script or a derivation spec"""
+
+    def __init__(self, source: Path, output_dir: Path):
+        self.source = source
+        self.spec = None
+        self.parent = None
+        if source.name in TEMPLATE_SCRIPTS:
+            self.output = output_dir / TEMPLATE_SCRIPTS[source.name][1]
+        else:
+            self.load_spec(output_dir)
+
+    def load_spec(self, output_dir: Path):
+        with open(self.source, encoding="utf-8") as f:
+            self.spec = json.load(f)
+        if "parent" not in self.spec:
+            raise ValueError(f"{self.source} has no parent template")
+        # relative parents are in the output directory, next to the templates built here
+        self.parent = (output_dir / self.spec["parent"]).resolve()
+        self.output = output_dir / self.spec.get("output", self.source.name[:-len(SPEC_SUFFIX)] + ".trig")
+
+    def build(self, profile: Profile):
+        """Unsigned nanopub of the template"""
+        if self.spec is None:
+            spec = importlib.util.spec_from_file_location(f"_watched_{self.source.stem}", self.source)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            # the scripts create a profile (and a new key pair) for every template, use the loaded one
+            module.create_memory_profile = lambda name, orcid_id: profile
+            np = TEMPLATE_SCRIPTS[self.source.name][0](module)
+            if np is None:
+                raise ValueError(f"{self.source.name} did not return a template")
+            return np
+        return derive(self.spec, self.parent).build(profile)
+
+
+def _uri_or_name(value):
+    return URIRef(value) if ":" in value else value
+
+
+def derive(spec: dict, parent: Path) -> TemplateDerivation:
+    """TemplateDerivation of a derivation spec"""
+    derived = TemplateDerivation(load_template(parent, spec.get("member")), label=spec.get("label"),
+                                 description=spec.get("description"), tags=spec.get("tags"))
+    for name in spec.get("remove_statements", []):
+        derived.remove_statement(name)
+    for name in spec.get("remove_placeholders", []):
+        derived.remove_placeholder(name)
+    for placeholder in spec.get("add_placeholders", []):
+        properties = dict(placeholder)
+        name, kind, label = properties.pop("name"), properties.pop("type"), properties.pop("label")
+        derived.add_placeholder(name, URIRef(kind) if ":" in kind else NT[kind], label, **properties)
+    for statement in spec.get("add_statements", []):
+        derived.add_statement(_uri_or_name(statement["subject"]), URIRef(statement["predicate"]),
+                              _uri_or_name(statement["object"]), optional=statement.get("optional", False),
+                              repeatable=statement.get("repeatable", False), name=statement.get("name"))
+    for name in spec.get("optional", []):
+        derived.override_statement(name, optional=True)
+    return derived
+
+
+class Inotify:
+    """Minimal inotify(7) binding: watch directories, read the names of changed files"""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+
+    def add(self, directory: Path):
+        if directory in self.directories.values():
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                                         IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+        self.directories[wd] = directory
+
+    def read(self, timeout: float = None):
+        """Paths changed within `timeout` seconds (empty if none)"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        data = os.read(self.fd, 65536)
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            wd, _, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+            offset += EVENT.size + length
+            if wd in self.directories and name:
+                paths.add(self.directories[wd] / os.fsdecode(name))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Poller:
+    """Polling fallback: modification times of every file in the watched directories"""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.directories = []
+        self.mtimes = {}
+
+    def _scan(self):
+        mtimes = {}
+        for directory in self.directories:
+            for entry in os.scandir(directory):
+                if entry.is_file():
+                    mtimes[Path(entry.path)] = entry.stat().st_mtime_ns
+        return mtimes
+
+    def add(self, directory: Path):
+        if directory not in self.directories:
+            self.directories.append(directory)
+            self.mtimes = self._scan()
+
+    def read(self, timeout: float = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            mtimes = self._scan()
+            changed = {path for path in mtimes.keys() | self.mtimes.keys()
+                       if mtimes.get(path) != self.mtimes.get(path)}
+            self.mtimes = mtimes
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class TemplateWatcher:
+    """Targets by source, with the derivations of each template rebuilt after it"""
+
+    def __init__(self, profile: Profile, key: AuthorKey, output_dir: Path, watcher=None):
+        self.profile = profile
+        self.key = key
+        self.output_dir = output_dir.resolve()
+        self.watcher = watcher
+        self.targets = {}
+
+    def add(self, source: Path):
+        source = source.resolve()
+        try:
+            target = self.targets[source] = Target(source, self.output_dir)
+        except (OSError, ValueError) as e:
+            self.targets.pop(source, None)
+            print(f"✗ {source.name}: {e}")
+            return
+        if self.watcher is not None:
+            self.watcher.add(source.parent)
+            if target.parent is not None and target.parent.parent.exists():
+                self.watcher.add(target.parent.parent)
+
+    def dependents(self, roots):
+        """`roots` and every template derived from them, each after the template it derives from"""
+        outputs = {target.output: target for target in self.targets.values()}
+        children = {}
+        for target in self.targets.values():
+            children.setdefault(target.parent, []).append(target)
+        affected = {}
+        stack = list(roots)
+        while stack:
+            target = stack.pop()
+            if target.source not in affected:
+                affected[target.source] = target
+                stack.extend(children.get(target.output, []))
+
+        order = []
+        placed = set()
+
+        def place(target):
+            if target.source in placed:
+                return
+            placed.add(target.source)
+            parent = outputs.get(target.parent)
+            if parent is not None and parent.source in affected:
+                place(parent)
+            order.append(target)
+
+        for target in affected.values():
+            place(target)
+        return order
+
+    def changed(self, paths):
+        """Targets affected by changed files (new sources are added, deleted ones dropped)"""
+        outputs = {target.output for target in self.targets.values()}
+        roots = []
+        for path in paths:
+            path = path.resolve()
+            if path in outputs:
+                continue  # written by us, dependents are rebuilt with it
+            if is_source(path):
+                if not path.exists():
+                    self.targets.pop(path, None)
+                    continue
+                self.add(path)
+                if path in self.targets:
+                    roots.append(self.targets[path])
+            roots.extend(target for target in self.targets.values() if target.parent == path)
+        return self.dependents(roots)
+
+    def rebuild(self, targets):
+        failed = set()
+        for target in targets:
+            if target.parent in failed:
+                print(f"✗ {target.output.name} skipped, its parent failed")
+                failed.add(target.output)
+                continue
+            start = time.monotonic()
+            try:
+                np = target.build(self.profile)
+                stamp_author(np, self.key)
+                sign_nanopub(np, self.key)
+                tmp = target.output.with_name(f".{target.output.name}.tmp")
+                np.rdf.serialize(destination=tmp, format="trig")
+                os.replace(tmp, target.output)
+            except Exception as e:
+                failed.add(target.output)
+                print(f"✗ {target.source.name}: {type(e).__name__}: {e}")
+                traceback.print_exc(limit=-3)
+                continue
+            print(f"✓ {target.output.name} {np.source_uri} ({time.monotonic() - start:.2f}s)")
+
+    def run(self, debounce: float = 0.05):
+        print(f"Watching {len(self.targets)} templates, Ctrl-C to stop")
+        while True:
+            paths = self.watcher.read()
+            # editors write a file in several steps
+            while True:
+                more = self.watcher.read(debounce)
+                if not more:
+                    break
+                paths |= more
+            self.rebuild(self.changed(paths))
+
+
+def load_key(key_pool: Path = None, author: str = None):
+    """(profile, key) to sign with: an author of the key pool, or a key pair generated once"""
+    if key_pool is None:
+        profile = Profile(name="Anne Fouilloux", orcid_id=author or "https://orcid.org/0000-0002-1784-2920")
+        return profile, AuthorKey(profile)
+    pool = KeyPool(key_pool)
+    if author is None:
+        if len(pool) != 1:
+            raise ValueError(f"{key_pool} has {len(pool)} authors, choose one with --author")
+        author = next(iter(pool.entries))
+    key = pool.get(author)
+    return key.profile, key
+
+
+def main():
+    """Watch template sources and rebuild, re-sign and rewrite only what changed."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sources", nargs="*", type=Path, default=[Path(".")],
+                        help="template scripts, *.derive.json specs or directories of them (default: .)")
+    parser.add_argument("--output-dir", type=Path, default=Path("."))
+    parser.add_argument("--key-pool", type=Path, help="sign with a key of this key pool (see key_pool.py)")
+    parser.add_argument("--author", help="ORCID to sign as (required if the key pool has several authors)")
+    parser.add_argument("--once", action="store_true", help="build every template once and exit")
+    parser.add_argument("--poll", action="store_true", help="poll for changes instead of using inotify")
+    parser.add_argument("--interval", type=float, default=0.2, help="polling interval in seconds")
+    args = parser.parse_args()
+    use_fast_metadata()
+
+    try:
+        profile, key = load_key(args.key_pool, args.author)
+    except (KeyError, ValueError) as e:
+        parser.error(str(e))
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    watcher = None
+    if not args.once:
+        if args.poll or not sys.platform.startswith("linux"):
+            watcher = Poller(args.interval)
+        else:
+            watcher = Inotify()
+    daemon = TemplateWatcher(profile, key, args.output_dir, watcher)
+    for source in args.sources:
+        if source.is_dir():
+            if watcher is not None:
+                watcher.add(source.resolve())
+            for path in sorted(source.iterdir()):
+                if is_source(path):
+                    daemon.add(path)
+        else:
+            daemon.add(source)
+
+    daemon.rebuild(daemon.dependents(list(daemon.targets.values())))
+    if args.once:
+        return
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Offline prefix search over Wikidata labels, for the topic placeholder of the AIDA template.
+
+The topic placeholder of the AIDA template gets its values from the Wikidata
+wbsearchentities API, which costs a network round trip per lookup and does not
+work offline. This module builds a single memory-mapped file from a local
+labels dump instead:
+
+- a Wikidata JSON dump (.json, .json.gz or .json.bz2, one entity per line):
+  labels and aliases in one language, ranked by number of sitelinks;
+- or a TSV file (optionally .gz or .bz2) of `id<TAB>label[<TAB>score]` lines,
+  where repeated IDs add aliases and the first label of an ID is its display label.
+
+Labels are normalized (NFKC, case-folded, single spaces) and stored as a sorted
+array of UTF-8 keys with their entity and rank (a smaller rank is a better
+match: higher score, then shorter label). A prefix is looked up by binary search
+over the mapped arrays. For every prefix that matches more than `threshold`
+keys, the top-k entities are precomputed at build time, so common short
+prefixes never scan their range; rarer prefixes scan at most `threshold` keys.
+Either way a lookup takes well under a millisecond and only touches the pages
+it reads, so the index can be much larger than memory.
+
+`serve` answers wbsearchentities-style requests on a local port, so the
+template's API URL can be pointed at it, and aida_batch.py can resolve topics
+given as labels with --topics.
+"""
+
+import argparse
+import bz2
+import gzip
+import heapq
+import json
+import mmap
+import re
+import struct
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+MAGIC = b"NPTOPIC1"
+# magic, then counts (keys, entities, precomputed prefixes, k, threshold) and section offsets
+HEADER = struct.Struct("<8s5Q9Q")
+ENTITY_IRI = "http://www.wikidata.org/entity/"
+TOP_K = 10
+THRESHOLD = 256
+NO_ENTITY = 0xFFFFFFFF
+# no UTF-8 sequence contains 0xff, so prefix + UPPER sorts after every key starting with prefix
+UPPER = b"\xff"
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize(label: str) -> str:
+    return WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", label).casefold()).strip()
+
+
+def _open_text(path: Path):
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.suffix == ".bz2":
+        return bz2.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def read_labels(path: Path, language: str = "en"):
+    """Yield (id, label, score, is_alias) from a Wikidata JSON dump or an id/label[/score] TSV file"""
+    is_json = ".json" in Path(path).suffixes
+    with _open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or line in ("[", "]"):
+                continue
+            if is_json:
+                entity = json.loads(line.rstrip(","))
+                score = len(entity.get("sitelinks") or ())
+                label = (entity.get("labels") or {}).get(language)
+                if label:
+                    yield entity["id"], label["value"], score, False
+                for alias in (entity.get("aliases") or {}).get(language, ()):
+                    yield entity["id"], alias["value"], score, True
+            else:
+                fields = line.split("\t")
+                if len(fields) < 2:
+                    continue
+                score = int(fields[2]) if len(fields) > 2 and fields[2].isdigit() else 0
+                yield fields[0], fields[1], score, None
+
+
+def _top_entities(lo: int, hi: int, ranks, entities, k: int):
+    """The `k` best distinct entities among the keys lo..hi"""
+    candidates = heapq.nsmallest(4 * k, range(lo, hi), key=ranks.__getitem__)
+    if hi - lo > 4 * k and len({entities[i] for i in candidates}) < k:
+        candidates = sorted(range(lo, hi), key=ranks.__getitem__)
+    top = []
+    for i in candidates:
+        if entities[i] not in top:
+            top.append(entities[i])
+            if len(top) == k:
+                break
+    return top
+
+
+def _padded(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 8)
+
+
+def build_topic_index(sources, output: Path, language: str = "en", k: int = TOP_K, threshold: int = THRESHOLD):
+    """Build the index file from label dumps or TSV files; return the number of keys and entities"""
+    ids, labels, scores, index_of = [], [], [], {}
+    pairs = set()
+    for source in sources:
+        for entity_id, label, score, is_alias in read_labels(source, language):
+            entity = index_of.get(entity_id)
+            if entity is None:
+                entity = index_of[entity_id] = len(ids)
+                ids.append(entity_id)
+                labels.append(label)
+                scores.append(score)
+            else:
+                scores[entity] = max(scores[entity], score)
+                if is_alias is False:
+                    labels[entity] = label
+            key = normalize(label)
+            if key:
+                pairs.add((key.encode("utf-8"), entity))
+    del index_of
+
+    entries = sorted(pairs)
+    del pairs
+    keys = [key for key, _ in entries]
+    key_entities = array("I", (entity for _, entity in entries))
+    del entries
+    by_rank = sorted(range(len(keys)), key=lambda i: (-scores[key_entities[i]], len(keys[i]), key_entities[i]))
+    ranks = array("I", bytes(4 * len(keys)))
+    for rank, i in enumerate(by_rank):
+        ranks[i] = rank
+    del by_rank
+
+    # precompute the top entities of every prefix matching more than `threshold` keys;
+    # a prefix can only match that many if its one-byte-shorter parent does
+    precomputed = []
+    stack = [(b"", 0, len(keys))]
+    while stack:
+        prefix, lo, hi = stack.pop()
+        if hi - lo <= threshold:
+            continue
+        precomputed.append((prefix, _top_entities(lo, hi, ranks, key_entities, k)))
+        depth = len(prefix)
+        while lo < hi and len(keys[lo]) == depth:
+            lo += 1
+        while lo < hi:
+            child = keys[lo][:depth + 1]
+            end = bisect_left(keys, child + UPPER, lo, hi)
+            stack.append((child, lo, end))
+            lo = end
+    precomputed.sort()
+
+    key_offsets = array("Q", [0])
+    for key in keys:
+        key_offsets.append(key_offsets[-1] + len(key))
+    entity_blobs = [f"{entity_id}\t{label}".encode("utf-8") for entity_id, label in zip(ids, labels)]
+    entity_offsets = array("Q", [0])
+    for blob in entity_blobs:
+        entity_offsets.append(entity_offsets[-1] + len(blob))
+    prefix_offsets = array("Q", [0])
+    for prefix, _ in precomputed:
+        prefix_offsets.append(prefix_offsets[-1] + len(prefix))
+    top = array("I")
+    for _, entities in precomputed:
+        top.extend(entities + [NO_ENTITY] * (k - len(entities)))
+
+    sections = [
+        key_offsets.tobytes(), b"".join(keys), key_entities.tobytes(), ranks.tobytes(),
+        entity_offsets.tobytes(), b"".join(entity_blobs),
+        prefix_offsets.tobytes(), b"".join(prefix for prefix, _ in precomputed), top.tobytes(),
+    ]
+    offsets, position = [], HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position += len(_padded(section))
+
+    output = Path(output)
+    tmp = output.with_name(output.name + ".part")
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(keys), len(ids), len(precomputed), k, threshold, *offsets))
+        for section in sections:
+            f.write(_padded(section))
+    tmp.replace(output)
+    return {"keys": len(keys), "entities": len(ids), "precomputed": len(precomputed)}
+
+
+class _Strings:
+    """Read-only sequence of the byte strings of a blob section, for bisect"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+
+class TopicIndex:
+    """Memory-mapped topic index built by build_topic_index()"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, n_keys, n_entities, n_prefixes, self.k, self.threshold, *offsets = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a topic index")
+        key_offsets, key_blob, key_entities, ranks, entity_offsets, entity_blob, \
+            prefix_offsets, prefix_blob, top = offsets
+        self.keys = _Strings(view[key_offsets:key_offsets + 8 * (n_keys + 1)].cast("Q"), view[key_blob:])
+        self.key_entities = view[key_entities:key_entities + 4 * n_keys].cast("I")
+        self.ranks = view[ranks:ranks + 4 * n_keys].cast("I")
+        self.entities = _Strings(view[entity_offsets:entity_offsets + 8 * (n_entities + 1)].cast("Q"),
+                                 view[entity_blob:])
+        self.prefixes = _Strings(view[prefix_offsets:prefix_offsets + 8 * (n_prefixes + 1)].cast("Q"),
+                                 view[prefix_blob:])
+        self.top = view[top:top + 4 * n_prefixes * self.k].cast("I")
+        self._views = [view, self.keys.offsets, self.keys.blob, self.key_entities, self.ranks,
+                       self.entities.offsets, self.entities.blob, self.prefixes.offsets, self.prefixes.blob, self.top]
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.entities)
+
+    def entity(self, index: int):
+        """(id, label) of an entity"""
+        entity_id, label = self.entities[index].decode("utf-8").split("\t", 1)
+        return entity_id, label
+
+    def _range(self, key: bytes):
+        lo = bisect_left(self.keys, key)
+        return lo, bisect_left(self.keys, key + UPPER, lo)
+
+    def complete(self, prefix: str, limit: int = TOP_K):
+        """The best `limit` entities with a label or alias starting with `prefix`, as (id, label)"""
+        key = normalize(prefix).encode("utf-8")
+        if limit <= self.k:
+            i = bisect_left(self.prefixes, key)
+            if i < len(self.prefixes) and self.prefixes[i] == key:
+                top = self.top[i * self.k:(i + 1) * self.k]
+                return [self.entity(e) for e in top[:limit] if e != NO_ENTITY]
+        lo, hi = self._range(key)
+        return [self.entity(e) for e in _top_entities(lo, hi, self.ranks, self.key_entities, limit)]
+
+    def lookup(self, label: str):
+        """(id, label) of the best entity with exactly this label or alias, or None"""
+        key = normalize(label).encode("utf-8")
+        # keys equal to the label sort first in its prefix range
+        exact = []
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key:
+            exact.append(i)
+            i += 1
+        if not exact:
+            return None
+        return self.entity(self.key_entities[min(exact, key=self.ranks.__getitem__)])
+
+    def resolve(self, topic: str) -> str:
+        """Topic IRI for a topic given as an IRI, a Wikidata ID or a label; raises KeyError if unknown"""
+        if ":" in topic:
+            return topic
+        if re.fullmatch(r"[QP]\d+", topic):
+            return ENTITY_IRI + topic
+        found = self.lookup(topic) or next(iter(self.complete(topic, 1)), None)
+        if found is None:
+            raise KeyError(f"No topic matches {topic!r}")
+        return ENTITY_IRI + found[0]
+
+
+def serve_topics(index: TopicIndex, port: int = 8765, host: str = "127.0.0.1"):
+    """
+    Answer wbsearchentities-style requests (?search=...&limit=...) on
+    http://host:port/w/api.php from a daemon thread, return the server.
+    """
+
+    class TopicHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path not in ("/", "/w/api.php"):
+                self.send_error(404)
+                return
+            params = parse_qs(url.query)
+            search = params.get("search", [""])[0]
+            limit = int(params.get("limit", [TOP_K])[0])
+            results = [
+                {"id": entity_id, "label": label, "concepturi": ENTITY_IRI + entity_id, "match": {"text": label}}
+                for entity_id, label in index.complete(search, limit)
+            ]
+            body = json.dumps({"searchinfo": {"search": search}, "search": results, "success": 1}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), TopicHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="topics-http", daemon=True).start()
+    return server
+
+
+def main():
+    """Build, query or serve the offline topic autocompletion index from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("index", type=Path, help="index file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="build the index from Wikidata JSON dumps or id/label TSV files")
+    build.add_argument("sources", nargs="+", type=Path)
+    build.add_argument("--language", default="en", help="label language of a JSON dump")
+    build.add_argument("--top-k", type=int, default=TOP_K, help="results precomputed per common prefix")
+    build.add_argument("--threshold", type=int, default=THRESHOLD,
+                       help="prefixes matching more labels than this get precomputed results")
+
+    query = sub.add_parser("query", help="complete a prefix")
+    query.add_argument("prefix")
+    query.add_argument("--limit", type=int, default=TOP_K)
+
+    serve = sub.add_parser("serve", help="answer wbsearchentities-style requests until interrupted")
+    serve.add_argument("--port", type=int, default=8765)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.monotonic()
+        stats = build_topic_index(args.sources, args.index, args.language, args.top_k, args.threshold)
+        print(f"✓ Indexed {stats['keys']} labels of {stats['entities']} entities in {time.monotonic() - start:.1f}s "
+              f"({stats['precomputed']} precomputed prefixes) to {args.index}")
+        return
+
+    with TopicIndex(args.index) as index:
+        if args.command == "query":
+            start = time.perf_counter()
+            results = index.complete(args.prefix, args.limit)
+            elapsed = (time.perf_counter() - start) * 1000
+            for entity_id, label in results:
+                print(f"{entity_id}\t{label}")
+            print(f"{len(results)} topics ({elapsed:.3f} ms)")
+            return
+        server = serve_topics(index, args.port)
+        print(f"✓ Serving {len(index)} topics on http://127.0.0.1:{args.port}/w/api.php?search=")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()